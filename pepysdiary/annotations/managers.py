@@ -1,4 +1,9 @@
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+
 from django.contrib.sites.models import Site
+from django.db.models import Q
 from django_comments.managers import CommentManager
 
 
@@ -25,3 +30,37 @@ class VisibleAnnotationManager(AnnotationManager):
             .get_queryset()
             .filter(site=Site.objects.get_current(), is_public=True, is_removed=False)
         )
+
+    def latest_for_objects(self, objects):
+        """
+        Passed an iterable of (content_type_id, object_pk) tuples, returns a
+        dict mapping each of those tuples to the latest visible Annotation on
+        that object. The object_pks in the keys are strings, as in the
+        Annotations. Objects with no visible Annotations are left out.
+
+        Makes one query, using DISTINCT ON, however many objects and content
+        types there are.
+        """
+        pks_by_content_type = defaultdict(list)
+        for content_type_id, object_pk in objects:
+            pks_by_content_type[content_type_id].append(str(object_pk))
+        if not pks_by_content_type:
+            return {}
+
+        annotations = (
+            self.get_queryset()
+            .filter(
+                reduce(
+                    or_,
+                    (
+                        Q(content_type_id=content_type_id, object_pk__in=pks)
+                        for content_type_id, pks in pks_by_content_type.items()
+                    ),
+                )
+            )
+            .select_related(None)
+            .defer("search_document")
+            .order_by("content_type_id", "object_pk", "-submit_date")
+            .distinct("content_type_id", "object_pk")
+        )
+        return {(a.content_type_id, a.object_pk): a for a in annotations}
@@ -3,14 +3,28 @@ from django.contrib.contenttypes.models import ContentType
 from django.contrib.postgres.indexes import GinIndex
 from django.contrib.postgres.search import SearchVectorField
 from django.core.exceptions import ObjectDoesNotExist
-from django.db.models import Max
+from django.db.models import (
+    Case,
+    Count,
+    DateTimeField,
+    F,
+    IntegerField,
+    Max,
+    Subquery,
+    Value,
+    When,
+)
+from django.db.models.functions import Coalesce
 from django.utils.html import strip_tags
 from django_comments.abstracts import CommentAbstractModel
 
+from pepysdiary.common.caching import make_cache_tag
+from pepysdiary.common.models import CacheTagsMixin, SearchDocumentMixin
+
 from .managers import AnnotationManager, VisibleAnnotationManager
 
 
-class Annotation(CommentAbstractModel):
+class Annotation(SearchDocumentMixin, CacheTagsMixin, CommentAbstractModel):
     """
     Fields inherited from CommentAbstractModel:
 
@@ -29,12 +43,30 @@ class Annotation(CommentAbstractModel):
     is_removed - BooleanField (comment is inappropriate; displays "has been removed")
     """
 
-    # Also see index_components() method.
+    # The fields, and their weights, used to make the search_document.
+    # See SearchDocumentMixin.
+    search_fields = (("comment", "A"),)
     search_document = SearchVectorField(null=True)
 
     objects = AnnotationManager()
     visible_objects = VisibleAnnotationManager()
 
+    # The fields whose values affect the parent object's comment_count and
+    # last_comment_time. If none of them change when we save an Annotation
+    # we don't need to update the parent object.
+    parent_data_fields = (
+        "content_type_id",
+        "object_pk",
+        "site_id",
+        "is_public",
+        "is_removed",
+        "submit_date",
+    )
+
+    # The values of parent_data_fields when this object was loaded or last
+    # saved. None if we don't know them.
+    _parent_data_state = None
+
     class Meta:
         ordering = ("submit_date",)
         permissions = [("can_moderate", "Can moderate comments")]
@@ -42,14 +74,60 @@ class Annotation(CommentAbstractModel):
         verbose_name_plural = "annotations"
         indexes = [GinIndex(fields=["search_document"])]
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._parent_data_state = instance._get_parent_data_state()
+        return instance
+
     def save(self, *args, **kwargs):
         # We don't allow HTML at all:
         self.comment = strip_tags(self.comment)
 
+        created = self._state.adding
+        previous_state = self._parent_data_state
+
         super().save(*args, **kwargs)
-        self.set_parent_comment_data()
+
+        if created:
+            self.set_parent_comment_data(created=True)
+        elif previous_state != self._get_parent_data_state():
+            self.set_parent_comment_data()
+            if previous_state is not None and previous_state[:2] != (
+                self.content_type_id,
+                self.object_pk,
+            ):
+                # The Annotation has moved to a different object, so the
+                # object it used to be on needs its data re-setting too.
+                self._recalculate_comment_data(
+                    self._get_parent_queryset(*previous_state[:2]),
+                    *previous_state[:3],
+                )
+
+        self._parent_data_state = self._get_parent_data_state()
         self._set_user_first_comment_date()
 
+    def get_cache_tags(self):
+        """
+        Changing an Annotation only affects the cached views that show the
+        comments on the object it's on, or their number (see the object's
+        get_comment_cache_tags()), and the pages that depend on the tag for
+        all Annotations, like Recent Activity.
+
+        Not all of the parent's tags (e.g. for all Entries, or the Topics an
+        Entry refers to), so a new comment doesn't expire all those pages.
+        """
+        tags = {make_cache_tag(Annotation)}
+        parent = self.content_object
+        if isinstance(parent, CacheTagsMixin):
+            tags |= parent.get_comment_cache_tags()
+        return tags
+
+    @property
+    def is_visible(self):
+        "Is this Annotation publicly visible on the site?"
+        return self.is_public is True and self.is_removed is False
+
     @property
     def reading(self):
         """
@@ -63,12 +141,6 @@ class Annotation(CommentAbstractModel):
             reading -= 1
         return reading
 
-    def index_components(self):
-        """Used by common.signals.on_save() to update the SearchVector on
-        self.search_document.
-        """
-        return ((self.comment, "A"),)
-
     def get_user_name(self):
         """
         Now:
@@ -104,7 +176,7 @@ class Annotation(CommentAbstractModel):
         else:
             return self.user_url
 
-    def set_parent_comment_data(self):
+    def set_parent_comment_data(self, *, created=False):
         """
         We store the comment_count for each object that can have comments.
         So here we set the comment_count after we save each comment.
@@ -113,62 +185,101 @@ class Annotation(CommentAbstractModel):
 
         We also have to ensure the parent object's last_comment_time is
         still accurate.
+
+        We only ever UPDATE those two fields on the parent object, rather
+        than calling its save() method, so that we don't re-render its
+        Markdown, re-index it for searching, etc.
+
+        If created is True, this Annotation has just been added, so if it's
+        visible we can simply increment the parent's count. Otherwise we
+        recalculate both values from the parent's visible Annotations.
         """
+        parents = self._get_parent_queryset(self.content_type_id, self.object_pk)
 
-        # Make sure the content_type and object for this Annotation exist.
+        if created:
+            if not self.is_visible:
+                # Nothing about the parent's visible comments has changed.
+                return
+            num_updated = parents.update(
+                comment_count=F("comment_count") + 1,
+                last_comment_time=Case(
+                    When(
+                        last_comment_time__gt=self.submit_date,
+                        then=F("last_comment_time"),
+                    ),
+                    default=Value(self.submit_date),
+                    output_field=DateTimeField(),
+                ),
+            )
+        else:
+            num_updated = self._recalculate_comment_data(
+                parents, self.content_type_id, self.object_pk, self.site_id
+            )
+
+        if num_updated == 0:
+            msg = (
+                f"Content type {self.content_type_id} object "
+                f"{self.object_pk} doesn't exist"
+            )
+            raise AttributeError(msg)
+
+    def _get_parent_queryset(self, content_type_id, object_pk):
+        """
+        Returns a QuerySet containing only the object with this content type
+        and pk, the object an Annotation is posted on.
+        """
+        # Make sure the content_type for this Annotation exists.
         # This is adapted from django.contrib.contenttypes.views.shortcut().
         try:
-            content_type = ContentType.objects.get(pk=self.content_type_id)
-            if not content_type.model_class():
-                msg = (
-                    f"Content type {self.content_type_id} object "
-                    "has no associated model"
-                )
+            content_type = ContentType.objects.get_for_id(content_type_id)
+            model_class = content_type.model_class()
+            if not model_class:
+                msg = f"Content type {content_type_id} object has no associated model"
                 raise AttributeError(msg)
-            obj = content_type.get_object_for_this_type(pk=self.object_pk)
+            return model_class._base_manager.filter(pk=object_pk)
         except (ObjectDoesNotExist, ValueError) as err:
-            msg = (
-                f"Content type {self.content_type_id} object "
-                f"{self.object.pk} doesn't exist"
-            )
+            msg = f"Content type {content_type_id} object {object_pk} doesn't exist"
             raise AttributeError(msg) from err
 
-        # All good. So set the count of visible comments.
+    def _recalculate_comment_data(self, parents, content_type_id, object_pk, site_id):
+        """
+        Sets the comment_count and last_comment_time on the objects in the
+        parents QuerySet, based on the visible Annotations with the
+        supplied content_type_id, object_pk and site_id.
+        Does it in a single UPDATE query. Returns the number of rows updated.
+        """
         # Note: We explicitly remove any ordering because we don't need it
         # and it should speed things up.
-        qs = Annotation.objects.filter(
-            content_type__pk=self.content_type_id,
-            object_pk=self.object_pk,
-            site=self.site,
+        visible = Annotation.objects.filter(
+            content_type_id=content_type_id,
+            object_pk=object_pk,
+            site_id=site_id,
             is_public=True,
             is_removed=False,
         ).order_by()
-        obj.comment_count = qs.count()
 
-        # We also need to set the last_comment_time on the object.
-        if obj.comment_count == 0:
-            # No comments (this comment must be invisible).
-            # So make sure the comment time is None.
-            obj.last_comment_time = None
-        else:
-            # There are some comments on this object...
-            if (
-                self.is_public is True
-                and self.is_removed is False
-                and (
-                    obj.last_comment_time is None
-                    or self.submit_date > obj.last_comment_time
-                )
-            ):
-                # This is the most recent public comment, so:
-                obj.last_comment_time = self.submit_date
-            else:
-                # This isn't the most recent public comment, so:
-                obj.last_comment_time = qs.aggregate(Max("submit_date"))[
-                    "submit_date__max"
-                ]
-
-        obj.save()
+        return parents.update(
+            comment_count=Coalesce(
+                Subquery(
+                    visible.values("object_pk").annotate(num=Count("pk")).values("num"),
+                    output_field=IntegerField(),
+                ),
+                Value(0),
+            ),
+            last_comment_time=Subquery(
+                visible.values("object_pk")
+                .annotate(latest=Max("submit_date"))
+                .values("latest"),
+                output_field=DateTimeField(),
+            ),
+        )
+
+    def _get_parent_data_state(self):
+        """
+        The current values of the fields in parent_data_fields.
+        Uses __dict__ so that we don't fetch any deferred fields.
+        """
+        return tuple(self.__dict__.get(field) for field in self.parent_data_fields)
 
     def _set_user_first_comment_date(self):
         """
@@ -1,20 +1,54 @@
+from django.db import transaction
 from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django_comments.signals import comment_was_posted
 
+from pepysdiary.common import recent_activity
+
 from .models import Annotation
 from .spam_checker import test_comment_for_spam
 
 
-@receiver(post_save, sender=Annotation)
 @receiver(post_delete, sender=Annotation)
 def post_annotation_delete_actions(sender, instance, using, **kwargs):
     """
     If we're deleting a comment, we need to make sure the parent object's
     comment count and most-recent-comment date are still accurate.
+
+    (When saving a comment this is done in Annotation.save().)
     """
     instance.set_parent_comment_data()
 
+    # Django sets instance.pk to None after deleting it:
+    annotation_id = instance.pk
+    transaction.on_commit(
+        lambda: recent_activity.update_for_deleted_annotation(
+            annotation_id, instance.content_type_id
+        )
+    )
+
+
+@receiver(post_save, sender=Annotation)
+def update_recent_activity(sender, instance, created, raw, **kwargs):
+    """
+    Keep the Recent Activity lists up to date when an Annotation is posted,
+    hidden, removed or edited. See common.recent_activity.
+
+    This is sent before Annotation.save() updates _parent_data_state, so
+    that still has the values from before this save.
+    """
+    if raw:
+        return
+    previous_state = instance._parent_data_state
+    previous_content_type_id = previous_state[0] if previous_state else None
+    transaction.on_commit(
+        lambda: recent_activity.update_for_annotation(
+            instance,
+            created=created,
+            previous_content_type_id=previous_content_type_id,
+        )
+    )
+
 
 comment_was_posted.connect(
     test_comment_for_spam, sender=Annotation, dispatch_uid="comments.post_comment"
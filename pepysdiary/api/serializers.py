@@ -44,11 +44,11 @@ class CategorySerializer(BaseSerializer):
     apiURL = serializers.HyperlinkedIdentityField(**categories_kwargs)
 
     children = serializers.HyperlinkedRelatedField(
-        source="get_children", read_only=True, many=True, **categories_kwargs
+        source="children_brief", read_only=True, many=True, **categories_kwargs
     )
 
     parents = serializers.HyperlinkedRelatedField(
-        source="get_ancestors", read_only=True, many=True, **categories_kwargs
+        source="ancestors_brief", read_only=True, many=True, **categories_kwargs
     )
 
     topicCount = serializers.IntegerField(source="topic_count", read_only=True)
@@ -179,12 +179,10 @@ class TopicSerializer(BaseSerializer):
         )
 
     def get_kind(self, instance):
-        if instance.is_person:
-            return "person"
-        elif instance.is_place:
-            return "place"
-        else:
-            return "default"
+        # Use the value from Topic.objects.with_kinds(), if it was used:
+        if hasattr(instance, "kind"):
+            return instance.kind
+        return instance.get_kind()
 
 
 class TopicListSerializer(TopicSerializer):
@@ -210,9 +208,18 @@ class TopicDetailSerializer(TopicSerializer):
     )
 
     # Only need the "brief" references to generate the URLs and it's much more efficient
-    # for Topics like 180 (945 diary references).
+    # for Topics like 180 (945 diary references). These come from the same cached
+    # timeline as the Topic's web page.
     entries = serializers.HyperlinkedRelatedField(
-        source="diary_references_brief", read_only=True, many=True, **entries_kwargs
+        source="get_brief_diary_references",
+        read_only=True,
+        many=True,
+        **entries_kwargs,
+    )
+
+    # The Topics most often referred to in the same Entries as this one.
+    relatedTopics = serializers.HyperlinkedRelatedField(
+        source="get_related_topics", read_only=True, many=True, **topics_kwargs
     )
 
     wikipediaURL = serializers.URLField(source="wikipedia_url", read_only=True)
@@ -241,6 +248,7 @@ class TopicDetailSerializer(TopicSerializer):
             "shape",
             "categories",
             "entries",
+            "relatedTopics",
             "lastModifiedTime",
             "apiURL",
             "webURL",
@@ -1,9 +1,16 @@
-from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
+from datetime import date
+
+from django.http import Http404
 from django.views.decorators.vary import vary_on_cookie
 from rest_framework import viewsets
 from rest_framework.views import exception_handler
 
+from pepysdiary.common.caching import (
+    cache_page_swr,
+    get_cache_tags_key_prefix,
+    make_cache_tag,
+)
+from pepysdiary.diary.date_index import entry_date_index
 from pepysdiary.diary.models import Entry
 from pepysdiary.diary.views import date_from_string
 from pepysdiary.encyclopedia.models import Category, Topic
@@ -31,17 +38,44 @@ def custom_exception_handler(exc, context):
 
 
 class CachedReadOnlyModelViewSet(viewsets.ReadOnlyModelViewSet):
-    "Parent class that adds caching to the list() and retrieve() methods."
+    """
+    Parent class that adds caching to the list() and retrieve() methods.
+
+    The cache expires when objects the response depends on are saved or
+    deleted. The list depends on all objects of the queryset's model, and
+    retrieve() depends on the single object. Add any other tags that
+    both depend on to cache_tags. See common.caching.
+
+    After cache_timeout a stale response is served while one request
+    regenerates it. See common.caching.cache_page_swr().
+    """
+
+    cache_timeout = 60 * 60 * 6
+
+    cache_tags = ()
+
+    def get_cache_tags(self):
+        model = self.queryset.model
+        if self.action == "retrieve":
+            key = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+            tags = [make_cache_tag(model, key)]
+        else:
+            tags = [make_cache_tag(model)]
+        return (*tags, *self.cache_tags)
+
+    def cache_response(self, view, request, *args, **kwargs):
+        "Returns the response of view(), from the cache if possible."
+        key_prefix = get_cache_tags_key_prefix(self.get_cache_tags())
+        view = cache_page_swr(self.cache_timeout, key_prefix=key_prefix)(
+            vary_on_cookie(view)
+        )
+        return view(request, *args, **kwargs)
 
-    @method_decorator(cache_page(60 * 15))
-    @method_decorator(vary_on_cookie)
     def list(self, request, *args, **kwargs):
-        return super().list(request, *args, **kwargs)
+        return self.cache_response(super().list, request, *args, **kwargs)
 
-    @method_decorator(cache_page(60 * 15))
-    @method_decorator(vary_on_cookie)
     def retrieve(self, request, *args, **kwargs):
-        return super().retrieve(request, *args, **kwargs)
+        return self.cache_response(super().retrieve, request, *args, **kwargs)
 
 
 class CategoryViewSet(CachedReadOnlyModelViewSet):
@@ -63,6 +97,7 @@ class CategoryViewSet(CachedReadOnlyModelViewSet):
     """
 
     queryset = Category.objects.all().order_by("slug")
+    cache_tags = (make_cache_tag(Topic),)
     serializer_class = CategoryListSerializer
     lookup_field = "slug"
     lookup_url_kwarg = "category_slug"
@@ -108,14 +143,36 @@ class EntryViewSet(CachedReadOnlyModelViewSet):
         else:
             return self.serializer_class
 
+    def get_object(self):
+        """
+        Use the in-memory index of Entry dates to return a 404 for dates
+        with no Entry without querying the database.
+        """
+        entry_date = self.kwargs[self.lookup_url_kwarg]
+        try:
+            is_valid = entry_date_index.contains(date.fromisoformat(entry_date))
+        except ValueError:
+            is_valid = False
+        if not is_valid:
+            msg = f"There is no Entry for the date '{entry_date}'."
+            raise Http404(msg)
+        return super().get_object()
+
     def get_queryset(self):
         """
         If retrieving a list of Entries, optionally filter by start and
         end query string arguments.
+
+        Made for each request, rather than using self.queryset, so that the
+        manager decides then which fields to defer. A single Entry's detail
+        includes its text and footnotes, which the list doesn't need.
         """
-        queryset = self.queryset
+        queryset = Entry.objects.order_by("diary_date")
+
+        if self.action == "retrieve":
+            queryset = queryset.with_large_fields("text", "footnotes")
 
-        if self.action == "list":
+        elif self.action == "list":
             start = self.request.query_params.get("start")
             end = self.request.query_params.get("end")
 
@@ -153,7 +210,8 @@ class TopicViewSet(CachedReadOnlyModelViewSet):
     * `topics/796`
     """
 
-    queryset = Topic.objects.all().order_by("id")
+    queryset = Topic.objects.with_kinds().order_by("id")
+    cache_tags = (make_cache_tag(Category),)
     serializer_class = TopicListSerializer
     lookup_field = "id"
     lookup_url_kwarg = "topic_id"
@@ -163,3 +221,14 @@ class TopicViewSet(CachedReadOnlyModelViewSet):
             return TopicDetailSerializer
         else:
             return self.serializer_class
+
+    def get_queryset(self):
+        """
+        Made for each request, rather than using self.queryset, so that the
+        manager decides then which fields to defer. A single Topic's detail
+        includes the fields that the list doesn't need.
+        """
+        queryset = Topic.objects.with_kinds().order_by("id")
+        if self.action == "retrieve":
+            queryset = queryset.with_large_fields("wheatley_html", "shape")
+        return queryset
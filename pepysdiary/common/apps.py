@@ -1,6 +1,24 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save, pre_delete
 
 
 class CommonConfig(AppConfig):
     name = "pepysdiary.common"
     default_auto_field = "django.db.models.AutoField"
+
+    def ready(self):
+        from . import recent_activity, signals
+        from .models import CacheTagsMixin
+
+        # Connect to each model's signals, rather than every model's, because
+        # any pre_delete or post_delete receiver stops Django from deleting a
+        # model's objects in bulk.
+        for model in self.apps.get_models():
+            if issubclass(model, CacheTagsMixin):
+                post_save.connect(signals.expire_cache_tags, sender=model)
+                pre_delete.connect(signals.expire_cache_tags, sender=model)
+
+        for label in recent_activity.KINDS.values():
+            model = self.apps.get_model(label)
+            post_save.connect(signals.update_recent_activity, sender=model)
+            post_delete.connect(signals.update_recent_activity, sender=model)
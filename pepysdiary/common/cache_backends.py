@@ -0,0 +1,366 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+import weakref
+from collections import Counter, OrderedDict
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.redis import RedisCache
+
+logger = logging.getLogger(__name__)
+
+
+class LocalLRUCache:
+    """
+    A bounded, thread-safe, in-memory store of serialized cache values,
+    least-recently-used first. Each value expires after `timeout` seconds,
+    or earlier if set() is given a shorter timeout.
+    """
+
+    def __init__(self, max_entries=1000, timeout=30):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        # Maps keys to (expiry time, serialized value) tuples:
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        # Number of entries removed to keep within max_entries:
+        self.evictions = 0
+        # Changes whenever keys are deleted or cleared. See set().
+        self.generation = 0
+
+    def get(self, key):
+        "Returns a tuple of (found, value)."
+        with self._lock:
+            try:
+                expires, value = self._data[key]
+            except KeyError:
+                return False, None
+            if expires <= time.monotonic():
+                del self._data[key]
+                return False, None
+            self._data.move_to_end(key)
+            return True, value
+
+    def set(self, key, value, timeout=None, generation=None):
+        """
+        timeout is the backend's timeout, which might be shorter than ours.
+
+        generation is the value of self.generation from before the value was
+        fetched. If any keys have been deleted since then, the value might be
+        out of date, so we don't store it.
+        """
+        if self.max_entries < 1:
+            return
+        if timeout is None or timeout > self.timeout:
+            timeout = self.timeout
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._data[key] = (time.monotonic() + timeout, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+            self.generation += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.generation += 1
+
+    def __len__(self):
+        return len(self._data)
+
+
+# The InvalidationListener for each pub/sub channel in this process, keyed by
+# (process ID, channel). Shared by all the TwoTierRedisCache instances (one per
+# thread) that use the channel, so each process only has one listener thread,
+# and one Redis connection for it, per channel.
+_listeners = {}
+_listeners_lock = threading.Lock()
+
+
+class InvalidationListener:
+    """
+    Receives the keys that other processes have changed or deleted, from a
+    Redis pub/sub channel (see TwoTierRedisCache._ensure_listener()), and
+    drops them from the L1 caches of this process's TwoTierRedisCache
+    instances.
+    """
+
+    def __init__(self, channel):
+        self.channel = channel
+        # Identifies messages this process published, so we can ignore them.
+        self.sender_id = f"{os.getpid()}-{uuid.uuid4().hex}"
+        # The L1 caches of the TwoTierRedisCache instances using this
+        # listener. Weak references, so finished threads' caches are dropped.
+        self.l1_caches = weakref.WeakSet()
+        # Number of invalidations received from other processes:
+        self.invalidations = 0
+
+    def drop(self, keys):
+        "Drops keys from all the L1 caches. If keys is None, drops all keys."
+        for l1 in list(self.l1_caches):
+            if keys is None:
+                l1.clear()
+            else:
+                for key in keys:
+                    l1.delete(key)
+
+    def on_message(self, message):
+        "Called, in the listener thread, with each pub/sub message."
+        try:
+            data = json.loads(message["data"])
+        except (TypeError, ValueError):
+            return
+        if data.get("sender") == self.sender_id:
+            return
+        self.invalidations += 1
+        self.drop(data.get("keys"))
+
+
+class TwoTierRedisCache(RedisCache):
+    """
+    A Redis cache backend with a small in-memory cache (L1) in front of
+    Redis (L2), so frequently-used keys don't need a round trip to Redis
+    every time.
+
+    Django makes a separate instance of the cache backend for each thread,
+    so each thread has its own L1 cache and stats. With gunicorn's default
+    sync workers that's one per process.
+
+    When any instance changes or deletes a key it drops the key from the L1
+    caches of all the instances in its process, and publishes the key on a
+    Redis pub/sub channel. Each process has one InvalidationListener, which
+    listens on that channel, in a background thread, and drops the keys
+    other processes publish. As a backstop, in case a message is missed, L1
+    entries also expire after L1_TIMEOUT seconds, or when the key expires in
+    Redis, if that's sooner.
+
+    L1 stores values serialized, so every get() returns a new copy, as
+    with Redis itself.
+
+    Use like RedisCache, with these extra OPTIONS:
+
+        "L1_MAX_ENTRIES": Maximum number of keys in each L1 cache (1000).
+                          0 turns off L1.
+        "L1_TIMEOUT": Maximum seconds keys stay in L1 (30).
+        "CHANNEL": Name of the pub/sub channel ("pepys:cache:invalidate").
+
+    The `stats` Counter has hits and misses for each tier in this instance.
+    get_stats() adds L1 evictions, and invalidations this process has
+    received from other processes.
+    """
+
+    def __init__(self, server, params):
+        params = dict(params)
+        options = dict(params.get("OPTIONS", {}))
+        l1_max_entries = options.pop("L1_MAX_ENTRIES", 1000)
+        l1_timeout = options.pop("L1_TIMEOUT", 30)
+        self.channel = options.pop("CHANNEL", "pepys:cache:invalidate")
+        params["OPTIONS"] = options
+
+        super().__init__(server, params)
+
+        self._l1 = LocalLRUCache(max_entries=l1_max_entries, timeout=l1_timeout)
+        self.stats = Counter()
+
+        # This process's InvalidationListener, and the process's ID.
+        # Set by _ensure_listener() in each process this instance is used in.
+        self._listener = None
+        self._listener_pid = None
+
+    def get_stats(self):
+        "Returns a dict of the stats, including L1's size and evictions."
+        return {
+            **self.stats,
+            "l1_evictions": self._l1.evictions,
+            "l1_invalidations": self._listener.invalidations if self._listener else 0,
+            "l1_size": len(self._l1),
+        }
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = super().add(key, value, timeout=timeout, version=version)
+        if added:
+            self._invalidate([self.make_and_validate_key(key, version=version)])
+        return added
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        found, value = self._l1_get(key)
+        if found:
+            return value
+
+        # If the key is invalidated while we fetch it, don't put it in L1:
+        generation = self._l1.generation
+        client = self._cache.get_client(key)
+        value = client.get(key)
+        if value is None:
+            self.stats["l2_misses"] += 1
+            return default
+
+        self.stats["l2_hits"] += 1
+        self._l1.set(
+            key,
+            value,
+            self._get_l1_timeout(client.ttl(key)),
+            generation=generation,
+        )
+        return self._cache._serializer.loads(value)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        super().set(key, value, timeout=timeout, version=version)
+        self._invalidate([self.make_and_validate_key(key, version=version)])
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        touched = super().touch(key, timeout=timeout, version=version)
+        # So that L1 doesn't keep it for longer than the new timeout:
+        self._invalidate([self.make_and_validate_key(key, version=version)])
+        return touched
+
+    def delete(self, key, version=None):
+        deleted = super().delete(key, version=version)
+        self._invalidate([self.make_and_validate_key(key, version=version)])
+        return deleted
+
+    def get_many(self, keys, version=None):
+        key_map = {
+            self.make_and_validate_key(key, version=version): key for key in keys
+        }
+        ret = {}
+        missing = []
+        for made_key, key in key_map.items():
+            found, value = self._l1_get(made_key)
+            if found:
+                ret[key] = value
+            else:
+                missing.append(made_key)
+
+        if missing:
+            generation = self._l1.generation
+            # Get the values, and how long until each expires, in one trip:
+            pipeline = self._cache.get_client(None).pipeline(transaction=False)
+            pipeline.mget(missing)
+            for made_key in missing:
+                pipeline.ttl(made_key)
+            values, *ttls = pipeline.execute()
+            for made_key, value, ttl in zip(missing, values, ttls, strict=True):
+                if value is None:
+                    self.stats["l2_misses"] += 1
+                else:
+                    self.stats["l2_hits"] += 1
+                    self._l1.set(
+                        made_key,
+                        value,
+                        self._get_l1_timeout(ttl),
+                        generation=generation,
+                    )
+                    ret[key_map[made_key]] = self._cache._serializer.loads(value)
+        return ret
+
+    def has_key(self, key, version=None):
+        made_key = self.make_and_validate_key(key, version=version)
+        if self._l1.get(made_key)[0]:
+            return True
+        return super().has_key(key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        value = super().incr(key, delta=delta, version=version)
+        self._invalidate([self.make_and_validate_key(key, version=version)])
+        return value
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        ret = super().set_many(data, timeout=timeout, version=version)
+        self._invalidate(
+            [self.make_and_validate_key(key, version=version) for key in data]
+        )
+        return ret
+
+    def delete_many(self, keys, version=None):
+        super().delete_many(keys, version=version)
+        self._invalidate(
+            [self.make_and_validate_key(key, version=version) for key in keys]
+        )
+
+    def clear(self):
+        ret = super().clear()
+        self._invalidate(None)
+        return ret
+
+    def _l1_get(self, key):
+        """
+        Returns a tuple of (found, value) from L1, deserializing the value.
+        """
+        self._ensure_listener()
+        found, value = self._l1.get(key)
+        if found:
+            self.stats["l1_hits"] += 1
+            return True, self._cache._serializer.loads(value)
+        self.stats["l1_misses"] += 1
+        return False, None
+
+    def _get_l1_timeout(self, ttl):
+        """
+        Passed a key's TTL from Redis, returns the seconds until it expires,
+        or None if it doesn't. So that L1 never keeps it for longer.
+        """
+        return ttl if ttl and ttl > 0 else None
+
+    def _invalidate(self, keys):
+        """
+        Drops keys from the L1 caches in this process and tells other
+        processes to drop them from theirs. If keys is None, all keys are
+        dropped.
+        """
+        if self._l1.max_entries < 1:
+            return
+        self._ensure_listener()
+        self._listener.drop(keys)
+
+        message = json.dumps({"sender": self._listener.sender_id, "keys": keys})
+        try:
+            self._cache.get_client(None, write=True).publish(self.channel, message)
+        except self._cache._lib.RedisError:
+            logger.exception("Couldn't publish cache invalidation")
+
+    def _ensure_listener(self):
+        """
+        Registers our L1 cache with this process's listener for invalidations
+        from other processes, starting the listener if it's the first, once
+        in each process (e.g. after gunicorn forks workers).
+        """
+        pid = os.getpid()
+        if self._listener_pid == pid or self._l1.max_entries < 1:
+            return
+        with _listeners_lock:
+            if self._listener_pid == pid:
+                return
+            listener = _listeners.get((pid, self.channel))
+            if listener is None:
+                # The parent process's listener threads didn't survive the fork:
+                for key in [key for key in _listeners if key[0] != pid]:
+                    del _listeners[key]
+                listener = InvalidationListener(self.channel)
+                _listeners[(pid, self.channel)] = listener
+                try:
+                    pubsub = self._cache.get_client(None).pubsub(
+                        ignore_subscribe_messages=True
+                    )
+                    pubsub.subscribe(**{self.channel: listener.on_message})
+                    pubsub.run_in_thread(sleep_time=1, daemon=True)
+                except self._cache._lib.RedisError:
+                    # L1 entries will still expire after L1_TIMEOUT.
+                    logger.exception("Couldn't subscribe to cache invalidations")
+            # Anything in L1 was inherited from the parent process and might
+            # have changed since.
+            self._l1.clear()
+            listener.l1_caches.add(self._l1)
+            self._listener = listener
+            self._listener_pid = pid
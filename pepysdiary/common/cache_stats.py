@@ -0,0 +1,218 @@
+import threading
+import time
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.urls import Resolver404, resolve
+
+# Instrumentation of our cache middleware: the site-wide
+# UpdateCacheMiddleware/FetchFromCacheMiddleware (see common.middleware) and
+# the per-view caching of common.caching.cache_page_swr().
+#
+# For each URL name we count cache hits and misses, pages stored in the
+# cache and their size, and the number of calls to the cache backend and the
+# time they took.
+#
+# This only happens if settings.PEPYS_CACHE_STATS is True. Otherwise the only
+# overhead is checking that setting.
+#
+# The stats are kept in memory, for this process only. See the cache_stats
+# view for a way to see them.
+
+# Name used for requests whose URL doesn't match any of our URL patterns:
+UNRESOLVED_URL_NAME = "<unresolved>"
+
+# The URL name of the current request, so that InstrumentedCache knows what
+# to record its stats against:
+_current_url_name = ContextVar("cache_stats_url_name", default=UNRESOLVED_URL_NAME)
+
+
+class CacheStats:
+    """
+    Counts of what's happened to cached pages in this process, for each
+    URL name. The counts are:
+
+    * "hits": Pages served from the cache
+    * "misses": Pages that weren't in the cache, or were stale
+    * "stores": Pages stored in the cache
+    * "bytes": Total size of the content of those stored pages
+    * "backend_calls": Calls to the cache backend
+    * "backend_seconds": Total time those calls took
+    """
+
+    fields = ("hits", "misses", "stores", "bytes", "backend_calls", "backend_seconds")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = defaultdict(Counter)
+        self.started = time.time()
+
+    @property
+    def enabled(self):
+        return settings.PEPYS_CACHE_STATS
+
+    def record(self, url_name, **counts):
+        "e.g. record('home', hits=1)"
+        with self._lock:
+            self._stats[url_name].update(counts)
+
+    def get_stats(self):
+        """
+        Returns a dict of URL names, each mapped to a dict of all the fields
+        and their counts.
+        """
+        with self._lock:
+            return {
+                url_name: {field: counts[field] for field in self.fields}
+                for url_name, counts in sorted(self._stats.items())
+            }
+
+    def get_totals(self):
+        "Returns a dict of all the fields and their counts for all URL names."
+        totals = Counter()
+        for counts in self.get_stats().values():
+            totals.update(counts)
+        return {field: totals[field] for field in self.fields}
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self.started = time.time()
+
+
+cache_stats = CacheStats()
+
+
+class InstrumentedCache:
+    """
+    Wraps a cache backend, recording the number and duration of calls to it,
+    and the stores and sizes of pages, against the current URL name.
+    Anything else is passed through to the backend.
+    """
+
+    def __init__(self, cache):
+        self._cache = cache
+
+    def __getattr__(self, name):
+        return getattr(self._cache, name)
+
+    def _call(self, method, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return getattr(self._cache, method)(*args, **kwargs)
+        finally:
+            cache_stats.record(
+                _current_url_name.get(),
+                backend_calls=1,
+                backend_seconds=time.perf_counter() - start,
+            )
+
+    def get(self, *args, **kwargs):
+        return self._call("get", *args, **kwargs)
+
+    def get_many(self, *args, **kwargs):
+        return self._call("get_many", *args, **kwargs)
+
+    def add(self, *args, **kwargs):
+        return self._call("add", *args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        return self._call("delete", *args, **kwargs)
+
+    def set(self, key, value, *args, **kwargs):
+        result = self._call("set", key, value, *args, **kwargs)
+        size = _get_page_size(value)
+        if size is not None:
+            cache_stats.record(_current_url_name.get(), stores=1, bytes=size)
+        return result
+
+
+def _get_page_size(value):
+    """
+    Returns the length of the content of a cached page, or None if value
+    isn't a page (e.g. it's a list of headers, or a lock).
+    value might be a response, or a dict containing one, as stored by
+    cache_page_swr().
+    """
+    if isinstance(value, dict):
+        value = value.get("response")
+    if getattr(value, "streaming", True):
+        return None
+    return len(value.content)
+
+
+def get_url_name(request):
+    """
+    Returns the name of the URL pattern, with any namespace, that request
+    matches, e.g. "v1:entry-detail".
+    """
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return UNRESOLVED_URL_NAME
+    return match.view_name or UNRESOLVED_URL_NAME
+
+
+class CacheStatsMixin:
+    """
+    For cache middleware, to record stats about the cache, if
+    settings.PEPYS_CACHE_STATS is True.
+
+    process_request() should call start_cache_stats() at its start,
+    and record_cache_lookup() with its result.
+    process_response() should call start_cache_stats() at its start.
+    """
+
+    @property
+    def cache(self):
+        cache = caches[self.cache_alias]
+        if cache_stats.enabled:
+            return InstrumentedCache(cache)
+        return cache
+
+    def start_cache_stats(self, request):
+        "Sets the URL name that stats are recorded against."
+        if cache_stats.enabled:
+            _current_url_name.set(get_url_name(request))
+
+    def record_cache_lookup(self, request, response):
+        """
+        Records a hit if process_request() returned a cached response, or a
+        miss if it didn't, but wants the response to be cached.
+        """
+        if not cache_stats.enabled:
+            return
+        if response is not None:
+            cache_stats.record(_current_url_name.get(), hits=1)
+        elif getattr(request, "_cache_update_cache", False):
+            cache_stats.record(_current_url_name.get(), misses=1)
+
+
+def _escape_label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_metrics(metrics):
+    """
+    Returns the metrics in Prometheus's text exposition format.
+
+    metrics is a list of (name, type, help, samples) tuples, where samples is
+    a list of (labels, value) tuples and labels is a dict.
+    """
+    lines = []
+    for name, metric_type, help_text, samples in metrics:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for labels, value in samples:
+            if labels:
+                label_str = ",".join(
+                    f'{k}="{_escape_label(str(v))}"' for k, v in labels.items()
+                )
+                lines.append(f"{name}{{{label_str}}} {value}")
+            else:
+                lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,345 @@
+import hashlib
+import logging
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.middleware.cache import CacheMiddleware
+from django.utils.cache import (
+    get_cache_key,
+    get_max_age,
+    has_vary_header,
+    learn_cache_key,
+    patch_response_headers,
+)
+from django.utils.decorators import decorator_from_middleware_with_args
+
+from pepysdiary.common.cache_stats import CacheStatsMixin
+
+logger = logging.getLogger(__name__)
+
+# Cache tags let us expire cached views when the things they depend on change.
+#
+# A view declares the tags it depends on (see CacheMixin.get_cache_tags()),
+# e.g. "diary.entry:1661-01-02" for a single Entry, or "diary.entry" for
+# lists of Entries. The current version of each of those tags is used in the
+# key_prefix of the cached page.
+#
+# When an object is saved or deleted we change the versions of the tags it
+# affects (see CacheTagsMixin and common.signals). So the next request for
+# any view depending on those tags has a different cache key, and the page
+# is generated afresh. The old cached pages are never used again, and expire
+# after their timeout.
+
+# Prefix of the cache keys used to store each tag's current version:
+TAG_VERSION_KEY_PREFIX = "cache_tag"
+
+
+def make_cache_tag(model, key=None):
+    """
+    Returns a tag for a model, or one of its objects.
+    e.g. "diary.entry" for all Entries, or "diary.entry:1661-01-02" for
+    one Entry, if key is "1661-01-02".
+    """
+    tag = model._meta.label_lower
+    return tag if key is None else f"{tag}:{key}"
+
+
+def get_cache_tag_versions(tags):
+    """
+    Returns a dict of each tag mapped to its current version, a string.
+    Tags that have no version yet are given one.
+    """
+    keys = {f"{TAG_VERSION_KEY_PREFIX}:{tag}": tag for tag in tags}
+    versions = cache.get_many(list(keys.keys()))
+
+    missing = {key: uuid.uuid4().hex for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+
+    return {keys[key]: version for key, version in versions.items()}
+
+
+def get_cache_tags_key_prefix(tags):
+    """
+    Returns a string to use as the key_prefix for cached views that depend on
+    these tags. It changes whenever any of the tags' versions changes.
+    Returns None if there are no tags.
+    """
+    if not tags:
+        return None
+    versions = get_cache_tag_versions(tags)
+    value = ";".join(f"{tag}={versions[tag]}" for tag in sorted(versions))
+    return hashlib.md5(value.encode(), usedforsecurity=False).hexdigest()
+
+
+def invalidate_cache_tags(tags):
+    """
+    Changes the versions of all these tags, which expires any cached views
+    that depend on them. This happens once the current transaction has been
+    committed, so that pages aren't re-cached with the old data before then.
+    """
+    tags = set(tags)
+    if tags:
+        transaction.on_commit(lambda: _change_cache_tag_versions(tags))
+
+
+def _change_cache_tag_versions(tags):
+    cache.set_many(
+        {f"{TAG_VERSION_KEY_PREFIX}:{tag}": uuid.uuid4().hex for tag in tags}, None
+    )
+
+
+# Stale-while-revalidate page caching.
+#
+# Like Django's cache_page, but when a cached page is older than its timeout
+# it's not thrown away. Until its stale_timeout has also passed, one request
+# regenerates the page (holding a lock in the cache), while any other
+# requests for it are served the stale copy. And if there's no copy at all,
+# requests wait briefly for the request holding the lock to make one, rather
+# than every one of them generating the page at once.
+
+# Counts of what happened to requests for pages cached with cache_page_swr(),
+# in this process:
+# * "hit": Served a fresh page from the cache
+# * "miss": Generated a page that wasn't in the cache
+# * "revalidated": Generated a page whose cached copy was stale
+# * "stale": Served a stale page while another request regenerated it
+# * "contended": Couldn't get the lock because another request had it
+# * "waited": Served a page that another request made while we waited
+# * "wait_timeout": Gave up waiting for another request and made the page
+page_cache_counts = Counter()
+
+
+class StaleWhileRevalidateCacheMiddleware(CacheStatsMixin, CacheMiddleware):
+    """
+    Used by cache_page_swr(), rather than directly as middleware.
+
+    The page is cached for page_timeout + stale_timeout seconds, with the
+    time at which it becomes stale. Browsers and other downstream caches are
+    only told to cache it for browser_timeout seconds (or until it's stale,
+    if sooner), because they don't know when its cache tags change.
+    """
+
+    def __init__(
+        self,
+        get_response,
+        cache_timeout=None,
+        page_timeout=None,
+        stale_timeout=None,
+        browser_timeout=None,
+        **kwargs,
+    ):
+        super().__init__(
+            get_response, cache_timeout=cache_timeout, page_timeout=page_timeout
+        )
+        # So our cached pages are never fetched by FetchFromCacheMiddleware:
+        self.key_prefix = f"swr.{kwargs.get('key_prefix') or ''}"
+        self.cache_alias = kwargs.get("cache_alias") or self.cache_alias
+
+        if stale_timeout is None:
+            stale_timeout = settings.PEPYS_CACHE_STALE_TIMEOUT
+        self.stale_timeout = stale_timeout
+        if browser_timeout is None:
+            browser_timeout = settings.PEPYS_CACHE_BROWSER_TIMEOUT
+        self.browser_timeout = browser_timeout
+        self.lock_timeout = settings.PEPYS_CACHE_LOCK_TIMEOUT
+        self.lock_wait = settings.PEPYS_CACHE_LOCK_WAIT
+
+    def process_request(self, request):
+        self.start_cache_stats(request)
+        response = self._get_cached_response(request)
+        self.record_cache_lookup(request, response)
+        return response
+
+    def _get_cached_response(self, request):
+        """
+        Returns the cached response, or None if this request should make it.
+        """
+        if request.method not in ("GET", "HEAD"):
+            request._cache_update_cache = False
+            return None
+
+        cache_key, entry = self._get_entry(request)
+        if entry is not None and time.time() < entry["fresh_until"]:
+            page_cache_counts["hit"] += 1
+            request._cache_update_cache = False
+            return entry["response"]
+
+        # The page is stale or missing, so only one request should make it.
+        lock_key = self._get_lock_key(request, cache_key)
+        if self.cache.add(lock_key, value=True, timeout=self.lock_timeout):
+            page_cache_counts["miss" if entry is None else "revalidated"] += 1
+            request._cache_lock_key = lock_key
+            request._cache_update_cache = True
+            return None
+
+        page_cache_counts["contended"] += 1
+        logger.debug("Cache lock contended for %s", request.path)
+
+        if entry is not None:
+            page_cache_counts["stale"] += 1
+            request._cache_update_cache = False
+            return entry["response"]
+
+        # Wait for the request with the lock to cache the page:
+        deadline = time.monotonic() + self.lock_wait
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            entry = self._get_entry(request)[1]
+            if entry is not None:
+                page_cache_counts["waited"] += 1
+                request._cache_update_cache = False
+                return entry["response"]
+
+        page_cache_counts["wait_timeout"] += 1
+        request._cache_update_cache = True
+        return None
+
+    def process_response(self, request, response):
+        """
+        Mostly the same as UpdateCacheMiddleware.process_response() but
+        storing the time the page becomes stale, and releasing our lock.
+        """
+        self.start_cache_stats(request)
+        if not self._should_update_cache(request, response):
+            return response
+
+        if (
+            response.streaming
+            or response.status_code != 200
+            or (
+                not request.COOKIES
+                and response.cookies
+                and has_vary_header(response, "Cookie")
+            )
+            or "private" in response.get("Cache-Control", ())
+        ):
+            self._release_lock(request)
+            return response
+
+        timeout = self.page_timeout
+        if timeout is None:
+            timeout = get_max_age(response)
+            if timeout is None:
+                timeout = self.cache_timeout
+        if not timeout:
+            self._release_lock(request)
+            return response
+
+        patch_response_headers(response, min(timeout, self.browser_timeout))
+        hard_timeout = timeout + self.stale_timeout
+        cache_key = learn_cache_key(
+            request, response, hard_timeout, self.key_prefix, cache=self.cache
+        )
+
+        def store(r):
+            entry = {"response": r, "fresh_until": time.time() + timeout}
+            self.cache.set(cache_key, entry, hard_timeout)
+            self._release_lock(request)
+
+        if hasattr(response, "render") and callable(response.render):
+            response.add_post_render_callback(store)
+        else:
+            store(response)
+        return response
+
+    def process_exception(self, request, exception):
+        """
+        If the view raised an exception, release our lock, so that other
+        requests don't wait for a page that will never be cached.
+        """
+        self._release_lock(request)
+
+    def _get_entry(self, request):
+        """
+        Returns a tuple of the cache key and the cached dict of response and
+        fresh_until. Either or both might be None.
+        """
+        cache_key = get_cache_key(request, self.key_prefix, "GET", cache=self.cache)
+        if cache_key is None:
+            return None, None
+        return cache_key, self.cache.get(cache_key)
+
+    def _get_lock_key(self, request, cache_key):
+        """
+        Each variation of the page (e.g. for different cookies) has its own
+        lock. But if this URL has never been cached we don't know what the
+        variations are, so all requests for it share one lock.
+        """
+        if cache_key is None:
+            url = hashlib.md5(
+                request.build_absolute_uri().encode(), usedforsecurity=False
+            ).hexdigest()
+            return f"{self.key_prefix}.lock.{url}"
+        return f"{cache_key}.lock"
+
+    def _release_lock(self, request):
+        lock_key = getattr(request, "_cache_lock_key", None)
+        if lock_key is not None:
+            self.cache.delete(lock_key)
+            del request._cache_lock_key
+
+
+def cache_page_swr(
+    timeout, *, stale_timeout=None, browser_timeout=None, cache=None, key_prefix=None
+):
+    """
+    Decorator for views that caches the page like Django's cache_page, but
+    with protection against many requests regenerating it at once.
+
+    timeout -- Seconds until the cached page is stale.
+    stale_timeout -- Seconds after that during which the stale page is
+                     served while one request regenerates it.
+                     Default: settings.PEPYS_CACHE_STALE_TIMEOUT.
+    browser_timeout -- Maximum seconds for the page's Cache-Control max-age.
+                       Default: settings.PEPYS_CACHE_BROWSER_TIMEOUT.
+    """
+    return decorator_from_middleware_with_args(StaleWhileRevalidateCacheMiddleware)(
+        page_timeout=timeout,
+        stale_timeout=stale_timeout,
+        browser_timeout=browser_timeout,
+        cache_alias=cache,
+        key_prefix=key_prefix,
+    )
+
+
+# Caching rendered fragments of templates.
+#
+# Like Django's {% cache %} template tag, but recording how long each
+# fragment took to render, so that we can see how much rendering time the
+# cache is saving. The caller makes a key that changes whenever the fragment
+# would change, so fragments never need deleting.
+
+# Counts of what happened to fragments cached with get_or_render_fragment(),
+# in this process:
+# * "hit": Served a fragment from the cache
+# * "miss": Rendered a fragment that wasn't in the cache
+# * "render_seconds": Total time spent rendering on misses
+# * "saved_seconds": Total time it took to render the fragments that were
+#   then served from the cache. i.e. the rendering time saved
+fragment_cache_counts = Counter()
+
+
+def get_or_render_fragment(key, render, timeout):
+    """
+    Returns the HTML cached with key or, if there's none, calls render() to
+    make it, and caches it for timeout seconds.
+    """
+    cached = cache.get(key)
+    if cached is not None:
+        fragment_cache_counts["hit"] += 1
+        fragment_cache_counts["saved_seconds"] += cached["seconds"]
+        return cached["html"]
+
+    start = time.perf_counter()
+    html = render()
+    seconds = time.perf_counter() - start
+    cache.set(key, {"html": html, "seconds": seconds}, timeout)
+    fragment_cache_counts["miss"] += 1
+    fragment_cache_counts["render_seconds"] += seconds
+    return html
@@ -0,0 +1,187 @@
+from django.conf import settings
+from django.contrib.sites.models import Site
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from pepysdiary.common.managers import large_fields_not_deferred
+from pepysdiary.diary.models import Entry
+from pepysdiary.encyclopedia.models import Category, Topic
+
+# So that every request queries the database:
+NO_CACHES = {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+
+
+class Command(BaseCommand):
+    """
+    Measures how much data the database sends for each of the major pages,
+    with and without Entry.objects and Topic.objects deferring their large
+    fields (see common.managers.LargeFieldsManagerMixin).
+
+    Each page is requested twice, with caching turned off: first with all
+    fields loaded ("before"), then with the large fields deferred ("after").
+    For each SELECT query the page makes, we count the rows and the size,
+    in bytes, of their text representations, by running the query again,
+    wrapped in another query. So the sizes are a close estimate of the data
+    transferred, not an exact count. Only works with PostgreSQL.
+
+    Audit the pages for the most recently-published Entry, and one of the
+    Topics it refers to:
+    ./manage.py audit_query_sizes
+
+    Choose the words to search for (default "king"):
+    ./manage.py audit_query_sizes --search="navy office"
+
+    The pages are requested with the domain of the current Site as the host,
+    unless --host is used:
+    ./manage.py audit_query_sizes --host=www.pepysdiary.com
+
+    Verbosity:
+    0: No output, except errors
+    1: The sizes for each page, and the totals
+    2: Also the sizes for every query
+    """
+
+    help = "Measures the data fetched from the database for each major page."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--search",
+            action="store",
+            dest="search",
+            default="king",
+            help="The words to search for on the search pages.",
+        )
+        parser.add_argument(
+            "--host",
+            action="store",
+            dest="host",
+            default=None,
+            help="The host to request pages from. Default: the current Site.",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            msg = "audit_query_sizes only works with PostgreSQL."
+            raise CommandError(msg)
+
+        self.verbosity = int(options["verbosity"])
+        host = options["host"] or Site.objects.get_current().domain
+        self.client = Client(HTTP_HOST=host)
+
+        totals = {"before": [0, 0, 0], "after": [0, 0, 0]}
+
+        with override_settings(CACHES=NO_CACHES):
+            for label, url in self.get_urls(options["search"]):
+                with large_fields_not_deferred():
+                    before = self.audit(url)
+                after = self.audit(url)
+                for key, sizes in (("before", before), ("after", after)):
+                    totals[key] = [
+                        t + s for t, s in zip(totals[key], sizes, strict=True)
+                    ]
+                self.write_sizes(label, before, after)
+
+        self.write_sizes("Total", totals["before"], totals["after"])
+
+    def get_urls(self, search):
+        "Returns a list of (label, URL path) tuples of all the pages to audit."
+        urls = [
+            ("Home", reverse("home")),
+            ("Entries RSS", reverse("entry_rss")),
+            ("Topics RSS", reverse("topic_rss")),
+            ("Encyclopedia", reverse("encyclopedia")),
+            ("Map", reverse("category_map")),
+            ("Search entries", f"{reverse('search')}?q={search}&k=d"),
+            ("Search topics", f"{reverse('search')}?q={search}&k=t"),
+            ("API entries", reverse("v1:entry-list")),
+            ("API topics", reverse("v1:topic-list")),
+        ]
+
+        category = Category.objects.filter(topic_count__gt=0).order_by("pk").first()
+        if category is not None:
+            urls.append(("Category", category.get_absolute_url()))
+
+        entry_date = Entry.objects.most_recent_entry_date()
+        entry = Entry.objects.filter(diary_date__lte=entry_date).last()
+        if entry is None:
+            return urls
+
+        urls.append(("Entry", entry.get_absolute_url()))
+        urls.append(
+            (
+                "Entry month",
+                reverse(
+                    "entry_month_archive",
+                    kwargs={"year": entry.year, "month": entry.month},
+                ),
+            )
+        )
+        urls.append(
+            (
+                "API entry",
+                reverse(
+                    "v1:entry-detail",
+                    kwargs={"entry_date": entry.diary_date.isoformat()},
+                ),
+            )
+        )
+
+        topic = Topic.objects.filter(diary_references=entry).order_by("pk").first()
+        if topic is not None:
+            urls.append(("Topic", topic.get_absolute_url()))
+            urls.append(
+                ("API topic", reverse("v1:topic-detail", kwargs={"topic_id": topic.pk}))
+            )
+        return urls
+
+    def audit(self, url):
+        """
+        Requests the page and measures the results of its queries.
+        Returns a list of [number of queries, number of rows, bytes].
+        """
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, secure=settings.PEPYS_USE_HTTPS)
+        if response.status_code >= 400:
+            self.stderr.write(f"{response.status_code} {url}")
+
+        sizes = [len(context.captured_queries), 0, 0]
+        for query in context.captured_queries:
+            rows, num_bytes = self.measure(query["sql"])
+            sizes[1] += rows
+            sizes[2] += num_bytes
+            if self.verbosity > 1:
+                self.stdout.write(f"  {rows} rows, {num_bytes:,} bytes: {query['sql']}")
+        return sizes
+
+    def measure(self, sql):
+        """
+        Returns a tuple of the number of rows returned by the SQL query, and
+        their total size in bytes. (0, 0) if it isn't a SELECT query.
+        """
+        if not sql.lstrip().upper().startswith("SELECT"):
+            return (0, 0)
+        try:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(OCTET_LENGTH(t::text)), 0) "
+                    f"FROM ({sql}) AS t"
+                )
+                rows, num_bytes = cursor.fetchone()
+        except DatabaseError as err:
+            self.stderr.write(f"Couldn't measure query: {err}")
+            return (0, 0)
+        return (rows, int(num_bytes))
+
+    def write_sizes(self, label, before, after):
+        "Outputs the sizes of the page's queries, before and after."
+        if self.verbosity < 1:
+            return
+        saved = before[2] - after[2]
+        percent = (saved / before[2] * 100) if before[2] else 0
+        self.stdout.write(
+            f"{label}: {after[0]} queries, {after[1]} rows, "
+            f"{before[2]:,} -> {after[2]:,} bytes ({percent:.0f}% less)"
+        )
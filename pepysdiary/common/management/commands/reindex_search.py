@@ -0,0 +1,136 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from pepysdiary.common.models import SearchDocumentMixin
+
+
+class Command(BaseCommand):
+    """
+    Re-makes the search_document for every object of the models that have
+    one, using UPDATE queries in the database, rather than re-saving every
+    object.
+
+    Re-index everything:
+    ./manage.py reindex_search
+
+    Re-index only some kinds of things:
+    ./manage.py reindex_search --models entry letter
+
+    Change the number of objects updated by each query (default 1000):
+    ./manage.py reindex_search --chunk-size=5000
+
+    Re-index different models at the same time (default 1):
+    ./manage.py reindex_search --workers=3
+
+    Verbosity:
+    0: No output
+    1: The number of objects updated for each model
+    2: Also output progress after each chunk
+    """
+
+    help = "Re-makes the search_document for objects of models that have one."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--models",
+            "-m",
+            action="store",
+            nargs="+",
+            help="Space-separated model name(s). Only re-index these models.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            "-c",
+            action="store",
+            dest="chunk_size",
+            default=1000,
+            type=int,
+            help="The number of objects to update in each query.",
+        )
+        parser.add_argument(
+            "--workers",
+            "-w",
+            action="store",
+            dest="workers",
+            default=1,
+            type=int,
+            help="The number of models to re-index at the same time.",
+        )
+
+    def get_searchable_models(self):
+        """
+        Returns a dict of all the models that use SearchDocumentMixin, keyed by
+        their lowercase model name, e.g. {"entry": Entry, ...}
+        """
+        return {
+            model._meta.model_name: model
+            for model in apps.get_models()
+            if issubclass(model, SearchDocumentMixin)
+        }
+
+    def handle(self, *args, **options):
+        if options["chunk_size"] < 1:
+            msg = "--chunk-size should be 1 or more."
+            raise CommandError(msg)
+        if options["workers"] < 1:
+            msg = "--workers should be 1 or more."
+            raise CommandError(msg)
+
+        self.chunk_size = options["chunk_size"]
+        self.verbosity = int(options["verbosity"])
+
+        models = self.get_searchable_models()
+        if options["models"]:
+            for name in options["models"]:
+                if name not in models:
+                    valid_names = ", ".join(sorted(models.keys()))
+                    msg = f"'{name}' is not a valid model. Use one of: {valid_names}"
+                    raise CommandError(msg)
+            models = {name: models[name] for name in options["models"]}
+
+        if options["workers"] == 1:
+            for model in models.values():
+                self.reindex_model(model)
+        else:
+            with ThreadPoolExecutor(max_workers=options["workers"]) as executor:
+                # list() so that any exceptions are raised here.
+                list(executor.map(self.reindex_model_in_thread, models.values()))
+
+    def reindex_model_in_thread(self, model):
+        "Each thread has its own database connection, which we close when done."
+        try:
+            return self.reindex_model(model)
+        finally:
+            connections.close_all()
+
+    def reindex_model(self, model):
+        """
+        Updates the search_document of all objects of this model, in chunks
+        of self.chunk_size objects, ordered by pk.
+        Returns the number of objects updated.
+        """
+        start_time = time.monotonic()
+        name = model._meta.verbose_name_plural
+        search_vector = model.get_search_vector()
+
+        pks = list(model._base_manager.order_by("pk").values_list("pk", flat=True))
+        num_updated = 0
+
+        for i in range(0, len(pks), self.chunk_size):
+            chunk = pks[i : i + self.chunk_size]
+            num_updated += model._base_manager.filter(
+                pk__gte=chunk[0], pk__lte=chunk[-1]
+            ).update(search_document=search_vector)
+
+            if self.verbosity > 1:
+                self.stdout.write(f"{name}: {num_updated} of {len(pks)}")
+
+        if self.verbosity > 0:
+            seconds = time.monotonic() - start_time
+            self.stdout.write(f"Re-indexed {num_updated} {name} in {seconds:.2f}s")
+
+        return num_updated
@@ -0,0 +1,146 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.contrib.sites.models import Site
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import reverse
+
+from pepysdiary.diary.models import Entry
+
+
+class Command(BaseCommand):
+    """
+    Requests the pages that change when each day's Diary Entry is published,
+    so that they're generated and cached before visitors ask for them:
+
+    * The home page
+    * The Diary Entries RSS feed
+    * The newly-published Entry's page, its month's page, and its API page
+    * The pages of the Topics the Entry refers to
+
+    Warm the cache now:
+    ./manage.py warm_cache
+
+    Keep running, and warm the cache each day just after the next Entry is
+    published (see EntryManager.next_publication_time()):
+    ./manage.py warm_cache --scheduled
+
+    Change how many seconds after publication to warm the cache (default 5):
+    ./manage.py warm_cache --scheduled --delay=30
+
+    The pages are requested without any cookies, with the domain of the
+    current Site as the host, unless --host is used:
+    ./manage.py warm_cache --host=www.pepysdiary.com
+
+    Verbosity:
+    0: No output, except errors
+    1: The total time taken, and when it's waiting
+    2: Also output the status code and time taken for every page
+    """
+
+    help = "Requests and caches the pages that change when an Entry is published."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scheduled",
+            action="store_true",
+            default=False,
+            dest="scheduled",
+            help="Keep running, warming the cache after each Entry is published.",
+        )
+        parser.add_argument(
+            "--delay",
+            "-d",
+            action="store",
+            dest="delay",
+            default=5,
+            type=int,
+            help="With --scheduled, the number of seconds after publication to "
+            "warm the cache.",
+        )
+        parser.add_argument(
+            "--host",
+            action="store",
+            dest="host",
+            default=None,
+            help="The host to request pages from. Default: the current Site.",
+        )
+
+    def handle(self, *args, **options):
+        if options["delay"] < 0:
+            msg = "--delay should be 0 or more."
+            raise CommandError(msg)
+
+        self.verbosity = int(options["verbosity"])
+        host = options["host"] or Site.objects.get_current().domain
+        self.client = Client(HTTP_HOST=host)
+
+        if options["scheduled"]:
+            while True:
+                self.wait_until(
+                    Entry.objects.next_publication_time()
+                    + timedelta(seconds=options["delay"])
+                )
+                self.warm()
+        else:
+            self.warm()
+
+    def wait_until(self, when):
+        "Sleep until the `when` datetime."
+        if self.verbosity > 0:
+            self.stdout.write(f"Waiting until {when:%Y-%m-%d %H:%M:%S %Z}")
+        seconds = (when - datetime.now(tz=timezone.utc)).total_seconds()
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def get_urls(self):
+        "Returns a list of the URL paths of all the pages to warm."
+        urls = [reverse("home"), reverse("entry_rss")]
+
+        entry_date = Entry.objects.most_recent_entry_date()
+        try:
+            entry = Entry.objects.only("pk", "diary_date").get(diary_date=entry_date)
+        except Entry.DoesNotExist:
+            return urls
+
+        urls.append(entry.get_absolute_url())
+        urls.append(
+            reverse(
+                "entry_month_archive",
+                kwargs={"year": entry.year, "month": entry.month},
+            )
+        )
+        urls.append(
+            reverse("v1:entry-detail", kwargs={"entry_date": entry_date.isoformat()})
+        )
+        urls.extend(
+            topic.get_absolute_url() for topic in entry.topics.only("pk").order_by("pk")
+        )
+        return urls
+
+    def warm(self):
+        """
+        Requests every page, outputting how long each took.
+        Returns a list of (url, status_code, seconds) tuples.
+        """
+        start_time = time.monotonic()
+        timings = []
+
+        for url in self.get_urls():
+            url_start_time = time.monotonic()
+            response = self.client.get(url, secure=settings.PEPYS_USE_HTTPS)
+            seconds = time.monotonic() - url_start_time
+            timings.append((url, response.status_code, seconds))
+
+            if response.status_code >= 400:
+                self.stderr.write(f"{response.status_code} {seconds:.2f}s {url}")
+            elif self.verbosity > 1:
+                self.stdout.write(f"{response.status_code} {seconds:.2f}s {url}")
+
+        if self.verbosity > 0:
+            seconds = time.monotonic() - start_time
+            self.stdout.write(f"Warmed {len(timings)} page(s) in {seconds:.2f}s")
+
+        return timings
@@ -1,6 +1,92 @@
+import hashlib
+from contextlib import contextmanager
+from contextvars import ContextVar
+
 from django.contrib.sites.models import Site
 from django.db import models
 
+# Whether LargeFieldsManagerMixin defers models' large_fields. Only turned
+# off, with large_fields_not_deferred(), to measure what deferring saves.
+_defer_large_fields = ContextVar("defer_large_fields", default=True)
+
+
+@contextmanager
+def large_fields_not_deferred():
+    """
+    Within this, querysets made by managers that use LargeFieldsManagerMixin
+    load all their fields, as if the managers didn't defer any.
+    Used by the audit_query_sizes management command.
+    """
+    token = _defer_large_fields.set(False)
+    try:
+        yield
+    finally:
+        _defer_large_fields.reset(token)
+
+
+class LargeFieldsQuerySet(models.QuerySet):
+    """
+    The QuerySet for managers that use LargeFieldsManagerMixin, whose
+    querysets defer the model's large_fields unless asked for them.
+    """
+
+    def with_large_fields(self, *fields):
+        """
+        Load the model's large_fields that would otherwise be deferred. With
+        no arguments, all of them. Otherwise only the ones named, e.g.:
+            Entry.objects.with_large_fields("text", "footnotes")
+
+        Note: This also undoes any other defer() called before it.
+        """
+        unknown = set(fields) - set(self.model.large_fields)
+        if unknown:
+            msg = (
+                f"{self.model.__name__} has no large fields called "
+                f"{', '.join(sorted(unknown))}"
+            )
+            raise ValueError(msg)
+
+        queryset = self.defer(None)
+        if fields and _defer_large_fields.get():
+            deferred = [name for name in self.model.large_fields if name not in fields]
+            if deferred:
+                queryset = queryset.defer(*deferred)
+        return queryset
+
+    def only(self, *fields):
+        """
+        The same as QuerySet.only() except it loads any of the fields that
+        were deferred by default. (QuerySet.only() would keep them deferred.)
+        """
+        return super(LargeFieldsQuerySet, self.defer(None)).only(*fields)
+
+
+class LargeFieldsManagerMixin:
+    """
+    For the default managers of models with large fields, like the HTML of
+    Entries and Topics, that most of their querysets don't need.
+
+    The model should define `large_fields`, a tuple of field names, e.g.:
+        large_fields = ("text", "footnotes", "search_document")
+
+    Querysets will defer those fields, so that they're only fetched if used.
+    Views that display them should fetch them with the rest, e.g.:
+        Entry.objects.with_large_fields("text", "footnotes")
+
+    Should come before models.Manager in the manager's parents.
+    """
+
+    _queryset_class = LargeFieldsQuerySet
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if _defer_large_fields.get():
+            queryset = queryset.defer(*self.model.large_fields)
+        return queryset
+
+    def with_large_fields(self, *fields):
+        return self.get_queryset().with_large_fields(*fields)
+
 
 class ReferredManagerMixin:
     """
@@ -26,21 +112,49 @@ class ReferredManagerMixin:
             }
         Any Topics that don't have tooltip_text or thumbnails will have empty
         strings for those fields.
+
+        The IDs of the Topics are found with one query, of the ManyToMany
+        table, for all the objects. Their data comes from
+        TopicManager.get_tooltip_data(), which caches it, and so only queries
+        the Topics that aren't already cached.
+        """
+        topic_ids = (
+            self._get_references(objects)
+            .values_list("topic_id", flat=True)
+            .order_by("topic_id")
+            .distinct()
+        )
+        return self.model.topics.field.model.objects.get_tooltip_data(list(topic_ids))
+
+    def get_references_version(self, objects):
+        """
+        Passed an array (or queryset) of Entry or Letter objects, returns a
+        string that changes whenever the data from get_brief_references()
+        could change: when one of the Topics they refer to is modified, or
+        when the set of Topics they refer to changes. Makes one query.
+        """
+        references = (
+            self._get_references(objects)
+            .values_list("topic_id", "topic__date_modified")
+            .order_by("topic_id")
+            .distinct()
+        )
+        value = ";".join(
+            f"{topic_id}={date_modified.isoformat()}"
+            for topic_id, date_modified in references
+        )
+        return hashlib.md5(value.encode(), usedforsecurity=False).hexdigest()
+
+    def _get_references(self, objects):
+        """
+        Returns a queryset of the ManyToMany table's rows linking Topics
+        to these objects. Its foreign key to Topic is called "topic".
         """
-        topic_data = {}
-
-        for obj in objects:
-            for topic in obj.topics.only("pk", "title", "tooltip_text", "thumbnail"):
-                if str(topic.pk) not in topic_data:
-                    thumbnail_url = ""
-                    if topic.thumbnail:
-                        thumbnail_url = topic.thumbnail.url
-                    topic_data[str(topic.pk)] = {
-                        "title": topic.title,
-                        "text": topic.tooltip_text,
-                        "thumbnail_url": thumbnail_url,
-                    }
-        return topic_data
+        # The ManyToManyField is on Topic, e.g. Topic.diary_references:
+        field = self.model.topics.field
+        return self.model.topics.through.objects.filter(
+            **{f"{field.m2m_reverse_field_name()}__in": [o.pk for o in objects]}
+        )
 
 
 class ConfigManager(models.Manager):
@@ -0,0 +1,105 @@
+import threading
+import uuid
+
+from django.core.cache import cache
+from django.db import connection, transaction
+
+# All the MemoryIndex objects, so request_started() and request_finished()
+# can tell each of them.
+_indexes = []
+
+
+class MemoryIndex:
+    """
+    Base for an in-memory index of things from the database, such as
+    diary.date_index.EntryDateIndex, so we can look things up without
+    querying the database.
+
+    Each process has its own copy, which is rebuilt, with one query, the
+    next time it's used after invalidate() is called.
+
+    So that other processes know they need to rebuild theirs, we store a
+    version string in the cache, which changes whenever invalidate() is
+    called. If the cache is a DummyCache then each process's index is only
+    rebuilt after changes made in that process. During a request we only get
+    the version from the cache the first time the index is used, rather than
+    every time.
+
+    Subclasses should set cache_key and define build_index().
+    """
+
+    cache_key = None
+
+    def __init__(self):
+        # Whatever build_index() returns. Subclasses should make it something
+        # that's replaced whole, so that threads never see the parts from two
+        # different builds.
+        self._index = None
+        # The version from the cache when we last built the index:
+        self._version = None
+        # The database savepoints that were open when we built the index.
+        # If any of them has since been rolled back, or released, the index
+        # might contain data that was never committed, so we rebuild it.
+        self._savepoint_ids = ()
+        # For each thread, whether we've got the version from the cache
+        # during the current request. Not set outside of requests, when we
+        # get it every time.
+        self._local = threading.local()
+        _indexes.append(self)
+
+    def build_index(self):
+        "Should query the database and return the index."
+        msg = "Subclasses of MemoryIndex should define build_index()"
+        raise NotImplementedError(msg)
+
+    def request_started(self):
+        self._local.version_checked = False
+
+    def request_finished(self):
+        self._local.__dict__.pop("version_checked", None)
+
+    def invalidate(self):
+        """
+        Call when anything in the index is saved or deleted.
+        We change the version in the cache once the change has been committed,
+        so that other processes don't rebuild their indexes before then.
+        """
+        self._index = None
+        transaction.on_commit(self._change_version)
+
+    def _change_version(self):
+        cache.set(self.cache_key, uuid.uuid4().hex, None)
+        self._index = None
+
+    def _get_index(self):
+        "Returns the index, rebuilding it if necessary."
+        index = self._index
+        savepoint_ids = tuple(connection.savepoint_ids)
+        if savepoint_ids[: len(self._savepoint_ids)] != self._savepoint_ids:
+            index = None
+
+        version_checked = getattr(self._local, "version_checked", None)
+        if index is not None and version_checked:
+            return index
+
+        version = cache.get(self.cache_key)
+        if version_checked is False:
+            self._local.version_checked = True
+        if index is None or version != self._version:
+            index = self.build_index()
+            self._index = index
+            self._version = version
+            self._savepoint_ids = savepoint_ids
+        return index
+
+
+def request_started():
+    "Call at the start of each request (see common.signals)."
+    for index in _indexes:
+        index.request_started()
+
+
+def request_finished():
+    "Call at the end of each request (see common.signals)."
+    for index in _indexes:
+        index.request_finished()
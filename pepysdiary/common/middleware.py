@@ -2,8 +2,36 @@ import calendar
 import contextlib
 from datetime import datetime, timedelta, timezone
 
+from django.middleware import cache
+from django.utils.cache import patch_cache_control
 from django.utils.deprecation import MiddlewareMixin
 
+from pepysdiary.common.cache_stats import CacheStatsMixin
+
+
+class UpdateCacheMiddleware(CacheStatsMixin, cache.UpdateCacheMiddleware):
+    """
+    Django's UpdateCacheMiddleware, recording stats about the cache if
+    settings.PEPYS_CACHE_STATS is True. See common.cache_stats.
+    """
+
+    def process_response(self, request, response):
+        self.start_cache_stats(request)
+        return super().process_response(request, response)
+
+
+class FetchFromCacheMiddleware(CacheStatsMixin, cache.FetchFromCacheMiddleware):
+    """
+    Django's FetchFromCacheMiddleware, recording stats about the cache if
+    settings.PEPYS_CACHE_STATS is True. See common.cache_stats.
+    """
+
+    def process_request(self, request):
+        self.start_cache_stats(request)
+        response = super().process_request(request)
+        self.record_cache_lookup(request, response)
+        return response
+
 
 class VisitTimeMiddleware(MiddlewareMixin):
     """
@@ -14,6 +42,33 @@ class VisitTimeMiddleware(MiddlewareMixin):
     to be directly accessible via JavaScript, so we can do the marking of
     "new" things with that, rather than in templates. So we avoid caching
     this stuff that should be dynamic.
+
+    The three cookies:
+
+    * last_view: The time of the last page view. To avoid setting a cookie
+      on every response, this is only updated once it's more than
+      last_view_interval seconds old.
+
+    * visit_start: When this current visit began. This stays the same until
+      visit_length seconds have elapsed, at which point this "visit" is
+      over and visit_start is set to now.
+
+    * prev_visit_end: When the previous visit ended (the last_view at the
+      start of this visit). Comments newer than this get marked as "new".
+
+    So that pages can be cached:
+
+    * This should come before UpdateCacheMiddleware in settings.MIDDLEWARE,
+      so that our cookies are added after a response has been cached, and
+      are added to responses fetched from the cache.
+
+    * Most responses set no cookies, so they can be cached downstream.
+      Responses that do set cookies are marked as private.
+
+    * We only set cookies on HTML pages, not feeds, API responses, etc.
+
+    The middleware instance is shared between requests, so everything about
+    the current request is kept in local variables, not on self.
     """
 
     # Number of days until cookies expire.
@@ -22,88 +77,83 @@ class VisitTimeMiddleware(MiddlewareMixin):
     # How long until we re-set all the "new" labels on comments? Seconds.
     visit_length = 5400
 
-    # These three are all based on values set and got from cookies:
-
-    # The time of the last page view.
-    # Set to now with every page view.
-    last_view = None
-
-    # When this current visit began.
-    # This stays the same until self.visit_length seconds have elapsed,
-    # at which point this "visit" is over and visit_start is set to now.
-    visit_start = None
-
-    # When the previous visit ended.
-    # Comments newer than this get marked as "new".
-    prev_visit_end = None
+    # Only update the last_view cookie if it's older than this. Seconds.
+    # Set to 0 to update it on every page view.
+    last_view_interval = 600
 
     def process_response(self, request, response):
         """First we get existing cookie values, then we set new ones."""
 
-        request = self._set_vars_from_cookies(request)
-
-        response = self._set_cookies(response)
+        if self._should_set_cookies(response):
+            last_view, visit_start = self._get_times_from_cookies(request)
+            self._set_cookies(response, last_view, visit_start)
 
         return response
 
-    def _set_vars_from_cookies(self, request):
-        """Reads in any existing cookie values."""
+    def _should_set_cookies(self, response):
+        "We only want to set cookies on HTML pages."
+        return response.get("Content-Type", "").startswith("text/html")
+
+    def _get_times_from_cookies(self, request):
+        """
+        Reads in existing cookie values.
+        Returns a tuple of last_view and visit_start datetimes, either of which
+        might be None if the cookie is missing or invalid.
+        """
+        last_view = None
+        visit_start = None
 
         last_view_cookie = request.COOKIES.get("last_view", "")
         if last_view_cookie != "":
             with contextlib.suppress(Exception):
-                self.last_view = self.cookie_value_to_datetime(last_view_cookie)
+                last_view = self.cookie_value_to_datetime(last_view_cookie)
 
         visit_start_cookie = request.COOKIES.get("visit_start", "")
         if visit_start_cookie != "":
             with contextlib.suppress(Exception):
-                self.visit_start = self.cookie_value_to_datetime(visit_start_cookie)
+                visit_start = self.cookie_value_to_datetime(visit_start_cookie)
 
-        prev_visit_end_cookie = request.COOKIES.get("prev_visit_end", "")
-        if prev_visit_end_cookie != "":
-            with contextlib.suppress(Exception):
-                self.prev_visit_end = self.cookie_value_to_datetime(
-                    prev_visit_end_cookie
-                )
-        return request
+        return last_view, visit_start
 
-    def _set_cookies(self, response):
-        """Sets new cookie values."""
+    def _set_cookies(self, response, last_view, visit_start):
+        """Sets new cookie values, if they need changing."""
 
         time_now = datetime.now(timezone.utc)
 
         # What time will our cookies expire?
         cookie_expire = time_now + timedelta(self.cookie_duration)
 
-        if self.last_view is None or self.visit_start is None:
+        cookies = {}
+
+        if last_view is None or visit_start is None:
             # User hasn't been here before.
-            response.set_cookie(
-                "visit_start",
-                value=self.datetime_to_cookie_value(time_now),
-                expires=cookie_expire,
-            )
+            cookies["visit_start"] = time_now
 
         else:
-            #  User has viewed a page before.
-            current_visit_duration = time_now - self.visit_start
+            #  User has viewed a page before.
+            current_visit_duration = time_now - visit_start
             if current_visit_duration.total_seconds() > self.visit_length:
                 # This is a new visit for the user.
-                response.set_cookie(
-                    "prev_visit_end",
-                    value=self.datetime_to_cookie_value(self.last_view),
-                    expires=cookie_expire,
-                )
-                response.set_cookie(
-                    "visit_start",
-                    value=self.datetime_to_cookie_value(time_now),
-                    expires=cookie_expire,
-                )
-
-        response.set_cookie(
-            "last_view",
-            value=self.datetime_to_cookie_value(time_now),
-            expires=cookie_expire,
-        )
+                cookies["prev_visit_end"] = last_view
+                cookies["visit_start"] = time_now
+
+        if (
+            cookies
+            or last_view is None
+            or (time_now - last_view).total_seconds() >= self.last_view_interval
+        ):
+            cookies["last_view"] = time_now
+
+        for name, value in cookies.items():
+            response.set_cookie(
+                name,
+                value=self.datetime_to_cookie_value(value),
+                expires=cookie_expire,
+            )
+
+        if cookies:
+            # Don't let other caches store this user's cookies.
+            patch_cache_control(response, private=True)
 
         return response
 
@@ -1,5 +1,17 @@
 from .abstract import PepysModel
-from .mixins import OldDateMixin
+from .mixins import (
+    CacheTagsMixin,
+    OldDateMixin,
+    SearchDocumentMixin,
+    TopicReferencesMixin,
+)
 from .models import Config
 
-__all__ = [PepysModel, OldDateMixin, Config]
+__all__ = [
+    PepysModel,
+    CacheTagsMixin,
+    OldDateMixin,
+    SearchDocumentMixin,
+    TopicReferencesMixin,
+    Config,
+]
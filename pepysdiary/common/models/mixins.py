@@ -1,5 +1,11 @@
+import operator
+import re
+from functools import reduce
+
+from django.contrib.postgres.search import SearchVector
 from django.core.exceptions import ImproperlyConfigured
 
+from pepysdiary.common.caching import make_cache_tag
 from pepysdiary.common.utilities import (
     get_day,
     get_day_e,
@@ -9,6 +15,39 @@ from pepysdiary.common.utilities import (
 )
 
 
+class CacheTagsMixin:
+    """
+    For models whose objects are displayed in cached views.
+
+    When an object is saved or deleted the versions of the tags returned by
+    get_cache_tags() are changed (see common.signals) which expires any
+    cached views that depend on them (see common.caching).
+
+    By default the tags are one for the whole model, e.g. "diary.entry",
+    and one for this object, e.g. "diary.entry:1661-01-02", whose key comes
+    from get_cache_tag_key().
+    """
+
+    def get_cache_tag_key(self):
+        "The part of this object's own tag that identifies it. Default: pk"
+        return self.pk
+
+    def get_cache_tags(self):
+        "Returns a set of tags whose cached views are affected by this object."
+        return {
+            make_cache_tag(self._meta.model),
+            make_cache_tag(self._meta.model, self.get_cache_tag_key()),
+        }
+
+    def get_comment_cache_tags(self):
+        """
+        Returns a set of tags whose cached views are affected by the comments
+        on this object (see Annotation.get_cache_tags()). Default: only this
+        object's own tag.
+        """
+        return {make_cache_tag(self._meta.model, self.get_cache_tag_key())}
+
+
 class OldDateMixin:
     """
     Because strftime can't cope with very old dates, we have to get
@@ -53,3 +92,147 @@ class OldDateMixin:
     def day_e(self):
         """Day of the Entry like '1', '2', '31', etc."""
         return get_day_e(self.get_old_date())
+
+
+class SearchDocumentMixin:
+    """
+    For models that have a `search_document` SearchVectorField.
+
+    Each model using this should define `search_fields`, the names of the
+    fields used to make the search_document, and their weights. e.g.:
+        search_fields = (("title", "A"), ("text", "B"))
+
+    common.signals.on_save() uses this to update the search_document after
+    an object is saved. And the reindex_search management command uses it to
+    update the search_documents of many objects at once.
+
+    Remembers the index components as they were when the object was loaded
+    from, or last saved to, the database. So that on_save() can skip
+    re-indexing the object if none of them have changed (e.g. if we only
+    changed its comment_count).
+
+    Should come before models.Model in the class's parents, e.g.:
+        class Entry(SearchDocumentMixin, PepysModel):
+    """
+
+    search_fields = ()
+
+    # Will be a tuple of the index_components() when the object was loaded or
+    # last saved. None if we don't know what they were.
+    _saved_index_components = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_index_components()
+        return instance
+
+    @classmethod
+    def get_search_vector(cls):
+        """
+        Returns a SearchVector expression that makes the search_document from
+        the search_fields' database columns. e.g. for use like:
+            Entry.objects.update(search_document=Entry.get_search_vector())
+        """
+        return reduce(
+            operator.add,
+            [SearchVector(name, weight=weight) for name, weight in cls.search_fields],
+        )
+
+    def index_components(self):
+        """
+        The values of the search_fields, and their weights, like:
+            (("Monday 1 January 1660", "A"), ("<p>Up betimes...</p>", "B"))
+        """
+        return tuple(
+            (getattr(self, name), weight) for name, weight in self.search_fields
+        )
+
+    def remember_index_components(self):
+        """
+        Store the current index components.
+        If any of the search_fields are deferred we don't, because getting
+        them would mean more database queries, so we'll assume they've changed.
+        """
+        deferred_fields = self.get_deferred_fields()
+        if any(name in deferred_fields for name, _ in self.search_fields):
+            self._saved_index_components = None
+        else:
+            self._saved_index_components = self.index_components()
+
+    def index_components_changed(self):
+        """
+        Have the index components changed since the object was loaded or
+        last saved? Returns True if we don't know.
+        """
+        return (
+            self._saved_index_components is None
+            or self.index_components() != self._saved_index_components
+        )
+
+
+class TopicReferencesMixin:
+    """
+    For models, like Diary Entries and Letters, whose text and footnotes link
+    to Encyclopedia Topics, and which have a `topics` ManyToMany relationship
+    from Topic.
+
+    Call make_references() after saving the object to make its `topics`
+    match the Topics it links to.
+    """
+
+    # Matches links to Topics, capturing the Topic's ID:
+    topic_link_pattern = re.compile(r"pepysdiary.com\/encyclopedia\/(\d+)\/")
+
+    def get_referenced_topic_ids(self):
+        """
+        Returns a set of the IDs (ints) of all the Encyclopedia Topics the
+        text and footnotes refer to.
+        """
+        return {
+            int(id)
+            for id in self.topic_link_pattern.findall(f"{self.text} {self.footnotes}")
+        }
+
+    def make_references(self):
+        """
+        Sets all the Encyclopedia Topics the text (and footnotes) refers to.
+        Only adds and removes the references that have changed, and ignores
+        the IDs of any Topics that don't exist.
+
+        If the text and footnotes are both deferred they can't have changed
+        since this object was loaded, so we don't fetch them.
+        """
+        if {"text", "footnotes"} <= self.get_deferred_fields():
+            return
+
+        topic_ids = self.get_referenced_topic_ids()
+        current_ids = set(self.topics.values_list("pk", flat=True))
+
+        ids_to_remove = current_ids - topic_ids
+        ids_to_add = topic_ids - current_ids
+
+        if ids_to_add:
+            # Only add Topics that exist:
+            ids_to_add = self.topics.model.objects.filter(
+                pk__in=ids_to_add
+            ).values_list("pk", flat=True)
+
+        if ids_to_remove:
+            self.topics.remove(*ids_to_remove)
+        if ids_to_add:
+            self.topics.add(*ids_to_add)
+
+    def get_cache_tags(self):
+        """
+        If used with CacheTagsMixin, changes to this object also affect the
+        cached pages, and diary references, of the Topics it refers to.
+        """
+        tags = super().get_cache_tags()
+        topic_model = self.topics.model
+        for pk in self.topics.values_list("pk", flat=True):
+            tags |= {
+                make_cache_tag(topic_model, pk),
+                topic_model.make_references_cache_tag(pk),
+            }
+        return tags
@@ -0,0 +1,315 @@
+import time
+from contextlib import contextmanager
+from operator import itemgetter
+
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db.models import Value
+from django.utils.html import strip_tags
+
+from pepysdiary.annotations.models import Annotation
+from pepysdiary.common.utilities import smart_truncate
+
+# The Recent Activity store.
+#
+# For each kind of object that can be commented on we keep a list of the
+# objects most recently commented on, with details of each one's latest
+# visible Annotation, in the cache. The lists are updated as Annotations are
+# posted, hidden, removed, edited or deleted, and as the objects are changed
+# (see annotations.signals and common.signals). So reading them doesn't
+# query the database. Any list that isn't in the cache is made afresh.
+
+# Each kind of object, and its model, in the order the Recent Activity page
+# lists them:
+KINDS = {
+    "entries": "diary.Entry",
+    "topics": "encyclopedia.Topic",
+    "letters": "letters.Letter",
+    "articles": "indepth.Article",
+    "posts": "news.Post",
+}
+
+# How many objects of each kind are kept:
+ACTIVITY_LENGTH = 10
+
+# How long each list is kept in the cache, in seconds. They should always be
+# up to date, but this limits how long any missed update could last.
+ACTIVITY_TIMEOUT = 60 * 60 * 24
+
+# How long, in seconds, a process can hold the lock on a list while changing
+# it, and how long another process waits for that lock before giving up.
+LOCK_TIMEOUT = 10
+LOCK_WAIT = 1
+
+CACHE_KEY_PREFIX = "common:recent_activity"
+
+
+def get_kind(model):
+    "Returns the kind, e.g. 'entries', of a model class, or None if it has none."
+    for kind, label in KINDS.items():
+        if model._meta.label == label:
+            return kind
+    return None
+
+
+def get_activity(*kinds):
+    """
+    Returns a dict mapping each of these kinds (default: all of them) to its
+    list of most recently-commented-on objects, newest first, each one a
+    dict like:
+
+        {
+            "content_type_id": 12,
+            "object_pk": "123",
+            "obj_title": "Monday 2 January 1659/60",
+            "annotation_id": 456,
+            "submit_date": datetime(2021, 4, 10, 1, 0, tzinfo=timezone.utc),
+            "text": "The start of the comment...",
+            "url": "/cr/12/123/#c456",
+            "user_name": "Bob Smith",
+        }
+
+    Reads all the lists from the cache at once. Any that aren't cached are
+    made with rebuild_activity().
+    """
+    kinds = kinds or tuple(KINDS)
+    keys = {_make_cache_key(kind): kind for kind in kinds}
+    activity = {keys[key]: rows for key, rows in cache.get_many(keys).items()}
+
+    missing = [kind for kind in kinds if kind not in activity]
+    if missing:
+        activity.update(rebuild_activity(*missing))
+
+    return {kind: activity[kind] for kind in kinds}
+
+
+def rebuild_activity(*kinds):
+    """
+    Makes the lists of these kinds (default: all of them) from the database,
+    stores them, and returns a dict mapping each kind to its list.
+
+    However many kinds there are, this makes one query for all the objects,
+    and one for their latest Annotations.
+    """
+    kinds = kinds or tuple(KINDS)
+    models = {apps.get_model(KINDS[kind]): kind for kind in kinds}
+    content_types = ContentType.objects.get_for_models(*models)
+    kinds_by_content_type = {
+        content_types[model].pk: kind for model, kind in models.items()
+    }
+
+    querysets = [
+        model.objects.filter(last_comment_time__isnull=False)
+        .order_by("-last_comment_time")
+        .annotate(content_type_id=Value(content_types[model].pk))
+        .values_list("pk", "title", "last_comment_time", "content_type_id")[
+            :ACTIVITY_LENGTH
+        ]
+        for model in models
+    ]
+    # Each sliced queryset is a separate SELECT in the one query, so we
+    # have to put each kind's objects back in order:
+    objects = sorted(
+        querysets[0].union(*querysets[1:], all=True), key=itemgetter(2), reverse=True
+    )
+    annotations = Annotation.visible_objects.latest_for_objects(
+        (content_type_id, pk) for pk, _, _, content_type_id in objects
+    )
+
+    activity = {kind: [] for kind in kinds}
+    for pk, title, _, content_type_id in objects:
+        annotation = annotations.get((content_type_id, str(pk)))
+        if annotation is not None:
+            activity[kinds_by_content_type[content_type_id]].append(
+                _make_row(annotation, title)
+            )
+
+    _store_activity(activity)
+    return activity
+
+
+def add_annotation(annotation):
+    """
+    Adds a visible Annotation to the list for its kind of object, replacing
+    any older Annotation on the same object, if it's recent enough to be
+    included. Only queries the database to get the object's title (or if
+    the list isn't cached).
+
+    If another process is changing the list, and we can't get the lock on
+    it, the list is made afresh instead, which will include this Annotation.
+    """
+    kind = _get_content_type_kind(annotation.content_type_id)
+    if kind is None or not annotation.is_visible:
+        return
+
+    with _lock(kind) as locked:
+        if locked:
+            _add_annotation(annotation, kind)
+        else:
+            rebuild_activity(kind)
+
+
+def _add_annotation(annotation, kind):
+    "Does the work of add_annotation(), while holding the lock on the list."
+    rows = get_activity(kind)[kind]
+    if (
+        len(rows) >= ACTIVITY_LENGTH
+        and annotation.submit_date <= rows[-1]["submit_date"]
+    ):
+        return
+
+    object_pk = str(annotation.object_pk)
+    for row in rows:
+        if row["object_pk"] != object_pk:
+            continue
+        if row["submit_date"] >= annotation.submit_date:
+            # This object is already listed, with this or a newer Annotation.
+            return
+
+    rows = [row for row in rows if row["object_pk"] != object_pk]
+    rows.append(_make_row(annotation, annotation.content_object.title))
+    rows.sort(key=itemgetter("submit_date"), reverse=True)
+    _store_activity({kind: rows[:ACTIVITY_LENGTH]})
+
+
+def update_for_annotation(annotation, *, created, previous_content_type_id=None):
+    """
+    Called after an Annotation has been saved.
+
+    If it was already listed, the list is made afresh, as it might have been
+    hidden, removed, edited or moved to another object. Then, if it's
+    visible, it's added to its list, if recent enough.
+
+    previous_content_type_id is that of the object the Annotation was on
+    before this save, if any, in case it's been moved to another kind of
+    object.
+    """
+    if not created:
+        kinds = {
+            _get_content_type_kind(content_type_id)
+            for content_type_id in (
+                annotation.content_type_id,
+                previous_content_type_id,
+            )
+            if content_type_id is not None
+        }
+        _rebuild_if_listed(annotation.pk, kinds - {None})
+
+    add_annotation(annotation)
+
+
+def update_for_deleted_annotation(annotation_id, content_type_id):
+    """
+    Called after an Annotation is deleted. Remakes its list if it was listed.
+    Takes IDs because a deleted Annotation's pk is None.
+    """
+    kind = _get_content_type_kind(content_type_id)
+    if kind is not None:
+        _rebuild_if_listed(annotation_id, {kind})
+
+
+def update_for_object(obj):
+    """
+    Called after an object that might be listed, e.g. an Entry, is saved.
+    If it's listed, its title is updated.
+    """
+    kind = get_kind(type(obj))
+    if kind is None:
+        return
+
+    with _lock(kind) as locked:
+        if not locked:
+            rebuild_activity(kind)
+            return
+        cached = cache.get(_make_cache_key(kind))
+        if cached is None:
+            return
+
+        object_pk = str(obj.pk)
+        for row in cached:
+            if row["object_pk"] == object_pk and row["obj_title"] != obj.title:
+                row["obj_title"] = obj.title
+                _store_activity({kind: cached})
+                return
+
+
+def update_for_deleted_object(model, pk):
+    """
+    Called after an object that might be listed, e.g. an Entry, is deleted.
+    If it was listed, its list is made afresh. Takes the model and pk because
+    a deleted object's pk is None.
+    """
+    kind = get_kind(model)
+    if kind is None:
+        return
+    cached = cache.get(_make_cache_key(kind))
+    if cached is not None and any(row["object_pk"] == str(pk) for row in cached):
+        rebuild_activity(kind)
+
+
+def _rebuild_if_listed(annotation_id, kinds):
+    "Remakes the lists of any of these kinds that include the Annotation."
+    keys = {_make_cache_key(kind): kind for kind in kinds}
+    listed = [
+        keys[key]
+        for key, rows in cache.get_many(keys).items()
+        if any(row["annotation_id"] == annotation_id for row in rows)
+    ]
+    if listed:
+        rebuild_activity(*listed)
+
+
+@contextmanager
+def _lock(kind):
+    """
+    Holds the lock on the list of this kind while it's read, changed and
+    stored, so that two processes changing it at once don't lose one of
+    the changes. Like the lock in common.caching's cache_page_swr().
+
+    Yields False if another process held the lock for longer than LOCK_WAIT
+    seconds.
+    """
+    lock_key = f"{_make_cache_key(kind)}:lock"
+    deadline = time.monotonic() + LOCK_WAIT
+    while not cache.add(lock_key, value=True, timeout=LOCK_TIMEOUT):
+        if time.monotonic() >= deadline:
+            yield False
+            return
+        time.sleep(0.05)
+    try:
+        yield True
+    finally:
+        cache.delete(lock_key)
+
+
+def _get_content_type_kind(content_type_id):
+    "Returns the kind of object with this content type, or None."
+    model = ContentType.objects.get_for_id(content_type_id).model_class()
+    return None if model is None else get_kind(model)
+
+
+def _make_row(annotation, title):
+    "Returns the dict about an Annotation, and its object, that lists contain."
+    return {
+        "content_type_id": annotation.content_type_id,
+        "object_pk": str(annotation.object_pk),
+        "obj_title": title,
+        "annotation_id": annotation.pk,
+        "submit_date": annotation.submit_date,
+        "text": strip_tags(smart_truncate(annotation.comment, 70)),
+        "url": annotation.get_absolute_url(),
+        "user_name": strip_tags(annotation.get_user_name()),
+    }
+
+
+def _make_cache_key(kind):
+    return f"{CACHE_KEY_PREFIX}:{kind}"
+
+
+def _store_activity(activity):
+    "Stores lists in the cache. activity is a dict of kind: list."
+    cache.set_many(
+        {_make_cache_key(kind): rows for kind, rows in activity.items()},
+        ACTIVITY_TIMEOUT,
+    )
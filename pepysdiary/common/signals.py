@@ -1,32 +1,70 @@
+import logging
 import operator
+from collections import Counter
 from functools import reduce
 
 from django.contrib.postgres.search import SearchVector
+from django.core.signals import request_finished, request_started
 from django.db import transaction
 from django.db.models import TextField, Value
-from django.db.models.signals import post_save
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.dispatch import receiver
 
+from pepysdiary.common import memory_index, recent_activity
+from pepysdiary.common.caching import invalidate_cache_tags
+from pepysdiary.common.models import CacheTagsMixin
+
+logger = logging.getLogger(__name__)
+
 # Signals for models from all apps that have search indexes.
 
 # All this inspired by
 # https://github.com/simonw/simonwillisonblog/blob/master/blog/signals.py
 
+# Counts of how many times, in this process, we've updated an object's
+# search_document after it was saved ("updated"), and how many times we didn't
+# because its index components hadn't changed ("skipped").
+reindex_counts = Counter()
+
 
 @receiver(post_save)
 def on_save(sender, **kwargs):
     """Only do something if this object has a search_document property
     and an index_components() method.
+
+    If the object uses SearchDocumentMixin, and this isn't a new object, we
+    only update its search_document if its index components have changed.
     """
     obj = kwargs["instance"]
     if (
-        not hasattr(obj, "search_document")
+        # Check the class, as getting a deferred search_document would query:
+        not hasattr(sender, "search_document")
         or not hasattr(obj, "index_components")
         or not callable(obj.index_components)
     ):
         return
+
+    # The search_document is only set by make_updater()'s UPDATE. Deferring it
+    # on this object means later saves of it leave it out, instead of writing
+    # its old value over the new index. (Django only saves the loaded fields
+    # of an object that has deferred fields.)
+    obj.__dict__.pop("search_document", None)
+
+    if (
+        not kwargs.get("created", False)
+        and hasattr(obj, "index_components_changed")
+        and not obj.index_components_changed()
+    ):
+        reindex_counts["skipped"] += 1
+        logger.debug("Skipped re-indexing unchanged %s %s", sender.__name__, obj.pk)
+        return
+
+    reindex_counts["updated"] += 1
     transaction.on_commit(make_updater(kwargs["instance"]))
 
+    if hasattr(obj, "remember_index_components"):
+        obj.remember_index_components()
+
 
 def make_updater(instance):
     """Updates the search index for an object.
@@ -35,18 +73,97 @@ def make_updater(instance):
 
     def index_components(self):
         return ((self.title, "A"), (self.body, "B"))
+
+    If the object's class has a get_search_vector() method (e.g. from
+    SearchDocumentMixin) we use that to make the search_document from the
+    values already in the database, rather than sending them all again.
     """
-    components = instance.index_components()
     pk = instance.pk
 
-    def on_commit():
+    if hasattr(instance.__class__, "get_search_vector"):
+        search_vector = instance.__class__.get_search_vector()
+    else:
         search_vectors = []
-        for text, weight in components:
+        for text, weight in instance.index_components():
             search_vectors.append(
                 SearchVector(Value(text, output_field=TextField()), weight=weight)
             )
-        instance.__class__.objects.filter(pk=pk).update(
-            search_document=reduce(operator.add, search_vectors)
-        )
+        search_vector = reduce(operator.add, search_vectors)
+
+    def on_commit():
+        instance.__class__.objects.filter(pk=pk).update(search_document=search_vector)
 
     return on_commit
+
+
+# Signals for models from all apps whose objects are displayed in cached views.
+# See common.caching.
+
+
+def expire_cache_tags(sender, instance, **kwargs):
+    """
+    When an object that uses CacheTagsMixin is saved or deleted, expire the
+    cached views that depend on it.
+
+    Connected to post_save and pre_delete for each of those models in
+    CommonConfig.ready(). We use pre_delete so that the object's
+    relationships (e.g. the Topics an Entry refers to) still exist when we get
+    its tags.
+    """
+    if kwargs.get("raw", False):
+        return
+    invalidate_cache_tags(instance.get_cache_tags())
+
+
+@receiver(m2m_changed)
+def expire_m2m_cache_tags(sender, instance, action, model, pk_set, **kwargs):
+    """
+    When objects are added to or removed from a ManyToMany relationship,
+    e.g. an Entry's Topics, expire the cached views that depend on the
+    objects on both sides.
+    """
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+
+    tags = set()
+    if isinstance(instance, CacheTagsMixin):
+        tags |= instance.get_cache_tags()
+    if pk_set and issubclass(model, CacheTagsMixin):
+        for obj in model._base_manager.filter(pk__in=pk_set):
+            tags |= obj.get_cache_tags()
+    invalidate_cache_tags(tags)
+
+
+# Signals for models from all apps whose objects can be listed on the Recent
+# Activity page. See common.recent_activity.
+
+
+def update_recent_activity(sender, instance, **kwargs):
+    """
+    When an object that could be in the Recent Activity lists, e.g. an Entry,
+    is saved or deleted, update its title in the lists, or remove it.
+
+    Connected to post_save and post_delete for each model in
+    recent_activity.KINDS in CommonConfig.ready().
+    """
+    if kwargs.get("raw", False):
+        return
+    if kwargs["signal"] is post_delete:
+        # Django sets instance.pk to None after deleting it:
+        pk = instance.pk
+        transaction.on_commit(
+            lambda: recent_activity.update_for_deleted_object(sender, pk)
+        )
+    else:
+        transaction.on_commit(lambda: recent_activity.update_for_object(instance))
+
+
+@receiver(request_started)
+def start_request(sender, **kwargs):
+    "So in-memory indexes only check they're up to date once per request."
+    memory_index.request_started()
+
+
+@receiver(request_finished)
+def finish_request(sender, **kwargs):
+    memory_index.request_finished()
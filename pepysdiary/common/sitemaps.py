@@ -2,7 +2,8 @@ from django.contrib.sitemaps import Sitemap
 from django.urls import reverse_lazy
 
 from pepysdiary.diary.models import Entry
-from pepysdiary.encyclopedia.models import Category, Topic
+from pepysdiary.encyclopedia.category_tree import category_tree
+from pepysdiary.encyclopedia.models import Topic
 from pepysdiary.indepth.models import Article
 from pepysdiary.letters.models import Letter
 from pepysdiary.news.models import Post
@@ -162,7 +163,7 @@ class ArchiveSitemap(Sitemap):
 
     def _encyclopedia_categories_sitemaps(self):
         sitemaps = []
-        for c in Category.objects.all():
+        for c in category_tree.get_categories():
             sitemap_class = AbstractSitemapClass()
             sitemap_class.url = c.get_absolute_url()
             sitemaps.append(sitemap_class)
@@ -0,0 +1,99 @@
+import hashlib
+
+from django import template
+from django.contrib.auth.context_processors import PermWrapper
+from django.contrib.auth.models import AnonymousUser
+from django_comments.templatetags.comments import RenderCommentListNode
+
+from pepysdiary.common.caching import (
+    get_cache_tag_versions,
+    get_or_render_fragment,
+    make_cache_tag,
+)
+from pepysdiary.common.context_processors import date_formats
+
+register = template.Library()
+
+# How long a rendered list of comments is cached for, in seconds.
+# The cache key changes whenever the comments change, but not when a
+# commenter's account does (e.g. if it's deactivated) so this limits how long
+# that can be out of date.
+COMMENT_LIST_TIMEOUT = 60 * 60 * 24
+
+
+class CachedCommentListNode(RenderCommentListNode):
+    """
+    Renders the list of comments like django_comments' render_comment_list,
+    but without the comment form, and caches the HTML.
+    """
+
+    @classmethod
+    def handle_token(cls, parser, token):
+        tokens = token.split_contents()
+        if len(tokens) != 3 or tokens[1] != "for":
+            msg = f"{tokens[0]!r} tag should be like {{% {tokens[0]} for object %}}"
+            raise template.TemplateSyntaxError(msg)
+        return cls(object_expr=parser.compile_filter(tokens[2]))
+
+    def render(self, context):
+        try:
+            obj = self.object_expr.resolve(context)
+        except template.VariableDoesNotExist:
+            return ""
+        return get_or_render_fragment(
+            get_comment_list_cache_key(context, obj),
+            lambda: self.render_comment_list(context),
+            COMMENT_LIST_TIMEOUT,
+        )
+
+    def render_comment_list(self, context):
+        """
+        Renders the list, providing what comments/list.html needs from the
+        context processors, so the tag works, and matches its cache key,
+        whatever the context has.
+        """
+        user = context.get("user") or AnonymousUser()
+        with context.push(
+            only_comments=True,
+            date_format_mid=date_formats(context.get("request"))["date_format_mid"],
+            perms=PermWrapper(user),
+        ):
+            return super().render(context)
+
+
+def get_comment_list_cache_key(context, obj):
+    """
+    Returns the key for caching the list of comments on obj (e.g. an Entry).
+
+    It changes whenever obj's comment count or last comment time changes, or
+    when any of its comments are saved or deleted (e.g. hidden by a
+    moderator), as that changes the version of obj's cache tag (see
+    Annotation.get_cache_tags()).
+
+    It also varies with the parts of the template that depend on who's
+    viewing it.
+    """
+    tag = make_cache_tag(obj._meta.model, obj.get_cache_tag_key())
+    user = context.get("user")
+    parts = (
+        obj.comment_count,
+        obj.last_comment_time.isoformat() if obj.last_comment_time else "",
+        get_cache_tag_versions([tag])[tag],
+        bool(user and user.is_authenticated),
+        bool(user and user.has_perm("annotation.can_edit")),
+        context.get("show_section_title") is not False,
+    )
+    value = ";".join(str(part) for part in parts)
+    digest = hashlib.md5(value.encode(), usedforsecurity=False).hexdigest()
+    return f"common:comment_list:{tag}:{digest}"
+
+
+@register.tag
+def render_cached_comment_list(parser, token):
+    """
+    Renders the list of comments on an object, without the comment form,
+    caching the HTML until the comments change. Syntax:
+
+        {% render_cached_comment_list for [object] %}
+    """
+    return CachedCommentListNode.handle_token(parser, token)
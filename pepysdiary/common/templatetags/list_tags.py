@@ -1,11 +1,8 @@
 import calendar
 
 from django import template
-from django.contrib.contenttypes.models import ContentType
-from django.utils.html import strip_tags
 
-from pepysdiary.annotations.models import Annotation
-from pepysdiary.common.utilities import smart_truncate
+from pepysdiary.common.recent_activity import get_activity, get_kind
 from pepysdiary.diary.models import Entry
 from pepysdiary.encyclopedia.models import Topic
 from pepysdiary.indepth.models import Article
@@ -15,45 +12,81 @@ from pepysdiary.news.models import Post
 register = template.Library()
 
 
-def _commented_objects_list(context, title, quantity, model_class):
+def _format_comments(context, rows):
     """
-    Passed a queryset of Entries, Topics, Articles, etc, it returns the context
-    data for use with the common/inc/commented_objects_list.html template.
+    Passed a list of rows from common.recent_activity, returns a list of
+    dicts for use with the common/inc/commented_objects_list.html template.
     """
     # Defaults, just in case we don't have these set in context:
     date_format = context.get("date_format_mid_strftime", "%d %b %Y")
     time_format = context.get("time_format_strftime", "%I:%M%p")
 
-    queryset = model_class.objects.filter(last_comment_time__isnull=False).order_by(
-        "-last_comment_time"
-    )[:quantity]
-    if queryset:
-        template_context = {"comments": [], "title": title}
-        ct = ContentType.objects.get_for_model(queryset[0])
-        for obj in queryset:
-            comment = Annotation.visible_objects.filter(
-                object_pk=obj.pk, content_type_id=ct.id
-            ).latest("submit_date")
-
-            template_context["comments"].append(
-                {
-                    "data_time": calendar.timegm(comment.submit_date.timetuple()),
-                    "date": comment.submit_date.strftime(date_format).lstrip("0"),
-                    "iso_datetime": comment.submit_date.strftime("%Y-%m-%dT%H:%M:%S%z"),
-                    "obj_title": obj.title,
-                    "time": comment.submit_date.strftime(time_format)
-                    .lstrip("0")
-                    .lower(),
-                    "text": strip_tags(smart_truncate(comment.comment, 70)),
-                    "url": comment.get_absolute_url(),
-                    "user_name": strip_tags(comment.get_user_name()),
-                }
-            )
-        return template_context
+    return [
+        {
+            "data_time": calendar.timegm(row["submit_date"].timetuple()),
+            "date": row["submit_date"].strftime(date_format).lstrip("0"),
+            "iso_datetime": row["submit_date"].strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "obj_title": row["obj_title"],
+            "time": row["submit_date"].strftime(time_format).lstrip("0").lower(),
+            "text": row["text"],
+            "url": row["url"],
+            "user_name": row["user_name"],
+        }
+        for row in rows
+    ]
+
+
+def _commented_objects_list(context, title, quantity, model_class):
+    """
+    Returns the context data for use with the
+    common/inc/commented_objects_list.html template, listing the most
+    recently-commented-on objects of model_class, from the Recent Activity
+    store (see common.recent_activity). Or None if there are none.
+    """
+    kind = get_kind(model_class)
+    rows = get_activity(kind)[kind][:quantity]
+    if rows:
+        return {"comments": _format_comments(context, rows), "title": title}
     else:
         return None
 
 
+@register.simple_tag(takes_context=True)
+def latest_commented_lists(
+    context, entries=0, letters=0, topics=0, articles=0, posts=0
+):
+    """
+    Gets the lists of the most recently-commented-on Diary Entries, Letters,
+    Topics, In-Depth Articles and Site News Posts, with how many of each to
+    get, all at once from the Recent Activity store (see
+    common.recent_activity), which only keeps ACTIVITY_LENGTH of each.
+    Kinds with a quantity of 0 are left out.
+
+    Returns a dict with keys "entries", "letters", etc, each a list of dicts
+    to pass to the common/inc/commented_objects_list.html template, e.g.:
+
+        {% latest_commented_lists entries=10 topics=5 as lists %}
+        {% if lists.entries %}
+            {% include "common/inc/commented_objects_list.html" with title="Entries" comments=lists.entries %}
+        {% endif %}
+    """  # noqa: E501
+    quantities = {
+        "entries": entries,
+        "letters": letters,
+        "topics": topics,
+        "articles": articles,
+        "posts": posts,
+    }
+    quantities = {kind: quantity for kind, quantity in quantities.items() if quantity}
+    if not quantities:
+        return {}
+    activity = get_activity(*quantities)
+    return {
+        kind: _format_comments(context, activity[kind][:quantity])
+        for kind, quantity in quantities.items()
+    }
+
+
 @register.inclusion_tag("common/inc/commented_objects_list.html", takes_context=True)
 def latest_commented_entries(context, title, quantity=5):
     """
@@ -1,10 +1,19 @@
 from django.urls import path
 
-from pepysdiary.common.views import GoogleSearchView, HomeView, RecentView, SearchView
+from pepysdiary.common.views import (
+    CacheStatsView,
+    GoogleSearchView,
+    HomeView,
+    RecentActivityJSONView,
+    RecentView,
+    SearchView,
+)
 
 urlpatterns = [
     path("", HomeView.as_view(), name="home"),
     path("google-search/", GoogleSearchView.as_view(), name="google-search"),
     path("search/", SearchView.as_view(), name="search"),
     path("recent/", RecentView.as_view(), name="recent"),
+    path("recent/activity.json", RecentActivityJSONView.as_view(), name="recent_json"),
+    path("cache-stats/", CacheStatsView.as_view(), name="cache_stats"),
 ]
@@ -254,48 +254,6 @@ def is_leap_year(year):
     return year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)
 
 
-def expire_view_cache(
-    view_name, args=None, namespace=None, key_prefix=None, method="GET"
-):
-    """
-    This function allows you to invalidate any view-level cache.
-        view_name: view function you wish to invalidate or it's named url pattern
-        args: any arguments passed to the view function
-        namepace: optioal, if an application namespace is needed
-        key prefix: for the @cache_page decorator for the function (if any)
-
-        from: https://gist.github.com/1223933
-        which said:
-        from: http://stackoverflow.com/questions/2268417/expire-a-view-cache-in-django
-        added: method to request to get the key generating properly
-    """
-    from django.conf import settings
-    from django.core.cache import cache
-    from django.http import HttpRequest
-    from django.urls import reverse
-    from django.utils.cache import get_cache_key
-
-    if args is None:
-        args = []
-
-    # create a fake request object
-    request = HttpRequest()
-    request.method = method
-    if settings.USE_I18N:
-        request.LANGUAGE_CODE = settings.LANGUAGE_CODE
-    # Loookup the request path:
-    if namespace:
-        view_name = namespace + ":" + view_name
-    request.path = reverse(view_name, args=args)
-    # get cache key, expire if the cached item exists:
-    key = get_cache_key(request, key_prefix=key_prefix)
-    if key:
-        if cache.get(key):
-            cache.set(key, None, 0)
-        return True
-    return False
-
-
 def fix_old_links(text):
     """
     Fix any old-style internal links in a piece of text, changing to new
@@ -1,12 +1,27 @@
 from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
 from django.db.models import F
+from django.http import HttpResponse, JsonResponse
 from django.urls import reverse
-from django.views.decorators.cache import cache_page
-from django.views.generic import ListView, RedirectView
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.decorators import method_decorator
+from django.utils.http import quote_etag
+from django.views.decorators.cache import never_cache
+from django.views.generic import ListView, RedirectView, View
 from django.views.generic.base import TemplateView
 
 from pepysdiary.annotations.models import Annotation
+from pepysdiary.common.cache_stats import cache_stats, format_metrics
+from pepysdiary.common.caching import (
+    cache_page_swr,
+    fragment_cache_counts,
+    get_cache_tags_key_prefix,
+    make_cache_tag,
+    page_cache_counts,
+)
 from pepysdiary.common.paginator import DiggPaginator
+from pepysdiary.common.recent_activity import get_activity
 from pepysdiary.diary.models import Entry
 from pepysdiary.encyclopedia.models import Topic
 from pepysdiary.indepth.models import Article
@@ -18,15 +33,58 @@ class CacheMixin:
     """
     Add this mixin to a class-based view to specify caching.
     Set the cache_timeout on the view to change the timeout.
+
+    After the timeout the stale page is still served for cache_stale_timeout
+    seconds (default: settings.PEPYS_CACHE_STALE_TIMEOUT) while a single
+    request regenerates it. See common.caching.cache_page_swr().
+
+    Set cache_tags, or override get_cache_tags(), to list the tags of the
+    things the view depends on, e.g. make_cache_tag(Entry) for any Entries.
+    When any of those things are saved or deleted the cached view expires.
+    See common.caching.
+
+    Set cache_anonymous_only to True to not cache pages for logged-in users,
+    e.g. on pages with comment forms, which expire after a couple of hours.
     """
 
     cache_timeout = 60
 
+    cache_stale_timeout = None
+
+    cache_tags = ()
+
+    cache_anonymous_only = False
+
     def get_cache_timeout(self):
         return self.cache_timeout
 
+    def get_cache_tags(self):
+        return self.cache_tags
+
     def dispatch(self, *args, **kwargs):
-        return cache_page(self.get_cache_timeout())(super().dispatch)(*args, **kwargs)
+        user = getattr(self.request, "user", None)
+        if self.cache_anonymous_only and user and user.is_authenticated:
+            return super().dispatch(*args, **kwargs)
+        key_prefix = get_cache_tags_key_prefix(self.get_cache_tags())
+        return cache_page_swr(
+            self.get_cache_timeout(),
+            stale_timeout=self.cache_stale_timeout,
+            key_prefix=key_prefix,
+        )(super().dispatch)(*args, **kwargs)
+
+
+class PublicationCacheMixin(CacheMixin):
+    """
+    Like CacheMixin but the cache expires at the moment the next Diary Entry
+    is 'published'. For views whose content depends on
+    Entry.objects.most_recent_entry_date(), which only changes then.
+    Stale pages are never served.
+    """
+
+    cache_stale_timeout = 0
+
+    def get_cache_timeout(self):
+        return Entry.objects.seconds_until_next_publication()
 
 
 class PaginatedListView(ListView):
@@ -65,20 +123,88 @@ class PaginatedListView(ListView):
         )
 
 
-class HomeView(TemplateView):
+class BaseTooltipsView(View):
+    """
+    Base for views that return, as JSON, the data for the tooltips of the
+    Topics that some Entries or Letters refer to (see
+    ReferredManagerMixin.get_brief_references()).
+
+    Pages load it from a separate URL (see get_tooltips_url()) so that
+    browsers and CDNs can cache it apart from the pages' HTML.
+
+    The ETag is the version of the references (see
+    ReferredManagerMixin.get_references_version()) so unchanged data is
+    revalidated with a 304. If the "v" in the query string is the current
+    version, as in the URLs from get_tooltips_url(), the response can be
+    cached for versioned_cache_timeout, because the URL will change when
+    the data does. Otherwise it must be revalidated every time.
+
+    Subclasses should set model and define get_objects().
+    """
+
+    model = None
+
+    versioned_cache_timeout = 60 * 60 * 24 * 365
+
+    def get_objects(self):
+        "Returns the Entries or Letters. Should raise Http404 if there are none."
+        msg = "Subclasses of BaseTooltipsView should define get_objects()"
+        raise NotImplementedError(msg)
+
+    def get(self, request, *args, **kwargs):
+        objects = list(self.get_objects())
+        version = self.model.objects.get_references_version(objects)
+        etag = quote_etag(version)
+
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = JsonResponse(self.model.objects.get_brief_references(objects))
+        response.headers["ETag"] = etag
+
+        if request.GET.get("v") == version:
+            patch_cache_control(
+                response, public=True, max_age=self.versioned_cache_timeout
+            )
+        else:
+            patch_cache_control(response, public=True, max_age=0)
+        return response
+
+
+def get_tooltips_url(path, model, objects):
+    """
+    Returns the URL of a BaseTooltipsView for these Entries or Letters
+    (which should be of the model), including the current version of their
+    references, so that the URL changes when the tooltips' data does.
+    e.g. "/diary/1661/01/02/tooltips.json?v=0f3e..."
+    """
+    return f"{path}?v={model.objects.get_references_version(objects)}"
+
+
+class HomeView(PublicationCacheMixin, TemplateView):
     """Front page of the whole site."""
 
     template_name = "common/home.html"
 
+    # The Entries, with their numbers of annotations, and the latest Posts
+    # and Articles:
+    cache_tags = (
+        make_cache_tag(Entry),
+        make_cache_tag(Annotation),
+        make_cache_tag(Post),
+        make_cache_tag(Article),
+    )
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
         # Show the most recent "published" entries:
         # If we change the number of Entries, the template will need tweaking
         # too...
-        context["entry_list"] = Entry.objects.filter(
-            diary_date__lte=Entry.objects.most_recent_entry_date()
-        ).order_by("-diary_date")[:8]
+        context["entry_list"] = (
+            Entry.objects.with_large_fields("text", "footnotes")
+            .filter(diary_date__lte=Entry.objects.most_recent_entry_date())
+            .order_by("-diary_date")[:8]
+        )
 
         context["tooltip_references"] = Entry.objects.get_brief_references(
             objects=context["entry_list"]
@@ -224,22 +350,171 @@ class SearchView(PaginatedListView):
             self.date_order_field = "date_published"
         elif kind == "t":
             self.model = Topic
-            self.queryset = Topic.objects
+            # search_summary() uses these fields:
+            self.queryset = Topic.objects.with_large_fields(
+                "summary_html", "wheatley_html", "wikipedia_html"
+            )
             self.date_order_field = "date_created"
             self.az_order_field = "order_title"
         else:
             # 'd' and default
             self.model = Entry
-            self.queryset = Entry.objects
+            # search_summary() uses these fields:
+            self.queryset = Entry.objects.with_large_fields("text", "footnotes")
             self.date_order_field = "diary_date"
 
 
 class RecentView(CacheMixin, TemplateView):
     """Recent Activity page."""
 
-    cache_timeout = 60 * 5
+    cache_timeout = 60 * 60
     template_name = "common/recent.html"
 
+    # The titles of all the kinds of objects in the lists:
+    cache_tags = (
+        make_cache_tag(Annotation),
+        make_cache_tag(Article),
+        make_cache_tag(Entry),
+        make_cache_tag(Letter),
+        make_cache_tag(Post),
+        make_cache_tag(Topic),
+    )
+
+
+class RecentActivityJSONView(View):
+    """
+    The same lists of recently-commented-on objects as the Recent Activity
+    page, as JSON. Read from the Recent Activity store (see
+    common.recent_activity), so usually without querying the database.
+    """
+
+    cache_max_age = 60
+
+    def get(self, request, *args, **kwargs):
+        activity = {
+            kind: [
+                {
+                    "title": row["obj_title"],
+                    "url": request.build_absolute_uri(row["url"]),
+                    "user_name": row["user_name"],
+                    "text": row["text"],
+                    "submit_date": row["submit_date"].isoformat(),
+                }
+                for row in rows
+            ]
+            for kind, rows in get_activity().items()
+        }
+        response = JsonResponse(activity)
+        patch_cache_control(response, public=True, max_age=self.cache_max_age)
+        return response
+
+
+@method_decorator(never_cache, name="dispatch")
+class CacheStatsView(View):
+    """
+    Staff-only. Shows the stats about cached pages recorded in this process
+    (see common.cache_stats), the counts of what happened to pages cached
+    with cache_page_swr() and fragments cached with get_or_render_fragment(),
+    and any stats from the cache backend itself (e.g. TwoTierRedisCache).
+
+    Returns Prometheus's text format, or JSON if ?format=json.
+    """
+
+    def get(self, request, *args, **kwargs):
+        if not request.user.is_staff:
+            raise PermissionDenied
+
+        stats = cache_stats.get_stats()
+        backend_stats = cache.get_stats() if hasattr(cache, "get_stats") else {}
+
+        if request.GET.get("format") == "json":
+            return JsonResponse(
+                {
+                    "enabled": cache_stats.enabled,
+                    "started": cache_stats.started,
+                    "urls": stats,
+                    "totals": cache_stats.get_totals(),
+                    "pages": dict(page_cache_counts),
+                    "fragments": dict(fragment_cache_counts),
+                    "backend": backend_stats,
+                }
+            )
+
+        def samples(field):
+            return [({"url_name": url}, counts[field]) for url, counts in stats.items()]
+
+        metrics = [
+            (
+                "pepys_cache_hits_total",
+                "counter",
+                "Pages served from the cache.",
+                samples("hits"),
+            ),
+            (
+                "pepys_cache_misses_total",
+                "counter",
+                "Pages not in the cache, or stale.",
+                samples("misses"),
+            ),
+            (
+                "pepys_cache_stores_total",
+                "counter",
+                "Pages stored in the cache.",
+                samples("stores"),
+            ),
+            (
+                "pepys_cache_stored_bytes_total",
+                "counter",
+                "Size of the content of pages stored in the cache.",
+                samples("bytes"),
+            ),
+            (
+                "pepys_cache_backend_calls_total",
+                "counter",
+                "Calls to the cache backend.",
+                samples("backend_calls"),
+            ),
+            (
+                "pepys_cache_backend_seconds_total",
+                "counter",
+                "Time spent in calls to the cache backend.",
+                samples("backend_seconds"),
+            ),
+            (
+                "pepys_cache_page_events_total",
+                "counter",
+                "What happened to requests for pages cached with cache_page_swr().",
+                [({"event": k}, v) for k, v in sorted(page_cache_counts.items())],
+            ),
+            (
+                "pepys_cache_fragment_events_total",
+                "counter",
+                "Template fragments served from the cache, or rendered.",
+                [
+                    ({"event": event}, fragment_cache_counts[event])
+                    for event in ("hit", "miss")
+                ],
+            ),
+            (
+                "pepys_cache_fragment_seconds_total",
+                "counter",
+                "Time spent rendering fragments, and the rendering time saved.",
+                [
+                    ({"kind": "rendered"}, fragment_cache_counts["render_seconds"]),
+                    ({"kind": "saved"}, fragment_cache_counts["saved_seconds"]),
+                ],
+            ),
+            (
+                "pepys_cache_backend_stats",
+                "gauge",
+                "Stats from the cache backend.",
+                [({"stat": k}, v) for k, v in sorted(backend_stats.items())],
+            ),
+        ]
+        return HttpResponse(
+            format_metrics(metrics), content_type="text/plain; version=0.0.4"
+        )
+
 
 # ALL THE REDIRECT VIEWS:
 
@@ -65,8 +65,10 @@ MIDDLEWARE = [
     # * LocaleMiddleware (adds Accept-Language)
     # Should go near top of the list:
     "django.middleware.security.SecurityMiddleware",
+    # Before UpdateCacheMiddleware, so its cookies aren't cached:
+    "pepysdiary.common.middleware.VisitTimeMiddleware",
     # Must be before those that modify the `Vary` header:
-    "django.middleware.cache.UpdateCacheMiddleware",
+    "pepysdiary.common.middleware.UpdateCacheMiddleware",
     # Before any middleware that may change or use the response body:
     "django.middleware.gzip.GZipMiddleware",
     # After GZipMiddleware and close to top:
@@ -80,9 +82,8 @@ MIDDLEWARE = [
     # After SessionMiddleware:
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
-    "pepysdiary.common.middleware.VisitTimeMiddleware",
     # Must be before those that modify the `Vary` header:
-    "django.middleware.cache.FetchFromCacheMiddleware",
+    "pepysdiary.common.middleware.FetchFromCacheMiddleware",
 ]
 
 ROOT_URLCONF = "pepysdiary.config.urls"
@@ -281,6 +282,20 @@ elif PEPYS_CACHE_TYPE == "redis" and REDIS_URL:
         }
     }
 
+elif PEPYS_CACHE_TYPE == "two-tier" and REDIS_URL:
+    # Redis, with a small in-memory cache in each thread in front of it.
+    # See common.cache_backends.TwoTierRedisCache.
+    CACHES = {
+        "default": {
+            "BACKEND": "pepysdiary.common.cache_backends.TwoTierRedisCache",
+            "LOCATION": REDIS_URL,
+            "OPTIONS": {
+                "L1_MAX_ENTRIES": int(os.getenv("PEPYS_CACHE_L1_MAX_ENTRIES", "1000")),
+                "L1_TIMEOUT": int(os.getenv("PEPYS_CACHE_L1_TIMEOUT", "30")),
+            },
+        }
+    }
+
 else:
     # Use dummy cache (ie, no caching)
     CACHES = {
@@ -292,6 +307,22 @@ else:
 # Seconds before expiring a cached item. None for never expiring.
 CACHES["default"]["TIMEOUT"] = 300
 
+# For views cached with common.caching.cache_page_swr():
+# Seconds after a cached page's timeout during which it's still served,
+# while one request regenerates it.
+PEPYS_CACHE_STALE_TIMEOUT = 60 * 60
+# Seconds before the lock held by the request regenerating a page expires.
+PEPYS_CACHE_LOCK_TIMEOUT = 30
+# Seconds that other requests wait for that request, if there's no stale page.
+PEPYS_CACHE_LOCK_WAIT = 5
+# Maximum seconds that browsers are told to cache a page for. Shorter than
+# the pages' own timeouts because browsers don't know when they expire early.
+PEPYS_CACHE_BROWSER_TIMEOUT = 60
+
+# Record hits, misses, etc of cached pages, viewable by staff at /cache-stats/
+# See common.cache_stats.
+PEPYS_CACHE_STATS = os.getenv("PEPYS_CACHE_STATS", default="False") == "True"
+
 
 if os.getenv("SENDGRID_USERNAME", default=""):
     EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
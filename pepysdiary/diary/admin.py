@@ -51,6 +51,10 @@ class EntryAdmin(admin.ModelAdmin):
         ),
     )
 
+    def get_queryset(self, request):
+        # The form edits these, which Entry.objects would otherwise defer.
+        return super().get_queryset(request).with_large_fields("text", "footnotes")
+
 
 admin.site.register(Entry, EntryAdmin)
 
@@ -7,3 +7,5 @@ class DiaryConfig(AppConfig):
 
     def ready(self):
         from pepysdiary.common import signals  # noqa: F401
+
+        from . import signals as diary_signals  # noqa: F401
@@ -0,0 +1,78 @@
+import bisect
+
+from pepysdiary.common.memory_index import MemoryIndex
+
+from .models import Entry
+
+
+class EntryDateIndex(MemoryIndex):
+    """
+    A sorted, in-memory list of the dates (plus pks and titles) of all the
+    Diary Entries, so we can find the next/previous Entries, and whether
+    there's an Entry on a date, without querying the database.
+
+    It's rebuilt the next time it's used after any Entry is saved or deleted
+    (see diary.signals and common.memory_index.MemoryIndex).
+
+    Note: changes made with QuerySet.update() etc won't change the version.
+
+    Usage:
+        from pepysdiary.diary.date_index import entry_date_index
+        entry_date_index.previous_entry(date)
+    """
+
+    cache_key = "diary:entry_date_index_version"
+
+    def build_index(self):
+        """
+        Returns a tuple of two lists:
+        * date objects, sorted.
+        * (pk, title) tuples, in the same order.
+        """
+        rows = Entry.objects.order_by("diary_date").values_list(
+            "diary_date", "pk", "title"
+        )
+        return ([row[0] for row in rows], [(row[1], row[2]) for row in rows])
+
+    def _make_entry(self, index, i):
+        """
+        Returns an unsaved Entry for position i in the index with only pk,
+        diary_date and title set, enough to use get_absolute_url() and
+        short_title.
+        """
+        dates, details = index
+        pk, title = details[i]
+        return Entry(pk=pk, diary_date=dates[i], title=title)
+
+    def contains(self, date):
+        "Is there an Entry for this date?"
+        dates = self._get_index()[0]
+        i = bisect.bisect_left(dates, date)
+        return i < len(dates) and dates[i] == date
+
+    def previous_date(self, date):
+        "The date of the latest Entry before this date, or None."
+        dates = self._get_index()[0]
+        i = bisect.bisect_left(dates, date)
+        return dates[i - 1] if i > 0 else None
+
+    def next_date(self, date):
+        "The date of the earliest Entry after this date, or None."
+        dates = self._get_index()[0]
+        i = bisect.bisect_right(dates, date)
+        return dates[i] if i < len(dates) else None
+
+    def previous_entry(self, date):
+        "A brief Entry object for the latest Entry before this date, or None."
+        index = self._get_index()
+        i = bisect.bisect_left(index[0], date)
+        return self._make_entry(index, i - 1) if i > 0 else None
+
+    def next_entry(self, date):
+        "A brief Entry object for the earliest Entry after this date, or None."
+        index = self._get_index()
+        i = bisect.bisect_right(index[0], date)
+        return self._make_entry(index, i) if i < len(index[0]) else None
+
+
+entry_date_index = EntryDateIndex()
@@ -1,3 +1,4 @@
+from pepysdiary.common.caching import cache_page_swr
 from pepysdiary.common.feeds import BaseRSSFeed
 
 from .models import Entry
@@ -7,10 +8,19 @@ class LatestEntriesFeed(BaseRSSFeed):
     title = "The Diary of Samuel Pepys"
     description = "Daily entries from the 17th century London diary"
 
+    def __call__(self, request, *args, **kwargs):
+        "Cache the feed until the next Entry is published."
+        timeout = Entry.objects.seconds_until_next_publication()
+        return cache_page_swr(timeout, stale_timeout=0)(super().__call__)(
+            request, *args, **kwargs
+        )
+
     def items(self):
-        return Entry.objects.filter(
-            diary_date__lte=Entry.objects.most_recent_entry_date()
-        ).order_by("-diary_date")[:5]
+        return (
+            Entry.objects.with_large_fields("text", "footnotes")
+            .filter(diary_date__lte=Entry.objects.most_recent_entry_date())
+            .order_by("-diary_date")[:5]
+        )
 
     def item_description(self, item):
         return self.make_item_description(item.text)
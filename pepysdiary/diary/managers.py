@@ -1,14 +1,15 @@
+import math
 from datetime import date, datetime, timedelta, timezone
 from zoneinfo import ZoneInfo
 
 from django.conf import settings
 from django.db import models
 
-from pepysdiary.common.managers import ReferredManagerMixin
+from pepysdiary.common.managers import LargeFieldsManagerMixin, ReferredManagerMixin
 from pepysdiary.common.utilities import is_leap_year
 
 
-class EntryManager(models.Manager, ReferredManagerMixin):
+class EntryManager(LargeFieldsManagerMixin, models.Manager, ReferredManagerMixin):
     def most_recent_entry_date(self):
         """
         Returns the date of the most recent diary entry 'published'.
@@ -34,6 +35,31 @@ class EntryManager(models.Manager, ReferredManagerMixin):
 
         return date(entry_year, entry_month, entry_day)
 
+    def next_publication_time(self):
+        """
+        Returns the datetime at which most_recent_entry_date() will next
+        change, i.e. when the next Entry will be 'published'.
+
+        This is always the next 23:00, using the same clock as
+        most_recent_entry_date() and Entry.date_published, so that anything
+        cached until then expires at the moment a new Entry appears.
+        """
+        time_now = datetime.now(tz=timezone.utc)
+        publication_time = time_now.replace(hour=23, minute=0, second=0, microsecond=0)
+        if time_now >= publication_time:
+            publication_time = publication_time + timedelta(days=1)
+        return publication_time
+
+    def seconds_until_next_publication(self):
+        """
+        Returns the number of seconds (an int, at least 1) until
+        next_publication_time(). Handy for cache timeouts.
+        """
+        seconds = (
+            self.next_publication_time() - datetime.now(tz=timezone.utc)
+        ).total_seconds()
+        return max(1, math.ceil(seconds))
+
     def all_years_months(self, month_format="b"):
         """
         The years and months for which there are diary entries.
@@ -10,13 +10,21 @@ from django.urls import reverse
 from django_comments.moderation import CommentModerator, moderator
 from markdown import markdown
 
-from pepysdiary.common.models import OldDateMixin, PepysModel
-from pepysdiary.encyclopedia.models import Topic
+from pepysdiary.common.caching import make_cache_tag
+from pepysdiary.common.models import (
+    CacheTagsMixin,
+    OldDateMixin,
+    PepysModel,
+    SearchDocumentMixin,
+    TopicReferencesMixin,
+)
 
 from .managers import EntryManager
 
 
-class Entry(PepysModel, OldDateMixin):
+class Entry(
+    SearchDocumentMixin, TopicReferencesMixin, CacheTagsMixin, PepysModel, OldDateMixin
+):
     title = models.CharField(max_length=100, blank=False, null=False)
     diary_date = models.DateField(blank=False, null=False, unique=True)
     text = models.TextField(
@@ -29,9 +37,15 @@ class Entry(PepysModel, OldDateMixin):
     last_comment_time = models.DateTimeField(blank=True, null=True)
     allow_comments = models.BooleanField(blank=False, null=False, default=True)
 
-    # Also see index_components() method.
+    # The fields, and their weights, used to make the search_document.
+    # See SearchDocumentMixin.
+    search_fields = (("title", "A"), ("text", "B"), ("footnotes", "C"))
     search_document = SearchVectorField(null=True)
 
+    # Fields that Entry.objects defers unless asked for them.
+    # See LargeFieldsManagerMixin.
+    large_fields = ("text", "footnotes", "search_document")
+
     # Will also have a 'topics' ManyToMany field, from Topic.
 
     comment_name = "annotation"
@@ -49,7 +63,23 @@ class Entry(PepysModel, OldDateMixin):
 
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
-        self._make_references()
+        self.make_references()
+
+    def get_cache_tag_key(self):
+        "Entries are identified by their date in URLs, e.g. '1661-01-02'."
+        return self.diary_date.isoformat()
+
+    def get_cache_tags(self):
+        "Also expire the cached views of this Entry's month, e.g. '1661-01'."
+        tags = super().get_cache_tags()
+        return tags | {self._get_month_cache_tag()}
+
+    def get_comment_cache_tags(self):
+        "The month's views show each Entry's number of annotations."
+        return super().get_comment_cache_tags() | {self._get_month_cache_tag()}
+
+    def _get_month_cache_tag(self):
+        return make_cache_tag(Entry, self.diary_date.isoformat()[:7])
 
     def get_absolute_url(self):
         return reverse(
@@ -57,12 +87,6 @@ class Entry(PepysModel, OldDateMixin):
             kwargs={"year": self.year, "month": self.month, "day": self.day},
         )
 
-    def index_components(self):
-        """Used by common.signals.on_save() to update the SearchVector on
-        self.search_document.
-        """
-        return ((self.title, "A"), (self.text, "B"), (self.footnotes, "C"))
-
     @property
     def date_published(self):
         """The modern-day datetime this item would be published."""
@@ -129,26 +153,6 @@ class Entry(PepysModel, OldDateMixin):
         else:
             return ""
 
-    def _make_references(self):
-        """
-        Sets all the Encyclopedia Topics the text of this entry (and footnotes)
-        refers to. Saves them to the database.
-        """
-        self.topics.clear()
-        # Get a list of all the Topic IDs mentioned in text and footnotes:
-        ids = re.findall(
-            r"pepysdiary.com\/encyclopedia\/(\d+)\/", f"{self.text} {self.footnotes}"
-        )
-        # Make sure list of Topic IDs is unique:
-        # From http://stackoverflow.com/a/480227/250962
-        seen = set()
-        seen_add = seen.add
-        unique_ids = [id for id in ids if id not in seen and not seen_add(id)]
-
-        for id in unique_ids:
-            topic = Topic.objects.get(pk=id)
-            topic.diary_references.add(self)
-
 
 class EntryModerator(CommentModerator):
     email_notification = False
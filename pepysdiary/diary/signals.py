@@ -0,0 +1,15 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .date_index import entry_date_index
+from .models import Entry
+
+
+@receiver(post_save, sender=Entry)
+@receiver(post_delete, sender=Entry)
+def entry_changed(sender, instance, **kwargs):
+    """
+    When an Entry is added, changed or deleted, the in-memory index of
+    Entry dates needs rebuilding.
+    """
+    entry_date_index.invalidate()
@@ -5,6 +5,8 @@ from .views import (
     EntryArchiveIndexView,
     EntryDetailView,
     EntryMonthArchiveView,
+    EntryMonthTooltipsView,
+    EntryTooltipsView,
     SummaryYearArchiveView,
 )
 
@@ -16,11 +18,21 @@ urlpatterns = [
         EntryDetailView.as_view(),
         name="entry_detail",
     ),
+    re_path(
+        r"^(?P<year>[0-9]{4})/(?P<month>[0-9]{2})/(?P<day>[0-9]{2})/tooltips\.json$",
+        EntryTooltipsView.as_view(),
+        name="entry_tooltips",
+    ),
     re_path(
         r"^(?P<year>[0-9]{4})/(?P<month>[0-9]{2})/$",
         EntryMonthArchiveView.as_view(),
         name="entry_month_archive",
     ),
+    re_path(
+        r"^(?P<year>[0-9]{4})/(?P<month>[0-9]{2})/tooltips\.json$",
+        EntryMonthTooltipsView.as_view(),
+        name="entry_month_tooltips",
+    ),
     path("", EntryArchiveIndexView.as_view(), name="entry_archive"),
     re_path(
         r"^summary/(?P<year>[0-9]{4})/$",
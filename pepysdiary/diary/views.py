@@ -1,6 +1,8 @@
+import calendar
 from datetime import datetime, timezone
 
 from django.http import Http404
+from django.urls import reverse
 from django.utils.translation import gettext as _
 from django.views.generic.dates import (
     ArchiveIndexView,
@@ -9,6 +11,10 @@ from django.views.generic.dates import (
     YearArchiveView,
 )
 
+from pepysdiary.common.caching import make_cache_tag
+from pepysdiary.common.views import BaseTooltipsView, CacheMixin, get_tooltips_url
+
+from .date_index import entry_date_index
 from .models import Entry, Summary
 
 
@@ -45,12 +51,22 @@ class EntryMixin:
     day_format = "%d"
 
 
-class EntryDetailView(EntryMixin, DateDetailView):
+class EntryDetailView(CacheMixin, EntryMixin, DateDetailView):
     """
     Display a single entry based on the year/month/day in the URL.
     Assumes there is only one entry per date.
     """
 
+    cache_timeout = 60 * 60 * 24
+    cache_anonymous_only = True
+
+    def get_cache_tags(self):
+        date = "{year}-{month}-{day}".format(**self.kwargs)
+        return (make_cache_tag(Entry, date),)
+
+    def get_queryset(self):
+        return super().get_queryset().with_large_fields("text", "footnotes")
+
     def get_object(self, queryset=None):
         """
         Get the object this request displays.
@@ -87,8 +103,8 @@ class EntryDetailView(EntryMixin, DateDetailView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["tooltip_references"] = Entry.objects.get_brief_references(
-            objects=[self.object]
+        context["tooltips_url"] = get_tooltips_url(
+            reverse("entry_tooltips", kwargs=self.kwargs), Entry, [self.object]
         )
         extra_context = self.get_next_previous()
         context.update(extra_context)
@@ -97,6 +113,8 @@ class EntryDetailView(EntryMixin, DateDetailView):
     def get_next_previous(self):
         """
         Get the next/previous Entries based on the current Entry's date.
+        Uses the in-memory index of Entry dates rather than querying the
+        database.
         """
         year = self.get_year()
         month = self.get_month()
@@ -111,23 +129,9 @@ class EntryDetailView(EntryMixin, DateDetailView):
             self.get_day_format(),
         )
 
-        try:
-            previous_entry = (
-                self.model.objects.filter(diary_date__lt=date)
-                .order_by("-diary_date")[:1]
-                .get()
-            )
-        except self.model.DoesNotExist:
-            previous_entry = None
-
-        try:
-            next_entry = (
-                self.model.objects.filter(diary_date__gt=date)
-                .order_by("diary_date")[:1]
-                .get()
-            )
-        except self.model.DoesNotExist:
-            next_entry = None
+        # These are brief Entry objects, with only pk, diary_date and title.
+        previous_entry = entry_date_index.previous_entry(date)
+        next_entry = entry_date_index.next_entry(date)
 
         return {
             "previous_entry": previous_entry,
@@ -135,21 +139,89 @@ class EntryDetailView(EntryMixin, DateDetailView):
         }
 
 
-class EntryMonthArchiveView(EntryMixin, MonthArchiveView):
+class EntryMonthArchiveView(CacheMixin, EntryMixin, MonthArchiveView):
     """Show all the Entries from one month."""
 
     ordering = "diary_date"
+    cache_timeout = 60 * 60 * 24
+
+    def get_cache_tags(self):
+        month = "{year}-{month}".format(**self.kwargs)
+        return (make_cache_tag(Entry, month),)
+
+    def get_queryset(self):
+        return super().get_queryset().with_large_fields("text", "footnotes")
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["tooltip_references"] = Entry.objects.get_brief_references(
-            objects=kwargs["object_list"]
+        context["tooltips_url"] = get_tooltips_url(
+            reverse("entry_month_tooltips", kwargs=self.kwargs),
+            Entry,
+            kwargs["object_list"],
         )
         return context
 
     def get_ordering(self):
         return self.ordering
 
+    def get_next_month(self, date):
+        """
+        The first day of the next month that has Entries, or None.
+        Uses the in-memory index rather than querying the database.
+        """
+        next_date = entry_date_index.next_date(self._get_last_day_of_month(date))
+        return next_date.replace(day=1) if next_date else None
+
+    def get_previous_month(self, date):
+        """
+        The first day of the previous month that has Entries, or None.
+        Uses the in-memory index rather than querying the database.
+        """
+        previous_date = entry_date_index.previous_date(date.replace(day=1))
+        return previous_date.replace(day=1) if previous_date else None
+
+    def _get_last_day_of_month(self, date):
+        last_day = calendar.monthrange(date.year, date.month)[1]
+        return date.replace(day=last_day)
+
+
+class EntryTooltipsView(EntryMixin, BaseTooltipsView):
+    """The JSON data for the tooltips of the Topics one Entry refers to."""
+
+    def get_objects(self):
+        date = date_from_string(
+            self.kwargs["year"],
+            self.year_format,
+            self.kwargs["month"],
+            self.month_format,
+            self.kwargs["day"],
+            self.day_format,
+        )
+        entries = list(Entry.objects.filter(diary_date=date).only("pk"))
+        if len(entries) == 0:
+            raise Http404
+        return entries
+
+
+class EntryMonthTooltipsView(EntryMixin, BaseTooltipsView):
+    """The JSON data for the tooltips of the Topics a month's Entries refer to."""
+
+    def get_objects(self):
+        date = date_from_string(
+            self.kwargs["year"],
+            self.year_format,
+            self.kwargs["month"],
+            self.month_format,
+        )
+        entries = list(
+            Entry.objects.filter(
+                diary_date__year=date.year, diary_date__month=date.month
+            ).only("pk")
+        )
+        if len(entries) == 0:
+            raise Http404
+        return entries
+
 
 class EntryArchiveIndexView(EntryMixin, ArchiveIndexView):
     """Show all the years and months there are Entries for."""
@@ -25,6 +25,7 @@ class TopicAdmin(admin.ModelAdmin):
         "date_modified",
         "order_title",
         "last_comment_time",
+        "wikipedia_revision_id",
     )
     raw_id_fields = ("summary_author",)
     fieldsets = (
@@ -75,11 +76,16 @@ class TopicAdmin(admin.ModelAdmin):
                     "comment_count",
                     "last_comment_time",
                     "wikipedia_last_fetch",
+                    "wikipedia_revision_id",
                 ),
             },
         ),
     )
 
+    def get_queryset(self, request):
+        # The form edits this, which Topic.objects would otherwise defer.
+        return super().get_queryset(request).with_large_fields("shape")
+
     def save_related(self, request, form, formsets, change):
         super().save_related(request, form, formsets, change)
         # If we were creating it for the first time, the order_title won't
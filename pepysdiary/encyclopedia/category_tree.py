@@ -0,0 +1,104 @@
+from django.apps import apps
+
+from pepysdiary.common.memory_index import MemoryIndex
+
+
+class CategoryTree(MemoryIndex):
+    """
+    An in-memory snapshot of the whole tree of Categories, so we can get a
+    Category's URL, ancestors and children, or list the whole tree, without
+    querying the database.
+
+    Categories are treebeard MP_Nodes, so each has a materialized path made
+    of steplen-character steps, one per level, e.g. "0001", "00010003",
+    "000100030002". A Category's parent's path is its own path minus the last
+    step, and the tree is in the right order when sorted by path.
+
+    It's rebuilt the next time it's used after any Category is saved,
+    deleted or moved (see encyclopedia.signals and
+    common.memory_index.MemoryIndex).
+
+    Note: changes made with QuerySet.update() etc won't change the version.
+
+    Usage:
+        from pepysdiary.encyclopedia.category_tree import category_tree
+        category_tree.get_children(category)
+    """
+
+    cache_key = "encyclopedia:category_tree_version"
+
+    # The fields of each Category we keep, in this order:
+    fields = ("pk", "path", "depth", "numchild", "slug", "title", "topic_count")
+
+    def build_index(self):
+        """
+        Returns a tuple of:
+        * A list of tuples of `fields`, one per Category, sorted by path.
+        * A dict of path: position in that list.
+        * A dict of path: list of positions of that Category's children.
+        """
+        category_model = apps.get_model("encyclopedia", "Category")
+        rows = list(category_model.objects.order_by("path").values_list(*self.fields))
+        steplen = category_model.steplen
+        by_path = {}
+        children = {}
+        for i, row in enumerate(rows):
+            by_path[row[1]] = i
+            children.setdefault(row[1][:-steplen], []).append(i)
+        return (rows, by_path, children)
+
+    def _make_category(self, row):
+        """
+        Returns an unsaved Category with only the fields in `fields` set,
+        enough to use get_absolute_url(), topic_count and the API's
+        hyperlinks.
+        """
+        category_model = apps.get_model("encyclopedia", "Category")
+        return category_model(**dict(zip(self.fields, row, strict=True)))
+
+    def get_categories(self):
+        "A list of brief Category objects for the whole tree, in order."
+        return [self._make_category(row) for row in self._get_index()[0]]
+
+    def get_annotated_list(self):
+        """
+        The same as treebeard's Category.get_annotated_list(), for the whole
+        tree, but with brief Category objects.
+        """
+        category_model = apps.get_model("encyclopedia", "Category")
+        return category_model.get_annotated_list_qs(self.get_categories())
+
+    def get_slug_path(self, category):
+        """
+        Returns a string of the slugs of category's ancestors and itself,
+        e.g. "fooddrink/drink/alcdrinks". Or None if the Category, or any
+        ancestor, isn't in the tree.
+        """
+        rows, by_path = self._get_index()[:2]
+        steplen = category.steplen
+        slugs = []
+        for depth in range(1, len(category.path) // steplen):
+            i = by_path.get(category.path[: depth * steplen])
+            if i is None:
+                return None
+            slugs.append(rows[i][4])
+        slugs.append(category.slug)
+        return "/".join(slugs)
+
+    def get_ancestors(self, category):
+        "A list of brief Category objects, from the root to category's parent."
+        rows, by_path = self._get_index()[:2]
+        steplen = category.steplen
+        return [
+            self._make_category(rows[by_path[category.path[: depth * steplen]]])
+            for depth in range(1, len(category.path) // steplen)
+            if category.path[: depth * steplen] in by_path
+        ]
+
+    def get_children(self, category):
+        "A list of brief Category objects for category's children, in order."
+        rows, _, children = self._get_index()
+        return [self._make_category(rows[i]) for i in children.get(category.path, [])]
+
+
+category_tree = CategoryTree()
@@ -8,7 +8,9 @@ class LatestTopicsFeed(BaseRSSFeed):
     description = "New topics about Samuel Pepys and his world"
 
     def items(self):
-        return Topic.objects.all().order_by("-date_created")[:8]
+        return Topic.objects.with_large_fields(
+            "summary_html", "wheatley_html"
+        ).order_by("-date_created")[:8]
 
     def item_pubdate(self, item):
         return item.date_created
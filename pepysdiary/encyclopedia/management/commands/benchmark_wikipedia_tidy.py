@@ -0,0 +1,176 @@
+import time
+import tracemalloc
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pepysdiary.encyclopedia.models import Topic
+from pepysdiary.encyclopedia.wikipedia_fetcher import WikipediaFetcher
+
+
+class Command(BaseCommand):
+    """
+    Compares the speed, peak memory use and output of the two ways that
+    WikipediaFetcher can tidy pages' HTML: _tidy_html_legacy(), which parses
+    each page twice, and _tidy_html(), which parses it once.
+
+    Uses a directory of Wikipedia pages' HTML, as fetched but not yet tidied,
+    one page per .html file.
+
+    Download the untidied HTML of 100 Topics' Wikipedia pages into a
+    directory, then benchmark them:
+    ./manage.py benchmark_wikipedia_tidy path/to/dir --download=100
+
+    Benchmark pages that are already in the directory:
+    ./manage.py benchmark_wikipedia_tidy path/to/dir
+
+    Change how many times each way is run, to get the fastest (default 3):
+    ./manage.py benchmark_wikipedia_tidy path/to/dir --repeat=5
+
+    Verbosity:
+    0: No output
+    1: The results
+    2: Also list the files whose tidied HTML differs
+    """
+
+    help = "Compares the speed and output of the ways of tidying Wikipedia HTML."
+
+    # Labels for the WikipediaFetcher methods to compare:
+    methods = {
+        "_tidy_html_legacy": "Two-pass (legacy)",
+        "_tidy_html": "Single-pass",
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "directory",
+            action="store",
+            help="Directory containing the .html files of Wikipedia pages.",
+        )
+        parser.add_argument(
+            "--download",
+            action="store",
+            dest="download",
+            default=0,
+            type=int,
+            help="First fetch this many Topics' Wikipedia pages into the directory.",
+        )
+        parser.add_argument(
+            "--repeat",
+            "-r",
+            action="store",
+            dest="repeat",
+            default=3,
+            type=int,
+            help="Tidy all the pages this many times with each method.",
+        )
+
+    def handle(self, *args, **options):
+        if options["repeat"] < 1:
+            msg = "--repeat should be 1 or more."
+            raise CommandError(msg)
+
+        self.verbosity = int(options["verbosity"])
+        self.fetcher = WikipediaFetcher()
+        directory = Path(options["directory"])
+
+        if options["download"] > 0:
+            directory.mkdir(parents=True, exist_ok=True)
+            self.download(directory, options["download"])
+
+        pages = {
+            path.name: path.read_text(encoding="utf-8")
+            for path in sorted(directory.glob("*.html"))
+        }
+        if len(pages) == 0:
+            msg = f"There are no .html files in {directory}"
+            raise CommandError(msg)
+
+        megabytes = sum(len(html.encode()) for html in pages.values()) / 1e6
+        if self.verbosity > 0:
+            self.stdout.write(f"{len(pages)} page(s), {megabytes:.1f} MB")
+
+        outputs = {}
+        for method, label in self.methods.items():
+            outputs[method], seconds, peak = self.benchmark(
+                method, pages, options["repeat"]
+            )
+            if self.verbosity > 0:
+                self.stdout.write(
+                    f"{label}: {seconds:.2f}s, "
+                    f"{len(pages) / seconds:.1f} pages/s, "
+                    f"{megabytes / seconds:.2f} MB/s, "
+                    f"peak memory {peak / 1e6:.1f} MB"
+                )
+
+        self.compare(*outputs.values())
+
+    def download(self, directory, num):
+        "Saves the untidied HTML of num Topics' Wikipedia pages into directory."
+        topics = (
+            Topic.objects.exclude(wikipedia_fragment="")
+            .only("pk", "wikipedia_fragment")
+            .order_by("pk")[:num]
+        )
+        for topic in topics:
+            result = self.fetcher.fetch(topic.wikipedia_fragment, tidy=False)
+            if result["success"]:
+                path = directory / f"{topic.pk}.html"
+                path.write_text(result["content"], encoding="utf-8")
+            else:
+                self.stderr.write(f"Topic {topic.pk}: {result['content']}")
+
+    def benchmark(self, method, pages, repeat):
+        """
+        Tidies all the pages with the WikipediaFetcher method, repeat times.
+
+        Returns a tuple of:
+        * A dict of file name: tidied HTML
+        * The fastest time taken, in seconds
+        * The peak memory allocated while tidying, in bytes. Measured
+          separately, as tracing allocations slows everything down.
+        """
+        tidy = getattr(self.fetcher, method)
+
+        timings = []
+        for _ in range(repeat):
+            start_time = time.perf_counter()
+            outputs = {name: tidy(html) for name, html in pages.items()}
+            timings.append(time.perf_counter() - start_time)
+
+        tracemalloc.start()
+        try:
+            for html in pages.values():
+                tidy(html)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        return outputs, min(timings), peak
+
+    def compare(self, legacy_outputs, outputs):
+        "Outputs how many pages were tidied the same by both methods."
+        identical = []
+        whitespace = []
+        different = []
+        for name, legacy_html in legacy_outputs.items():
+            html = outputs[name]
+            if html == legacy_html:
+                identical.append(name)
+            elif html.split() == legacy_html.split():
+                whitespace.append(name)
+            else:
+                different.append(name)
+
+        if self.verbosity > 0:
+            self.stdout.write(
+                f"Output: {len(identical)} identical, "
+                f"{len(whitespace)} different only in whitespace, "
+                f"{len(different)} different"
+            )
+        if self.verbosity > 1:
+            if whitespace:
+                names = ", ".join(whitespace)
+                self.stdout.write(f"Different only in whitespace: {names}")
+            if different:
+                self.stdout.write(f"Different: {', '.join(different)}")
@@ -0,0 +1,64 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pepysdiary.encyclopedia.models import Topic
+
+
+class Command(BaseCommand):
+    """
+    Works out which Topics are most often referred to in the same Diary
+    Entries as each other, and saves each Topic's most related Topics,
+    replacing any saved before. See TopicManager.build_related_topics().
+
+    Save the 10 most related Topics for each Topic:
+    ./manage.py build_related_topics
+
+    Save a different number per Topic:
+    ./manage.py build_related_topics --num=20
+
+    Ignore pairs of Topics that share fewer than this many Entries (default 2):
+    ./manage.py build_related_topics --min-entries=3
+
+    Verbosity:
+    0: No output
+    1: The number of related Topics saved, and the time taken
+    """
+
+    help = "Saves the Topics most often referred to together in Diary Entries."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--num",
+            "-n",
+            action="store",
+            dest="num",
+            default=10,
+            type=int,
+            help="The number of related Topics to save for each Topic.",
+        )
+        parser.add_argument(
+            "--min-entries",
+            action="store",
+            dest="min_entries",
+            default=2,
+            type=int,
+            help="Ignore pairs of Topics that share fewer than this many Entries.",
+        )
+
+    def handle(self, *args, **options):
+        if options["num"] < 1:
+            msg = "--num should be 1 or more."
+            raise CommandError(msg)
+        if options["min_entries"] < 1:
+            msg = "--min-entries should be 1 or more."
+            raise CommandError(msg)
+
+        start_time = time.monotonic()
+        count = Topic.objects.build_related_topics(
+            num=options["num"], min_entries=options["min_entries"]
+        )
+        seconds = time.monotonic() - start_time
+
+        if int(options["verbosity"]) > 0:
+            self.stdout.write(f"Saved {count} related topic(s) in {seconds:.2f}s")
@@ -16,6 +16,10 @@ class Command(BaseCommand):
     Gets it for the 20 Topics that have been fetched least recently:
     ./manage.py fetch_wikipedia --num=20
 
+    Only fetch pages that have changed since we last fetched them (can be
+    used with any of the above):
+    ./manage.py fetch_wikipedia --num=20 --changed
+
     Add verbosity with:
     ./manage.py fetch_wikipedia --num=20 --verbosity=2
 
@@ -57,16 +61,33 @@ class Command(BaseCommand):
             help="Space-separated ID(s). Only fetch Wikipedia content for Topics "
             "with these id(s)",
         )
+        parser.add_argument(
+            "--changed",
+            "-c",
+            action="store_true",
+            dest="changed",
+            default=False,
+            help="Only fetch Wikipedia content for Topics whose pages have changed "
+            "since they were last fetched.",
+        )
 
     def handle(self, *args, **options):
         args_error_message = "Specify --ids, --all topics or --num=n topics."
 
+        only_changed = options["changed"]
+
         if options["all"]:
-            updated = Topic.objects.fetch_wikipedia_texts(num="all")
+            updated = Topic.objects.fetch_wikipedia_texts(
+                num="all", only_changed=only_changed
+            )
         elif options["num"]:
-            updated = Topic.objects.fetch_wikipedia_texts(num=options["num"])
+            updated = Topic.objects.fetch_wikipedia_texts(
+                num=options["num"], only_changed=only_changed
+            )
         elif options["ids"]:
-            updated = Topic.objects.fetch_wikipedia_texts(topic_ids=options["ids"])
+            updated = Topic.objects.fetch_wikipedia_texts(
+                topic_ids=options["ids"], only_changed=only_changed
+            )
         else:
             raise CommandError(args_error_message)
 
@@ -79,6 +100,13 @@ class Command(BaseCommand):
                 ids = ", ".join(str(id) for id in updated["success"])
                 self.stdout.write(f"IDs: {ids}")
 
+            if only_changed:
+                num_topics = len(updated["unchanged"])
+                self.stdout.write(f"{num_topics} topic(s) were unchanged")
+                if verbosity > 1:
+                    ids = ", ".join(str(id) for id in updated["unchanged"])
+                    self.stdout.write(f"IDs: {ids}")
+
             if len(updated["failure"]) > 0:
                 num_topics = len(updated["failure"])
                 self.stderr.write(
@@ -0,0 +1,168 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from pepysdiary.common.caching import invalidate_cache_tags, make_cache_tag
+from pepysdiary.diary.models import Entry
+from pepysdiary.encyclopedia.models import Topic
+from pepysdiary.letters.models import Letter
+
+
+class Command(BaseCommand):
+    """
+    Re-sets the Encyclopedia Topics that all Diary Entries and/or Letters
+    refer to, based on the links in their text and footnotes.
+
+    Only adds and removes the references that have changed, in batches.
+    Links to Topics that don't exist are ignored.
+
+    Note: this doesn't send the m2m_changed signals that adding and removing
+    references one object at a time would. But it does expire the cached
+    views, and reference timelines, of the Topics whose references changed.
+
+    Rebuild references for all Entries and Letters:
+    ./manage.py rebuild_references
+
+    Only for Entries, or Letters:
+    ./manage.py rebuild_references --models entry
+    ./manage.py rebuild_references --models letter
+
+    Change the number of objects processed at once (default 500):
+    ./manage.py rebuild_references --batch-size=1000
+
+    Verbosity:
+    0: No output
+    1: The number of references added and removed for each model
+    2: Also output progress after each batch
+    """
+
+    help = "Re-sets the Topics referred to by Diary Entries and Letters."
+
+    # The models we can rebuild references for, and the Topic field
+    # whose through model stores their references.
+    relations = {
+        "entry": (Entry, Topic.diary_references),
+        "letter": (Letter, Topic.letter_references),
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--models",
+            "-m",
+            action="store",
+            nargs="+",
+            help="Space-separated model name(s): entry and/or letter.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            "-b",
+            action="store",
+            dest="batch_size",
+            default=500,
+            type=int,
+            help="The number of objects to process at once.",
+        )
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            msg = "--batch-size should be 1 or more."
+            raise CommandError(msg)
+
+        names = options["models"] or list(self.relations.keys())
+        for name in names:
+            if name not in self.relations:
+                msg = f"'{name}' is not a valid model. Use 'entry' and/or 'letter'."
+                raise CommandError(msg)
+
+        self.batch_size = options["batch_size"]
+        self.verbosity = int(options["verbosity"])
+
+        # Used to ignore references to Topics that don't exist:
+        self.valid_topic_ids = set(Topic.objects.values_list("pk", flat=True))
+
+        for name in names:
+            model, descriptor = self.relations[name]
+            self.rebuild_model(model, descriptor.through, descriptor.field)
+
+    def rebuild_model(self, model, through, field):
+        """
+        Rebuild the references for all objects of `model`.
+        `through` is the through model that stores the references.
+        `field` is the ManyToManyField on Topic.
+        """
+        name = model._meta.verbose_name_plural
+        # e.g. "entry_id" and "topic_id":
+        object_field = f"{field.m2m_reverse_field_name()}_id"
+        topic_field = f"{field.m2m_field_name()}_id"
+
+        total_added = 0
+        total_removed = 0
+        num_processed = 0
+        last_pk = 0
+
+        while True:
+            objects = list(
+                model.objects.only("pk", "text", "footnotes")
+                .filter(pk__gt=last_pk)
+                .order_by("pk")[: self.batch_size]
+            )
+            if not objects:
+                break
+
+            added, removed = self.rebuild_batch(
+                objects, through, object_field, topic_field
+            )
+            total_added += added
+            total_removed += removed
+            num_processed += len(objects)
+            last_pk = objects[-1].pk
+
+            if self.verbosity > 1:
+                self.stdout.write(f"{name}: processed {num_processed}")
+
+        if self.verbosity > 0:
+            self.stdout.write(
+                f"{name}: added {total_added} and removed {total_removed} "
+                f"reference(s) for {num_processed} object(s)"
+            )
+
+    @transaction.atomic
+    def rebuild_batch(self, objects, through, object_field, topic_field):
+        """
+        Make the references for this list of objects match their texts.
+        Returns a tuple of the number of references added and removed.
+        """
+        wanted = {
+            (obj.pk, topic_id)
+            for obj in objects
+            for topic_id in obj.get_referenced_topic_ids() & self.valid_topic_ids
+        }
+
+        existing = {
+            (object_id, topic_id): pk
+            for pk, object_id, topic_id in through.objects.filter(
+                **{f"{object_field}__in": [obj.pk for obj in objects]}
+            ).values_list("pk", object_field, topic_field)
+        }
+
+        pks_to_delete = [pk for pair, pk in existing.items() if pair not in wanted]
+        if pks_to_delete:
+            through.objects.filter(pk__in=pks_to_delete).delete()
+
+        to_create = [
+            through(**{object_field: object_id, topic_field: topic_id})
+            for object_id, topic_id in wanted
+            if (object_id, topic_id) not in existing
+        ]
+        if to_create:
+            through.objects.bulk_create(to_create)
+
+        changed_topic_ids = {topic_id for _, topic_id in wanted ^ existing.keys()}
+        tags = set()
+        for topic_id in changed_topic_ids:
+            tags |= {
+                make_cache_tag(Topic, topic_id),
+                Topic.make_references_cache_tag(topic_id),
+            }
+        invalidate_cache_tags(tags)
+
+        return len(to_create), len(pks_to_delete)
@@ -26,7 +26,8 @@ class Command(BaseCommand):
     help = "Re-set all the order_titles for all Topics"
 
     def handle(self, *args, **options):
-        for topic in Topic.objects.all():
+        # Saving uses the fields that would otherwise be deferred.
+        for topic in Topic.objects.with_large_fields():
             # print '%s %s' % (topic.pk, topic.title)
             # Because the order_title is set on save, we just need to save
             # each topic:
@@ -1,12 +1,28 @@
+import heapq
+import logging
+import math
 import re
-import time
-
-from django.db import models
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import combinations
+
+from django.apps import apps
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models import Case, Exists, OuterRef, Subquery, Value, When
 from django.utils import timezone
 from treebeard.mp_tree import MP_NodeManager
 
+from pepysdiary.common.caching import (
+    get_cache_tag_versions,
+    invalidate_cache_tags,
+    make_cache_tag,
+)
+from pepysdiary.common.managers import LargeFieldsManagerMixin
 from pepysdiary.encyclopedia import category_lookups
-from pepysdiary.encyclopedia.wikipedia_fetcher import WikipediaFetcher
+from pepysdiary.encyclopedia.wikipedia_fetcher import TokenBucket, WikipediaFetcher
+
+logger = logging.getLogger(__name__)
 
 
 class CategoryManager(MP_NodeManager):
@@ -68,12 +84,60 @@ class CategoryManager(MP_NodeManager):
         return ids
 
 
-class TopicManager(models.Manager):
+class TopicManager(LargeFieldsManagerMixin, models.Manager):
+    # How many Topics to save at once after fetching their Wikipedia texts:
+    wikipedia_batch_size = 50
+
     def pepys_homes_ids(self):
         """The IDs of the Topics about the places Pepys has lived."""
         return [102, 1023]
 
-    def fetch_wikipedia_texts(self, topic_ids=None, num=None):
+    def with_kinds(self):
+        """
+        Returns a QuerySet of all Topics, each with a `kind` attribute that
+        is one of the Topic.Kind values. The same as Topic.get_kind() but
+        worked out in the database, without extra queries for each Topic.
+
+        A Topic is a Place if any of its Categories is the Places Category,
+        or beneath it. Because Categories are stored as materialized paths
+        (see treebeard's MP_Node) that means its path starts with the Places
+        Category's path.
+        """
+        category_model = self.model.categories.field.related_model
+        through = self.model.categories.through
+
+        in_people = Exists(
+            through.objects.filter(
+                topic=OuterRef("pk"), category_id=category_lookups.PEOPLE
+            )
+        )
+        places_path = category_model.objects.filter(pk=category_lookups.PLACES).values(
+            "path"
+        )[:1]
+        in_places = Exists(
+            through.objects.filter(
+                topic=OuterRef("pk"), category__path__startswith=Subquery(places_path)
+            )
+        )
+
+        return self.annotate(
+            kind=Case(
+                When(in_people, then=Value(self.model.Kind.PERSON)),
+                When(in_places, then=Value(self.model.Kind.PLACE)),
+                default=Value(self.model.Kind.DEFAULT),
+                output_field=models.CharField(),
+            )
+        )
+
+    def fetch_wikipedia_texts(
+        self,
+        topic_ids=None,
+        num=None,
+        workers=4,
+        requests_per_second=5,
+        *,
+        only_changed=False,
+    ):
         """
         Passed a list of Topic IDs, this calls the method that fetches and
         munges the Wikipedia HTML for any of those Topics that have
@@ -86,10 +150,25 @@ class TopicManager(models.Manager):
 
         By default, this method will fetch nothing.
 
-        Returns a dict with 'success' and 'failure' elements. Each of those is
-        a list containing the relevant Topic IDs.
+        Pages are fetched by `workers` threads at once, sharing one
+        WikipediaFetcher, making no more than `requests_per_second` requests
+        per second between them, to be nice to Wikipedia. The fetched texts
+        are saved in batches.
+
+        If only_changed is True, we first get the current revision IDs of all
+        the Topics' pages, many pages per request, and only fetch pages whose
+        revision is different to the one we last fetched. Topics whose pages
+        haven't changed only have their wikipedia_last_fetch updated, so that
+        using `num` will move on to other Topics next time. Otherwise, and for
+        pages whose revision we couldn't get, the Topics' existing revision
+        IDs are left alone; if they're out of date the pages will be fetched
+        again the next time only_changed is True.
+
+        Returns a dict with 'success', 'failure' and 'unchanged' elements.
+        Each of those is a list containing the relevant Topic IDs.
         Success is when we fetched the Wikipedia text for a topic.
         Failure is when we tried but failed.
+        Unchanged is when only_changed is True and we didn't need to fetch it.
         Topics that have no Wikipedia URL fragments aren't counted (as we
         don't even try to fetch their texts).
         """
@@ -99,11 +178,12 @@ class TopicManager(models.Manager):
         results = {
             "success": [],
             "failure": [],
+            "unchanged": [],
         }
 
-        qs = self.model.objects.only("id", "wikipedia_fragment").exclude(
-            wikipedia_fragment__exact=""
-        )
+        qs = self.model.objects.only(
+            "id", "wikipedia_fragment", "wikipedia_revision_id"
+        ).exclude(wikipedia_fragment__exact="")
 
         if num == "all":
             # We don't modify the QuerySet
@@ -120,23 +200,254 @@ class TopicManager(models.Manager):
         else:
             qs = qs.filter(pk__in=topic_ids)
 
-        fetcher = WikipediaFetcher()
+        topics = list(qs)
+        if len(topics) == 0:
+            return results
+
+        fetcher = WikipediaFetcher(
+            rate_limiter=TokenBucket(requests_per_second), pool_size=workers
+        )
+
+        revision_ids = {}
+        if only_changed:
+            revision_ids = fetcher.get_revision_ids(
+                [topic.wikipedia_fragment for topic in topics]
+            )
+            results["unchanged"] = sorted(
+                topic.id
+                for topic in topics
+                if topic.wikipedia_revision_id is not None
+                and topic.wikipedia_revision_id
+                == revision_ids.get(topic.wikipedia_fragment)
+            )
+            if results["unchanged"]:
+                self.filter(pk__in=results["unchanged"]).update(
+                    wikipedia_last_fetch=timezone.now()
+                )
+                unchanged_ids = set(results["unchanged"])
+                topics = [topic for topic in topics if topic.id not in unchanged_ids]
+
+        fetched_topics = []
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(fetcher.fetch, topic.wikipedia_fragment): topic
+                for topic in topics
+            }
+            for future in as_completed(futures):
+                topic = futures[future]
+                try:
+                    fetched = future.result()
+                except Exception:
+                    logger.exception("Error fetching Wikipedia for Topic %s", topic.pk)
+                    fetched = {"success": False}
 
-        if qs.count() > 0:
-            for topic in qs:
-                fetched = fetcher.fetch(topic.wikipedia_fragment)
                 if fetched["success"] is True:
                     topic.wikipedia_html = fetched["content"]
                     topic.wikipedia_last_fetch = timezone.now()
-                    topic.save()
+                    if topic.wikipedia_fragment in revision_ids:
+                        topic.wikipedia_revision_id = revision_ids[
+                            topic.wikipedia_fragment
+                        ]
+                    fetched_topics.append(topic)
                     results["success"].append(topic.id)
                 else:
                     results["failure"].append(topic.id)
-                # Be nice when fetching things:
-                time.sleep(0.5)
 
+                if len(fetched_topics) >= self.wikipedia_batch_size:
+                    self._save_wikipedia_texts(fetched_topics)
+                    fetched_topics = []
+
+        self._save_wikipedia_texts(fetched_topics)
+
+        results["success"].sort()
+        results["failure"].sort()
         return results
 
+    def _save_wikipedia_texts(self, topics):
+        """
+        Saves the wikipedia_html, wikipedia_last_fetch and
+        wikipedia_revision_id of these Topics with as few queries as possible.
+
+        bulk_update() doesn't call save() or send signals, so we also do
+        what they would: set date_modified, update the search documents, and
+        expire the Topics' cached views.
+        """
+        if len(topics) == 0:
+            return
+        now = timezone.now()
+        for topic in topics:
+            topic.date_modified = now
+
+        with transaction.atomic():
+            self.bulk_update(
+                topics,
+                [
+                    "wikipedia_html",
+                    "wikipedia_last_fetch",
+                    "wikipedia_revision_id",
+                    "date_modified",
+                ],
+            )
+            self.filter(pk__in=[topic.pk for topic in topics]).update(
+                search_document=self.model.get_search_vector()
+            )
+            invalidate_cache_tags(
+                set().union(*(topic.get_cache_tags() for topic in topics))
+            )
+
+    def build_related_topics(self, *, num=10, min_entries=2):
+        """
+        Works out which Topics are most often referred to in the same Diary
+        Entries, and stores each Topic's top `num` related Topics as
+        RelatedTopics, replacing all the existing ones.
+
+        The references are a sparse Topic × Entry matrix. Multiplying it by
+        its own transpose gives, for each pair of Topics, the Entries they
+        share. We do that one Entry at a time, from a single query of the
+        references, only ever storing the pairs that do appear together.
+
+        Each pair's score is weighted so that:
+
+        * An Entry that refers to many Topics counts for less than one that
+          refers to a few: each adds 1 / log2(1 + its number of Topics).
+        * Topics referred to in hundreds of Entries (e.g. Elizabeth Pepys)
+          aren't related to everything: the total is divided by the square
+          root of the product of the two Topics' numbers of references.
+
+        Pairs that share fewer than `min_entries` Entries are ignored, as are
+        Entries that haven't been published yet.
+
+        Expires the cached views of Topics whose related Topics changed.
+
+        Returns the number of RelatedTopics saved.
+        """
+        entry_model = apps.get_model("diary", "Entry")
+        related_topic_model = apps.get_model("encyclopedia", "RelatedTopic")
+        references = self.model.diary_references.through.objects.filter(
+            entry__diary_date__lte=entry_model.objects.most_recent_entry_date()
+        ).values_list("entry_id", "topic_id")
+
+        # Entry ID: list of the IDs of the Topics it refers to.
+        entry_topics = defaultdict(list)
+        for entry_id, topic_id in references.iterator(chunk_size=10000):
+            entry_topics[entry_id].append(topic_id)
+
+        # Topic ID: number of Entries referring to it.
+        topic_counts = Counter()
+        # (Topic ID, Topic ID): [number of Entries, weighted total]
+        pairs = {}
+        for topic_ids in entry_topics.values():
+            topic_counts.update(topic_ids)
+            if len(topic_ids) < 2:
+                continue
+            weight = 1 / math.log2(1 + len(topic_ids))
+            for pair in combinations(sorted(topic_ids), 2):
+                totals = pairs.setdefault(pair, [0, 0.0])
+                totals[0] += 1
+                totals[1] += weight
+
+        # Topic ID: heap of its top (score, related Topic ID, entry count).
+        top = defaultdict(list)
+        for (topic_a, topic_b), (count, total) in pairs.items():
+            if count < min_entries:
+                continue
+            score = total / math.sqrt(topic_counts[topic_a] * topic_counts[topic_b])
+            for topic_id, related_id in ((topic_a, topic_b), (topic_b, topic_a)):
+                heap = top[topic_id]
+                item = (score, -related_id, count)
+                if len(heap) < num:
+                    heapq.heappush(heap, item)
+                else:
+                    heapq.heappushpop(heap, item)
+
+        related_topics = []
+        # Topic ID: tuple of its related Topic IDs, in order, now and before.
+        new_related_ids = defaultdict(tuple)
+        old_related_ids = defaultdict(tuple)
+        for topic_id, heap in top.items():
+            for score, negative_id, count in sorted(heap, reverse=True):
+                related_topics.append(
+                    related_topic_model(
+                        topic_id=topic_id,
+                        related_topic_id=-negative_id,
+                        score=score,
+                        entry_count=count,
+                    )
+                )
+                new_related_ids[topic_id] += (-negative_id,)
+
+        with transaction.atomic():
+            # Order by the IDs, in the same order as new_related_ids, as
+            # ordering by "topic" would use Topic's ordering, by title.
+            for topic_id, related_id in related_topic_model.objects.order_by(
+                "topic_id", "-score", "related_topic_id"
+            ).values_list("topic_id", "related_topic_id"):
+                old_related_ids[topic_id] += (related_id,)
+
+            # One query, because nothing receives RelatedTopics' delete signals.
+            # (Otherwise Django would fetch every one first, to send them.)
+            related_topic_model.objects.all().delete()
+            related_topic_model.objects.bulk_create(related_topics, batch_size=1000)
+
+            invalidate_cache_tags(
+                {
+                    make_cache_tag(self.model, topic_id)
+                    for topic_id in old_related_ids.keys() | new_related_ids.keys()
+                    if old_related_ids[topic_id] != new_related_ids[topic_id]
+                }
+            )
+
+        return len(related_topics)
+
+    def get_tooltip_data(self, topic_ids):
+        """
+        Returns a dict of data for the tooltips of the Topics with these IDs,
+        keyed by their IDs as strings, like:
+            {
+                '106': {
+                    'title': 'George Downing',
+                    'text': "1623-1684. An Anglo-Irish solider...",
+                    'thumbnail_url': '/media/encyclopedia/thumbnails/106.jpg',
+                },
+                ...
+            }
+        IDs of Topics that don't exist are left out.
+
+        Each Topic's data is cached, using the version of its cache tag in the
+        key, so it's made afresh after the Topic is saved. The Topics that
+        aren't cached are fetched with one query.
+        """
+        tags = {pk: make_cache_tag(self.model, pk) for pk in topic_ids}
+        if not tags:
+            return {}
+        versions = get_cache_tag_versions(tags.values())
+        keys = {
+            topic_id: f"encyclopedia:topic_tooltip:{topic_id}:{versions[tag]}"
+            for topic_id, tag in tags.items()
+        }
+
+        tooltips = cache.get_many(keys.values())
+        missing = [topic_id for topic_id, key in keys.items() if key not in tooltips]
+        if missing:
+            fetched = {}
+            for topic in self.filter(pk__in=missing).only(
+                "pk", "title", "tooltip_text", "thumbnail"
+            ):
+                fetched[keys[topic.pk]] = {
+                    "title": topic.title,
+                    "text": topic.tooltip_text,
+                    "thumbnail_url": topic.thumbnail.url if topic.thumbnail else "",
+                }
+            cache.set_many(fetched, self.model.tooltip_timeout)
+            tooltips.update(fetched)
+
+        return {
+            str(topic_id): tooltips[key]
+            for topic_id, key in keys.items()
+            if key in tooltips
+        }
+
     def make_order_title(self, text, *, is_person=False):
         """
         If is_person we change:
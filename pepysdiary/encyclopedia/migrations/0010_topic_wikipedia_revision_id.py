@@ -0,0 +1,21 @@
+# Generated by Django 5.1.1 on 2026-10-18 07:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("encyclopedia", "0009_alter_topic_order_title"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="topic",
+            name="wikipedia_revision_id",
+            field=models.PositiveBigIntegerField(
+                blank=True,
+                help_text="The ID of the Wikipedia page's revision we last fetched.",
+                null=True,
+            ),
+        ),
+    ]
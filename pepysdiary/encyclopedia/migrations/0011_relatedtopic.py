@@ -0,0 +1,69 @@
+# Generated by Django 5.1.1 on 2026-10-18 07:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("encyclopedia", "0010_topic_wikipedia_revision_id"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RelatedTopic",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "score",
+                    models.FloatField(
+                        help_text=(
+                            "How strongly related the Topics are. "
+                            "Higher is more related."
+                        )
+                    ),
+                ),
+                (
+                    "entry_count",
+                    models.PositiveIntegerField(
+                        help_text=(
+                            "The number of Diary Entries that refer to both Topics."
+                        )
+                    ),
+                ),
+                (
+                    "related_topic",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="related_to_scores",
+                        to="encyclopedia.topic",
+                    ),
+                ),
+                (
+                    "topic",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="related_topic_scores",
+                        to="encyclopedia.topic",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["topic", "-score"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("topic", "related_topic"),
+                        name="unique_related_topic",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -1,18 +1,26 @@
 from django.conf import settings
 from django.contrib.postgres.search import SearchVectorField
+from django.core.cache import cache
 from django.db import models
 from django.urls import reverse
 from django_comments.moderation import CommentModerator, moderator
 from markdown import markdown
 from treebeard.mp_tree import MP_Node
 
-from pepysdiary.common.models import PepysModel
+from pepysdiary.common.caching import (
+    get_cache_tag_versions,
+    invalidate_cache_tags,
+    make_cache_tag,
+)
+from pepysdiary.common.models import CacheTagsMixin, PepysModel, SearchDocumentMixin
+from pepysdiary.common.utilities import get_month_b, get_year
 
 from . import category_lookups, topic_lookups
+from .category_tree import category_tree
 from .managers import CategoryManager, TopicManager
 
 
-class Category(MP_Node):
+class Category(CacheTagsMixin, MP_Node):
     title = models.CharField(max_length=255, blank=False, null=False)
     slug = models.SlugField(max_length=50, blank=False, null=False)
     topic_count = models.IntegerField(default=0, blank=False, null=False)
@@ -37,13 +45,45 @@ class Category(MP_Node):
         """
         return self.topics.only("id", "order_title").order_by()
 
+    @property
+    def ancestors_brief(self):
+        """
+        Like get_ancestors() but from the in-memory category_tree, without
+        querying the database. The Categories only have some fields set.
+        """
+        return category_tree.get_ancestors(self)
+
+    @property
+    def children_brief(self):
+        """
+        Like get_children() but from the in-memory category_tree, without
+        querying the database. The Categories only have some fields set.
+        """
+        return category_tree.get_children(self)
+
+    def get_cache_tag_key(self):
+        "Categories are identified by their slug in the API."
+        return self.slug
+
     def get_absolute_url(self):
         # Join all the parent categories' slugs, eg:
         # 'fooddrink/drink/alcdrinks'.
-        parent_slugs = "/".join([c.slug for c in self.get_ancestors()])
-        path = f"{parent_slugs}/{self.slug}" if parent_slugs else str(self.slug)
+        path = category_tree.get_slug_path(self)
+        if path is None:
+            # Not in the tree yet, so fetch the ancestors:
+            parent_slugs = "/".join([c.slug for c in self.get_ancestors()])
+            path = f"{parent_slugs}/{self.slug}" if parent_slugs else str(self.slug)
         return reverse("category_detail", kwargs={"slugs": path})
 
+    def move(self, target, pos=None):
+        """
+        Moving Categories updates their paths without saving them, so no
+        post_save signals are sent. So we invalidate things here.
+        """
+        super().move(target, pos)
+        category_tree.invalidate()
+        invalidate_cache_tags([make_cache_tag(Category)])
+
     def set_topic_count(self):
         """
         Should be called when we add/delete a Topic.
@@ -54,7 +94,7 @@ class Category(MP_Node):
         self.save()
 
 
-class Topic(PepysModel):
+class Topic(SearchDocumentMixin, CacheTagsMixin, PepysModel):
     class MapCategory(models.TextChoices):
         #  These are inherited from Movable Type data, but I'm not sure we
         # actually use them...
@@ -66,6 +106,13 @@ class Topic(PepysModel):
         STAIR = "stair", "Stair or Pier"
         TOWN = "town", "Town or Village"
 
+    class Kind(models.TextChoices):
+        # What kind of thing the Topic is about, used in the API.
+        # See get_kind() and TopicManager.with_kinds().
+        PERSON = "person", "Person"
+        PLACE = "place", "Place"
+        DEFAULT = "default", "Default"
+
     title = models.CharField(max_length=255, blank=False, null=False)
     order_title = models.CharField(
         max_length=255, blank=True, null=False, db_index=True
@@ -112,6 +159,11 @@ class Topic(PepysModel):
         blank=True, null=False, help_text="Will be populated automatically."
     )
     wikipedia_last_fetch = models.DateTimeField(blank=True, null=True)
+    wikipedia_revision_id = models.PositiveBigIntegerField(
+        blank=True,
+        null=True,
+        help_text="The ID of the Wikipedia page's revision we last fetched.",
+    )
     thumbnail = models.ImageField(
         upload_to="encyclopedia/thumbnails",
         blank=True,
@@ -157,11 +209,36 @@ class Topic(PepysModel):
     diary_references = models.ManyToManyField("diary.Entry", related_name="topics")
     letter_references = models.ManyToManyField("letters.Letter", related_name="topics")
 
-    # Also see index_components() method.
+    # The fields, and their weights, used to make the search_document.
+    # See SearchDocumentMixin.
+    search_fields = (
+        ("title", "A"),
+        ("summary", "B"),
+        ("wheatley", "B"),
+        ("wikipedia_html", "C"),
+    )
     search_document = SearchVectorField(null=True)
 
+    # Fields that Topic.objects defers unless asked for them.
+    # See LargeFieldsManagerMixin.
+    large_fields = (
+        "summary_html",
+        "wheatley_html",
+        "wikipedia_html",
+        "shape",
+        "search_document",
+    )
+
     comment_name = "annotation"
 
+    # How long to cache each Topic's timeline of diary references, in seconds.
+    # See get_diary_references_timeline().
+    references_timeline_timeout = 60 * 60 * 24 * 7
+
+    # How long to cache each Topic's tooltip data, in seconds.
+    # See TopicManager.get_tooltip_data().
+    tooltip_timeout = 60 * 60 * 24 * 7
+
     # Keeps track of whether we've made the order_title for this model yet.
     _order_title_made = False
     _original_categories_pks = []
@@ -257,16 +334,98 @@ class Topic(PepysModel):
     def get_absolute_url(self):
         return reverse("topic_detail", kwargs={"pk": self.pk})
 
-    def index_components(self):
-        """Used by common.signals.on_save() to update the SearchVector on
-        self.search_document.
+    def get_cache_tags(self):
+        "Also expire this Topic's diary references. (Comments on it don't.)"
+        return super().get_cache_tags() | {self.make_references_cache_tag(self.pk)}
+
+    @classmethod
+    def make_references_cache_tag(cls, pk):
         """
-        return (
-            (self.title, "A"),
-            (self.summary, "B"),
-            (self.wheatley, "B"),
-            (self.wikipedia_html, "C"),
-        )
+        Returns the tag of the Topic with this pk's diary references, e.g.
+        "encyclopedia.topic:123:references". See
+        get_diary_references_timeline().
+        """
+        return make_cache_tag(cls, f"{pk}:references")
+
+    def get_diary_references_timeline(self):
+        """
+        Returns this Topic's diary references grouped by year and month, with
+        the number of references in each, like:
+
+            [
+                {
+                    "year": "1660",
+                    "count": 3,
+                    "months": [
+                        {
+                            "month": "Jan",
+                            "count": 2,
+                            "references": [
+                                (123, date(1660, 1, 1), "Sunday 1 January 1659/60"),
+                                (124, date(1660, 1, 2), "Monday 2 January 1659/60"),
+                            ],
+                        },
+                        ...
+                    ],
+                },
+                ...
+            ]
+
+        where each reference is a tuple of the Entry's pk, diary_date and
+        title. Doesn't include years/months where there are no referring
+        Entries.
+
+        It's cached, using the version of this Topic's references cache tag
+        in the key. That changes whenever this Topic is saved, its
+        diary_references change, or one of those Entries is saved or deleted
+        (see CacheTagsMixin and common.signals), so it's made afresh after any
+        of those. But not when a comment on this Topic is posted.
+        """
+        tag = self.make_references_cache_tag(self.pk)
+        version = get_cache_tag_versions([tag])[tag]
+        cache_key = f"encyclopedia:topic_references_timeline:{self.pk}:{version}"
+
+        timeline = cache.get(cache_key)
+        if timeline is None:
+            timeline = self._make_diary_references_timeline()
+            cache.set(cache_key, timeline, self.references_timeline_timeout)
+        return timeline
+
+    def _make_diary_references_timeline(self):
+        "Makes the data for get_diary_references_timeline() with one query."
+        timeline = []
+        for pk, diary_date, title in self.diary_references.order_by(
+            "diary_date"
+        ).values_list("pk", "diary_date", "title"):
+            year = get_year(diary_date)
+            if len(timeline) == 0 or timeline[-1]["year"] != year:
+                timeline.append({"year": year, "count": 0, "months": []})
+            months = timeline[-1]["months"]
+
+            month = get_month_b(diary_date)
+            if len(months) == 0 or months[-1]["month"] != month:
+                months.append({"month": month, "count": 0, "references": []})
+
+            months[-1]["references"].append((pk, diary_date, title))
+            months[-1]["count"] += 1
+            timeline[-1]["count"] += 1
+        return timeline
+
+    def get_brief_diary_references(self):
+        """
+        Returns a list of brief Entry objects, in date order, for all of this
+        Topic's diary references. They only have pk, diary_date and title set,
+        enough to use get_absolute_url() and to link to them in the API.
+
+        Uses the cached get_diary_references_timeline().
+        """
+        entry_model = self.diary_references.model
+        return [
+            entry_model(pk=pk, diary_date=diary_date, title=title)
+            for year in self.get_diary_references_timeline()
+            for month in year["months"]
+            for pk, diary_date, title in month["references"]
+        ]
 
     def get_annotated_diary_references(self):
         """
@@ -284,30 +443,45 @@ class Topic(PepysModel):
                 ...
             ]
 
-        We only use diary_references_brief, so we defer fetching bigger
-        text fields on the Entries.
-        """
-        refs = []
-        year_refs = []
-        month_refs = []
-        prev_year = None
-        prev_yearmonth = None
-        for ref in self.diary_references_brief.order_by("diary_date"):
-            if ref.year + ref.month_b != prev_yearmonth:
-                if prev_yearmonth is not None:
-                    year_refs[1].append(month_refs)
-                month_refs = [ref.month_b, []]
-            if ref.year != prev_year:
-                if prev_year is not None:
-                    refs.append(year_refs)
-                year_refs = [ref.year, []]
-            month_refs[1].append(ref)
-            prev_year = ref.year
-            prev_yearmonth = ref.year + ref.month_b
-        if len(year_refs) > 0:
-            year_refs[1].append(month_refs)
-            refs.append(year_refs)
-        return refs
+        The Entries are brief ones, like get_brief_diary_references(), made
+        from the cached get_diary_references_timeline().
+        """
+        entry_model = self.diary_references.model
+        return [
+            [
+                year["year"],
+                [
+                    [
+                        month["month"],
+                        [
+                            entry_model(pk=pk, diary_date=diary_date, title=title)
+                            for pk, diary_date, title in month["references"]
+                        ],
+                    ]
+                    for month in year["months"]
+                ],
+            ]
+            for year in self.get_diary_references_timeline()
+        ]
+
+    def get_related_topics(self):
+        """
+        Returns a list of brief Topic objects, with only pk and title, for the
+        Topics most often referred to in the same Diary Entries as this one,
+        most related first. Each has `related_score` and `shared_entry_count`
+        attributes, from its RelatedTopic.
+
+        These are made in bulk by TopicManager.build_related_topics().
+        """
+        return list(
+            Topic.objects.filter(related_to_scores__topic=self)
+            .annotate(
+                related_score=models.F("related_to_scores__score"),
+                shared_entry_count=models.F("related_to_scores__entry_count"),
+            )
+            .only("pk", "title")
+            .order_by("-related_score", "pk")
+        )
 
     # Useful in the templates:
 
@@ -341,6 +515,52 @@ class Topic(PepysModel):
                 return True
         return False
 
+    def get_kind(self):
+        """
+        Returns one of the Topic.Kind values.
+        When getting this for many Topics use Topic.objects.with_kinds()
+        instead, which avoids several queries per Topic.
+        """
+        if self.is_person:
+            return self.Kind.PERSON
+        elif self.is_place:
+            return self.Kind.PLACE
+        else:
+            return self.Kind.DEFAULT
+
+
+class RelatedTopic(models.Model):
+    """
+    One of the Topics most often referred to in the same Diary Entries as
+    another Topic. These are all replaced at once by
+    TopicManager.build_related_topics(), so they're not edited or
+    timestamped individually.
+    """
+
+    topic = models.ForeignKey(
+        Topic, on_delete=models.CASCADE, related_name="related_topic_scores"
+    )
+    related_topic = models.ForeignKey(
+        Topic, on_delete=models.CASCADE, related_name="related_to_scores"
+    )
+    score = models.FloatField(
+        help_text="How strongly related the Topics are. Higher is more related."
+    )
+    entry_count = models.PositiveIntegerField(
+        help_text="The number of Diary Entries that refer to both Topics."
+    )
+
+    class Meta:
+        ordering = ["topic", "-score"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["topic", "related_topic"], name="unique_related_topic"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.topic_id} -> {self.related_topic_id}"
+
 
 class TopicModerator(CommentModerator):
     email_notification = False
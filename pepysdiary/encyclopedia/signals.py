@@ -1,8 +1,21 @@
-from django.db.models.signals import m2m_changed, post_delete, pre_delete
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
 
+from .category_tree import category_tree
 from .models import Category, Topic
 
 
+def category_changed(sender, **kwargs):
+    """
+    When a Category is added, changed (including its topic_count) or deleted,
+    the in-memory snapshot of the Category tree needs rebuilding.
+    """
+    category_tree.invalidate()
+
+
+post_save.connect(category_changed, sender=Category)
+post_delete.connect(category_changed, sender=Category)
+
+
 def topic_categories_changed(sender, **kwargs):
     """
     When we add or remove categories on this topic, we need to re-set those
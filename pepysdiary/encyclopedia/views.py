@@ -8,8 +8,10 @@ from django.views.decorators.csrf import csrf_protect
 from django.views.generic import FormView, TemplateView
 from django.views.generic.detail import DetailView
 
+from pepysdiary.common.caching import make_cache_tag
 from pepysdiary.common.views import CacheMixin
 
+from .category_tree import category_tree
 from .forms import CategoryMapForm
 from .models import Category, Topic
 
@@ -18,12 +20,13 @@ DEFAULT_MAP_CATEGORY_ID = 28
 
 
 class EncyclopediaView(CacheMixin, TemplateView):
-    cache_timeout = 60 * 60
+    cache_timeout = 60 * 60 * 24
+    cache_tags = (make_cache_tag(Category), make_cache_tag(Topic))
     template_name = "encyclopedia/category_list.html"
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["categories"] = Category.get_annotated_list()
+        context["categories"] = category_tree.get_annotated_list()
         context["topic_count"] = Topic.objects.count()
         return context
 
@@ -74,12 +77,28 @@ class CategoryDetailView(DetailView):
         return context
 
 
-class TopicDetailView(DetailView):
+class TopicDetailView(CacheMixin, DetailView):
     model = Topic
+    cache_timeout = 60 * 60 * 24
+    cache_anonymous_only = True
+
+    def get_cache_tags(self):
+        "The page also lists the Categories the Topic is in."
+        return (make_cache_tag(Topic, self.kwargs["pk"]), make_cache_tag(Category))
+
+    def get_queryset(self):
+        return Topic.objects.with_large_fields(
+            "summary_html", "wheatley_html", "wikipedia_html", "shape"
+        )
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["diary_references"] = self.object.get_annotated_diary_references()
+        references = self.object.get_annotated_diary_references()
+        context["diary_references"] = references
+        context["diary_references_count"] = sum(
+            len(entries) for _, months in references for _, entries in months
+        )
+        context["related_topics"] = self.object.get_related_topics()
         return context
 
 
@@ -141,10 +160,17 @@ class CategoryMapView(FormView):
 
         if self.category:
             # Get this Category's Topics with locations:
-            topics = list(self.category.topics.exclude(latitude__isnull=True))
+            # (The template uses their shapes.)
+            topics = list(
+                self.category.topics.with_large_fields("shape").exclude(
+                    latitude__isnull=True
+                )
+            )
             # Add Pepys' homes to every map.
             kwargs["topics"] = topics + list(
-                Topic.objects.filter(pk__in=kwargs["pepys_homes_ids"])
+                Topic.objects.with_large_fields("shape").filter(
+                    pk__in=kwargs["pepys_homes_ids"]
+                )
             )
 
         return kwargs
@@ -1,28 +1,364 @@
+import logging
+import re
+import threading
+import time
+from urllib.parse import unquote, urlsplit
+
 import bleach
 import requests
 from bleach.css_sanitizer import CSSSanitizer
 from bs4 import BeautifulSoup
+from bs4.element import NavigableString, PreformattedString
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+# Pretty much most elements, but no forms or audio/video.
+ALLOWED_TAGS = {
+    "a",
+    "abbr",
+    "acronym",
+    "address",
+    "area",
+    "article",
+    "b",
+    "blockquote",
+    "br",
+    "caption",
+    "cite",
+    "code",
+    "col",
+    "colgroup",
+    "dd",
+    "del",
+    "dfn",
+    "div",
+    "dl",
+    "dt",
+    "em",
+    "figcaption",
+    "figure",
+    "footer",
+    "h1",
+    "h2",
+    "h3",
+    "h4",
+    "h5",
+    "h6",
+    "header",
+    "hgroup",
+    "hr",
+    "i",
+    "img",
+    "ins",
+    "kbd",
+    "li",
+    "map",
+    "nav",
+    "ol",
+    "p",
+    "pre",
+    "q",
+    "s",
+    "samp",
+    "section",
+    "small",
+    "span",
+    "strong",
+    "sub",
+    "sup",
+    "table",
+    "tbody",
+    "td",
+    "tfoot",
+    "th",
+    "thead",
+    "time",
+    "tr",
+    "ul",
+    "var",
+    # We allow script and style here, so we can close/un-mis-nest
+    # their tags, but then they're removed completely, with their contents,
+    # because they're also in STRIP_SELECTORS:
+    "script",
+    "style",
+}
+
+# These attributes will not be removed from any of the allowed tags.
+# "*" are allowed on all tags.
+ALLOWED_ATTRIBUTES = {
+    "*": ["class", "id"],
+    "a": ["href", "title"],
+    "abbr": ["title"],
+    "acronym": ["title"],
+    "img": ["alt", "src", "srcset"],
+    # Ugh. Don't know why this page doesn't use .tright like others
+    # http://127.0.0.1:8000/encyclopedia/5040/
+    "table": ["align"],
+    "td": ["colspan", "rowspan", "style"],
+    "th": ["colspan", "rowspan", "scope"],
+}
+
+# These CSS properties are allowed within style attributes
+# Added for the family tree on /encyclopedia/5825/
+# Hopefully doesn't make anything else too hideous.
+ALLOWED_CSS_PROPERTIES = [
+    "background",
+    "border",
+    "border-bottom",
+    "border-collapse",
+    "border-left",
+    "border-radius",
+    "border-right",
+    "border-spacing",
+    "border-top",
+    "height",
+    "padding",
+    "text-align",
+    "width",
+]
+
+# CSS selectors. Strip these and their contents.
+# Only selectors like "tag" or "tag.class.class" are supported.
+STRIP_SELECTORS = [
+    "div.hatnote",
+    "div.navbar.mini",  # Will also match div.mini.navbar
+    # Bottom of https://en.wikipedia.org/wiki/Charles_II_of_England :
+    "div.topicon",
+    "a.mw-headline-anchor",
+    "script",
+    "style",
+]
+
+# Strip any element that has one of these classes.
+STRIP_CLASSES = [
+    # "This article may be expanded with text translated from..."
+    # https://en.wikipedia.org/wiki/Afonso_VI_of_Portugal
+    "ambox-notice",
+    "magnify",
+    # eg audio on https://en.wikipedia.org/wiki/Bagpipes
+    "mediaContainer",
+    "navbox",
+    "noprint",
+]
+
+# Any element has a class matching a key, it will have the classes
+# in the value added.
+ADD_CLASSES = {
+    # Give these tables standard Bootstrap styles.
+    "infobox": ["table", "table-bordered"],
+    "ambox": ["table", "table-bordered"],
+    "wikitable": ["table", "table-bordered"],
+}
+
+# Attributes containing URIs must use one of these, or be relative:
+ALLOWED_PROTOCOLS = {"http", "https", "mailto"}
+
+# Used to remove disallowed properties from style attributes:
+_CSS_SANITIZER = CSSSanitizer(allowed_css_properties=ALLOWED_CSS_PROPERTIES)
+
+# Which of ALLOWED_ATTRIBUTES contain URIs, to check their protocols.
+_URI_ATTRIBUTES = {"href", "src"}
+
+# STRIP_SELECTORS as (tag name, set of classes) tuples, for _tidy_html():
+_STRIP_RULES = [
+    (selector.split(".")[0], set(selector.split(".")[1:]))
+    for selector in STRIP_SELECTORS
+]
+
+
+class TokenBucket:
+    """
+    A thread-safe rate limiter. Holds up to `capacity` tokens, which are
+    refilled at `rate` tokens per second. Each call to acquire() takes one
+    token, waiting until one is available.
+
+    So, on average, acquire() returns no more than `rate` times per second,
+    with bursts of up to `capacity` at once.
+    """
+
+    def __init__(self, rate, capacity=None):
+        if rate <= 0:
+            msg = "rate should be more than 0."
+            raise ValueError(msg)
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1, rate)
+        self._tokens = self.capacity
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._last_refill) * self.rate
+                )
+                self._last_refill = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
 
 
 class WikipediaFetcher:
-    def fetch(self, page_name):
+    """
+    Fetches and tidies the HTML of Wikipedia pages.
+
+    One instance can be shared between threads. It uses a single pooled
+    HTTP session, retrying failed requests (connection errors, timeouts,
+    429 and 5xx responses) with exponential backoff.
+
+    base_url -- Change this to fetch pages, and use the MediaWiki API, from
+                somewhere else, e.g. a local server in tests.
+    rate_limiter -- Optional; a TokenBucket to limit how often we make
+                    requests, shared by all threads using this fetcher.
+    max_retries -- Maximum number of times to retry each request.
+    backoff_factor -- Wait this many seconds before the first retry, then
+                      twice as long before the next, etc.
+    pool_size -- Maximum number of connections to keep open. Should be at
+                 least the number of threads using this fetcher.
+    timeout -- Seconds to wait for the server to respond.
+    """
+
+    base_url = "https://en.wikipedia.org"
+
+    # Wikipedia asks that we identify ourselves:
+    user_agent = "PepysDiary (https://www.pepysdiary.com/)"
+
+    # The most pages the MediaWiki API lets us ask about in one request:
+    titles_per_request = 50
+
+    def __init__(
+        self,
+        *,
+        base_url=None,
+        rate_limiter=None,
+        max_retries=3,
+        backoff_factor=0.5,
+        pool_size=10,
+        timeout=5,
+    ):
+        if base_url is not None:
+            self.base_url = base_url
+        self.rate_limiter = rate_limiter
+        self.timeout = timeout
+
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods={"GET"},
+            # Return the final error response rather than raising an exception:
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size, max_retries=retry
+        )
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = self.user_agent
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def fetch(self, page_name, *, tidy=True):
         """
         Passed a Wikipedia page's URL fragment, like
         'Edward_Montagu,_1st_Earl_of_Sandwich', this will fetch the page's
         main contents, tidy the HTML, strip out any elements we don't want
         and return the final HTML string.
 
+        If tidy is False, the HTML is returned as Wikipedia sent it.
+
         Returns a dict with two elements:
             'success' is either True or, if we couldn't fetch the page, False.
             'content' is the HTML if success==True, or else an error message.
         """
         result = self._get_html(page_name)
 
-        if result["success"]:
+        if result["success"] and tidy:
             result["content"] = self._tidy_html(result["content"])
 
         return result
 
+    def get_revision_ids(self, page_names):
+        """
+        Passed a list of Wikipedia page names, like those passed to fetch(),
+        this gets the ID of the current revision of each page from the
+        MediaWiki API, asking about many pages in each request.
+
+        Redirects are followed, as they are when fetching a page, so a
+        redirect's revision ID is that of the page it redirects to.
+
+        Returns a dict of page name: revision ID (int). Pages that don't
+        exist, or that we failed to get the revision of, aren't included.
+        """
+        page_names = list(dict.fromkeys(page_names))
+        revision_ids = {}
+        for i in range(0, len(page_names), self.titles_per_request):
+            revision_ids.update(
+                self._get_revision_ids(page_names[i : i + self.titles_per_request])
+            )
+        return revision_ids
+
+    def _get_revision_ids(self, page_names):
+        """
+        Does the work of get_revision_ids() for up to `titles_per_request`
+        page names, with a single request.
+        """
+        # Page names are from URLs, e.g. "Edward_Montagu%2C_1st_Earl", but
+        # the API wants titles, e.g. "Edward Montagu, 1st Earl".
+        titles = {
+            page_name: unquote(page_name).replace("_", " ") for page_name in page_names
+        }
+
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+
+        try:
+            response = self.session.get(
+                f"{self.base_url}/w/api.php",
+                params={
+                    "action": "query",
+                    "format": "json",
+                    "formatversion": 2,
+                    "prop": "revisions",
+                    "rvprop": "ids",
+                    "redirects": 1,
+                    "titles": "|".join(titles.values()),
+                },
+                timeout=self.timeout,
+            )
+            response.raise_for_status()
+            query = response.json()["query"]
+        except (requests.exceptions.RequestException, ValueError, KeyError):
+            logger.warning(
+                "Couldn't get revision IDs of Wikipedia pages: %s",
+                ", ".join(page_names),
+                exc_info=True,
+            )
+            return {}
+
+        # The API tells us how it changed the titles we asked for, and then
+        # which of those were redirects to other pages:
+        normalized = {item["from"]: item["to"] for item in query.get("normalized", [])}
+        redirects = {item["from"]: item["to"] for item in query.get("redirects", [])}
+        # Missing pages have no revisions:
+        page_revision_ids = {
+            page["title"]: page["revisions"][0]["revid"]
+            for page in query.get("pages", [])
+            if page.get("revisions")
+        }
+
+        revision_ids = {}
+        for page_name, title in titles.items():
+            title = normalized.get(title, title)
+            title = redirects.get(title, title)
+            if title in page_revision_ids:
+                revision_ids[page_name] = page_revision_ids[title]
+        return revision_ids
+
     def _get_html(self, page_name):
         """
         Passed the name of a Wikipedia page (eg, 'Samuel_Pepys'), it fetches
@@ -34,16 +370,23 @@ class WikipediaFetcher:
         """
         error_message = ""
 
-        url = f"https://en.wikipedia.org/wiki/{page_name}"
+        url = f"{self.base_url}/wiki/{page_name}"
+
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
 
         try:
-            response = requests.get(url, params={"action": "render"}, timeout=5)
+            response = self.session.get(
+                url, params={"action": "render"}, timeout=self.timeout
+            )
         except requests.exceptions.ConnectionError:
             error_message = "Can't connect to domain."
         except requests.exceptions.Timeout:
             error_message = "Connection timed out."
         except requests.exceptions.TooManyRedirects:
             error_message = "Too many redirects."
+        except requests.exceptions.RetryError:
+            error_message = "Too many retries."
 
         try:
             response.raise_for_status()
@@ -63,6 +406,88 @@ class WikipediaFetcher:
         """
         Passed the raw Wikipedia HTML, this returns valid HTML, with all
         disallowed elements stripped out.
+
+        This parses the HTML once and makes a single pass over the tree:
+        removing comments; unwrapping tags that aren't in ALLOWED_TAGS
+        (keeping their contents); removing elements matching
+        STRIP_SELECTORS or STRIP_CLASSES, and their contents; removing
+        attributes that aren't in ALLOWED_ATTRIBUTES, or whose URLs don't use
+        ALLOWED_PROTOCOLS; sanitizing style attributes; and adding
+        ADD_CLASSES.
+
+        The output should be the same as that of _tidy_html_legacy().
+        """
+        soup = BeautifulSoup(html, "lxml")
+
+        # Depending on the HTML parser BeautifulSoup used, soup may have
+        # surrounding <html><body></body></html> or just <body></body> tags.
+        if soup.body:
+            soup = soup.body
+        elif soup.html:
+            soup = soup.html.body
+
+        self._tidy_children(soup)
+
+        # Put the content back into a string.
+        return "".join(str(tag) for tag in soup.contents)
+
+    def _tidy_children(self, element):
+        "Does the work of _tidy_html() on all of element's descendants."
+        for child in list(element.contents):
+            if isinstance(child, NavigableString):
+                # Comments, CDATA, doctypes, etc:
+                if isinstance(child, PreformattedString):
+                    child.extract()
+            elif child.name not in ALLOWED_TAGS:
+                self._tidy_children(child)
+                child.unwrap()
+            elif self._is_stripped(child):
+                child.decompose()
+            else:
+                self._tidy_attributes(child)
+                self._tidy_children(child)
+
+    def _is_stripped(self, tag):
+        """
+        Whether tag matches one of STRIP_SELECTORS or has one of
+        STRIP_CLASSES, so should be removed with its contents.
+        """
+        classes = set(tag.get("class", []))
+        if not classes.isdisjoint(STRIP_CLASSES):
+            return True
+        return any(
+            tag.name == name and required_classes <= classes
+            for name, required_classes in _STRIP_RULES
+        )
+
+    def _tidy_attributes(self, tag):
+        """
+        Removes tag's disallowed attributes, sanitizes its style attribute,
+        and adds any ADD_CLASSES.
+        """
+        allowed = ALLOWED_ATTRIBUTES["*"] + ALLOWED_ATTRIBUTES.get(tag.name, [])
+        for name, value in list(tag.attrs.items()):
+            if name not in allowed or (
+                name in _URI_ATTRIBUTES and not _is_allowed_uri(value)
+            ):
+                del tag[name]
+            elif name == "style":
+                tag[name] = _CSS_SANITIZER.sanitize_css(value)
+
+        classes = tag.get("class")
+        if classes:
+            for clss, new_classes in ADD_CLASSES.items():
+                if clss in classes:
+                    tag["class"] = tag["class"] + new_classes
+
+    def _tidy_html_legacy(self, html):
+        """
+        The previous version of _tidy_html(), which parses the HTML twice,
+        once with bleach and once with BeautifulSoup, then runs a search of
+        the tree for each of STRIP_SELECTORS, STRIP_CLASSES and ADD_CLASSES.
+
+        Kept so that we can check _tidy_html() does the same, and compare
+        their speed. See the benchmark_wikipedia_tidy management command.
         """
         html = self._bleach_html(html)
         html = self._strip_html(html)
@@ -76,122 +501,15 @@ class WikipediaFetcher:
 
         Pass it an HTML string, it'll return the bleached HTML string.
         """
-
-        # Pretty much most elements, but no forms or audio/video.
-        allowed_tags = {
-            "a",
-            "abbr",
-            "acronym",
-            "address",
-            "area",
-            "article",
-            "b",
-            "blockquote",
-            "br",
-            "caption",
-            "cite",
-            "code",
-            "col",
-            "colgroup",
-            "dd",
-            "del",
-            "dfn",
-            "div",
-            "dl",
-            "dt",
-            "em",
-            "figcaption",
-            "figure",
-            "footer",
-            "h1",
-            "h2",
-            "h3",
-            "h4",
-            "h5",
-            "h6",
-            "header",
-            "hgroup",
-            "hr",
-            "i",
-            "img",
-            "ins",
-            "kbd",
-            "li",
-            "map",
-            "nav",
-            "ol",
-            "p",
-            "pre",
-            "q",
-            "s",
-            "samp",
-            "section",
-            "small",
-            "span",
-            "strong",
-            "sub",
-            "sup",
-            "table",
-            "tbody",
-            "td",
-            "tfoot",
-            "th",
-            "thead",
-            "time",
-            "tr",
-            "ul",
-            "var",
-            # We allow script and style here, so we can close/un-mis-nest
-            # its tags, but then it's removed completely in _strip_html():
-            "script",
-            "style",
-        }
-
-        # These attributes will not be removed from any of the allowed tags.
-        allowed_attributes = {
-            "*": ["class", "id"],
-            "a": ["href", "title"],
-            "abbr": ["title"],
-            "acronym": ["title"],
-            "img": ["alt", "src", "srcset"],
-            # Ugh. Don't know why this page doesn't use .tright like others
-            # http://127.0.0.1:8000/encyclopedia/5040/
-            "table": ["align"],
-            "td": ["colspan", "rowspan", "style"],
-            "th": ["colspan", "rowspan", "scope"],
-        }
-
-        # These CSS properties are allowed within style attributes
-        # Added for the family tree on /encyclopedia/5825/
-        # Hopefully doesn't make anything else too hideous.
-        allowed_css_properties = [
-            "background",
-            "border",
-            "border-bottom",
-            "border-collapse",
-            "border-left",
-            "border-radius",
-            "border-right",
-            "border-spacing",
-            "border-top",
-            "height",
-            "padding",
-            "text-align",
-            "width",
-        ]
-
-        css_sanitizer = CSSSanitizer(allowed_css_properties=allowed_css_properties)
-
-        a = bleach.clean(
+        return bleach.clean(
             html,
-            tags=allowed_tags,
-            attributes=allowed_attributes,
-            css_sanitizer=css_sanitizer,
+            tags=ALLOWED_TAGS,
+            attributes=ALLOWED_ATTRIBUTES,
+            protocols=ALLOWED_PROTOCOLS,
+            css_sanitizer=_CSS_SANITIZER,
             strip=True,
         )
 
-        return a
-
     def _strip_html(self, html):
         """
         Takes out any tags, and their contents, that we don't want at all.
@@ -200,48 +518,15 @@ class WikipediaFetcher:
 
         Pass it an HTML string, it returns the stripped HTML string.
         """
-
-        # CSS selectors. Strip these and their contents.
-        selectors = [
-            "div.hatnote",
-            "div.navbar.mini",  # Will also match div.mini.navbar
-            # Bottom of https://en.wikipedia.org/wiki/Charles_II_of_England :
-            "div.topicon",
-            "a.mw-headline-anchor",
-            "script",
-            "style",
-        ]
-
-        # Strip any element that has one of these classes.
-        classes = [
-            # "This article may be expanded with text translated from..."
-            # https://en.wikipedia.org/wiki/Afonso_VI_of_Portugal
-            "ambox-notice",
-            "magnify",
-            # eg audio on https://en.wikipedia.org/wiki/Bagpipes
-            "mediaContainer",
-            "navbox",
-            "noprint",
-        ]
-
-        # Any element has a class matching a key, it will have the classes
-        # in the value added.
-        add_classes = {
-            # Give these tables standard Bootstrap styles.
-            "infobox": ["table", "table-bordered"],
-            "ambox": ["table", "table-bordered"],
-            "wikitable": ["table", "table-bordered"],
-        }
-
         soup = BeautifulSoup(html, "lxml")
 
-        for selector in selectors:
+        for selector in STRIP_SELECTORS:
             [tag.decompose() for tag in soup.select(selector)]
 
-        for clss in classes:
+        for clss in STRIP_CLASSES:
             [tag.decompose() for tag in soup.find_all(attrs={"class": clss})]
 
-        for clss, new_classes in add_classes.items():
+        for clss, new_classes in ADD_CLASSES.items():
             for tag in soup.find_all(attrs={"class": clss}):
                 tag["class"] = tag.get("class", []) + new_classes
 
@@ -256,3 +541,17 @@ class WikipediaFetcher:
         html = "".join(str(tag) for tag in soup.contents)
 
         return html
+
+
+def _is_allowed_uri(value):
+    """
+    Whether the value of an attribute containing a URI, like href, is
+    relative or uses one of ALLOWED_PROTOCOLS. The same test bleach uses.
+    """
+    # Remove backticks, spaces and control characters, as browsers would:
+    uri = re.sub(r"[`\000-\040\177-\240\s]+", "", value).replace("\ufffd", "")
+    try:
+        scheme = urlsplit(uri.lower()).scheme
+    except ValueError:
+        return False
+    return not scheme or scheme in ALLOWED_PROTOCOLS
@@ -6,12 +6,12 @@ from django.utils import timezone
 from django_comments.moderation import CommentModerator, moderator
 from markdown import markdown
 
-from pepysdiary.common.models import PepysModel
+from pepysdiary.common.models import CacheTagsMixin, PepysModel, SearchDocumentMixin
 
 from .managers import PublishedArticleManager
 
 
-class Article(PepysModel):
+class Article(SearchDocumentMixin, CacheTagsMixin, PepysModel):
     """
     An In-Depth Article.
     """
@@ -104,7 +104,9 @@ class Article(PepysModel):
         help_text="e.g. if this is a book review, the author(s) of the book",
     )
 
-    # Also see index_components() method.
+    # The fields, and their weights, used to make the search_document.
+    # See SearchDocumentMixin.
+    search_fields = (("title", "A"), ("intro", "B"), ("text", "B"))
     search_document = SearchVectorField(null=True)
 
     objects = models.Manager()
@@ -137,12 +139,6 @@ class Article(PepysModel):
             },
         )
 
-    def index_components(self):
-        """Used by common.signals.on_save() to update the SearchVector on
-        self.search_document.
-        """
-        return ((self.title, "A"), (self.intro, "B"), (self.text, "B"))
-
     @property
     def category_title(self):
         """
@@ -1,18 +1,23 @@
-import re
-
 from django.contrib.postgres.indexes import GinIndex
 from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.urls import reverse
 from django_comments.moderation import CommentModerator, moderator
 
-from pepysdiary.common.models import OldDateMixin, PepysModel
-from pepysdiary.encyclopedia.models import Topic
+from pepysdiary.common.models import (
+    CacheTagsMixin,
+    OldDateMixin,
+    PepysModel,
+    SearchDocumentMixin,
+    TopicReferencesMixin,
+)
 
 from .managers import LetterManager
 
 
-class Letter(PepysModel, OldDateMixin):
+class Letter(
+    SearchDocumentMixin, TopicReferencesMixin, CacheTagsMixin, PepysModel, OldDateMixin
+):
     class Source(models.IntegerChoices):
         GUY_DE_LA_BEDOYERE = 10, "Guy de la Bédoyère"
         HELEN_TRUESDELL_HEATH = 20, "Helen Truesdell Heath"
@@ -71,7 +76,9 @@ class Letter(PepysModel, OldDateMixin):
     old_date_field = "letter_date"
     comment_name = "annotation"
 
-    # Also see index_components() method.
+    # The fields, and their weights, used to make the search_document.
+    # See SearchDocumentMixin.
+    search_fields = (("title", "A"), ("text", "B"), ("footnotes", "C"))
     search_document = SearchVectorField(null=True)
 
     # Will also have a 'topics' ManyToMany field, from Topic.
@@ -103,36 +110,6 @@ class Letter(PepysModel, OldDateMixin):
             },
         )
 
-    def index_components(self):
-        """Used by common.signals.on_save() to update the SearchVector on
-        self.search_document.
-        """
-        return (
-            (self.title, "A"),
-            (self.text, "B"),
-            (self.footnotes, "C"),
-        )
-
-    def make_references(self):
-        """
-        Sets all the Encyclopedia Topics the text of this letter (and
-        footnotes) refers to. Saves them to the database.
-        """
-        self.topics.clear()
-        # Get a list of all the Topic IDs mentioned in text and footnotes:
-        ids = re.findall(
-            r"pepysdiary.com\/encyclopedia\/(\d+)\/", f"{self.text} {self.footnotes}"
-        )
-        # Make sure list of Topic IDs is unique:
-        # From http://stackoverflow.com/a/480227/250962
-        seen = set()
-        seen_add = seen.add
-        unique_ids = [id for id in ids if id not in seen and not seen_add(id)]
-
-        for id in unique_ids:
-            topic = Topic.objects.get(pk=id)
-            topic.letter_references.add(self)
-
     @property
     def short_date(self):
         """
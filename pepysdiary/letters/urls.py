@@ -1,7 +1,12 @@
 from django.urls import path, re_path
 
 from .feeds import LatestLettersFeed
-from .views import LetterArchiveView, LetterDetailView, LetterPersonView
+from .views import (
+    LetterArchiveView,
+    LetterDetailView,
+    LetterPersonView,
+    LetterTooltipsView,
+)
 
 # ALL REDIRECTS are in common/urls.py.
 
@@ -12,6 +17,12 @@ urlpatterns = [
         LetterDetailView.as_view(),
         name="letter_detail",
     ),
+    re_path(
+        r"^(?P<year>\d{4})/(?P<month>\d{2})/(?P<day>\d{2})/"
+        r"(?P<slug>[\w-]+)/tooltips\.json$",
+        LetterTooltipsView.as_view(),
+        name="letter_tooltips",
+    ),
     re_path(
         r"^person/(?P<pk>[\d]+)/$", LetterPersonView.as_view(), name="letter_person"
     ),
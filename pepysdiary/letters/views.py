@@ -1,11 +1,14 @@
 from django.conf import settings
 from django.db.models import Q
+from django.http import Http404
 from django.shortcuts import redirect
+from django.urls import reverse
 from django.views.generic.base import TemplateView
 from django.views.generic.dates import DateDetailView
 from django.views.generic.detail import SingleObjectMixin
 from django.views.generic.list import ListView
 
+from pepysdiary.common.views import BaseTooltipsView, get_tooltips_url
 from pepysdiary.encyclopedia.models import Topic
 
 from .models import Letter
@@ -20,8 +23,8 @@ class LetterDetailView(DateDetailView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["tooltip_references"] = Letter.objects.get_brief_references(
-            objects=[self.object]
+        context["tooltips_url"] = get_tooltips_url(
+            reverse("letter_tooltips", kwargs=self.kwargs), Letter, [self.object]
         )
         extra_context = self.get_next_previous()
         context.update(extra_context)
@@ -62,6 +65,25 @@ class LetterDetailView(DateDetailView):
         }
 
 
+class LetterTooltipsView(BaseTooltipsView):
+    """The JSON data for the tooltips of the Topics one Letter refers to."""
+
+    model = Letter
+
+    def get_objects(self):
+        letters = list(
+            Letter.objects.filter(
+                letter_date__year=self.kwargs["year"],
+                letter_date__month=self.kwargs["month"],
+                letter_date__day=self.kwargs["day"],
+                slug=self.kwargs["slug"],
+            ).only("pk")
+        )
+        if len(letters) == 0:
+            raise Http404
+        return letters
+
+
 class LetterPersonView(SingleObjectMixin, ListView):
     """
     For displaying all the Letters sent from/to an individual.
@@ -23,4 +23,3 @@ class PersonFactory(factory.django.DjangoModelFactory):
 
 class StaffPersonFactory(PersonFactory):
     is_staff = True
-    is_admin = False
@@ -5,12 +5,12 @@ from django.utils import timezone
 from django_comments.moderation import CommentModerator, moderator
 from markdown import markdown
 
-from pepysdiary.common.models import PepysModel
+from pepysdiary.common.models import CacheTagsMixin, PepysModel, SearchDocumentMixin
 
 from .managers import PublishedPostManager
 
 
-class Post(PepysModel):
+class Post(SearchDocumentMixin, CacheTagsMixin, PepysModel):
     """
     A Site News Post.
     """
@@ -59,7 +59,9 @@ class Post(PepysModel):
         max_length=25, blank=False, null=False, db_index=True, choices=Category.choices
     )
 
-    # Also see index_components() method.
+    # The fields, and their weights, used to make the search_document.
+    # See SearchDocumentMixin.
+    search_fields = (("title", "A"), ("intro", "B"), ("text", "B"))
     search_document = SearchVectorField(null=True)
 
     objects = models.Manager()
@@ -92,12 +94,6 @@ class Post(PepysModel):
             },
         )
 
-    def index_components(self):
-        """Used by common.signals.on_save() to update the SearchVector on
-        self.search_document.
-        """
-        return ((self.title, "A"), (self.intro, "B"), (self.text, "B"))
-
     @property
     def category_title(self):
         """
@@ -8,7 +8,7 @@ if (
     hasattr(settings, "REDIS_URL")
     and settings.REDIS_URL
     and hasattr(settings, "PEPYS_CACHE_TYPE")
-    and settings.PEPYS_CACHE_TYPE == "redis"
+    and settings.PEPYS_CACHE_TYPE in ("redis", "two-tier")
 ):
     redis = Redis.from_url(settings.REDIS_URL)
 else:
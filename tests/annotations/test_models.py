@@ -1,13 +1,21 @@
 from datetime import datetime, timezone
+from unittest.mock import patch
 
 from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
+from django.contrib.sites.models import Site
 from django.test import TestCase
 
-from pepysdiary.annotations.factories import EntryAnnotationFactory
+from pepysdiary.annotations.factories import (
+    EntryAnnotationFactory,
+    TopicAnnotationFactory,
+)
 from pepysdiary.annotations.models import Annotation
 from pepysdiary.common.utilities import make_datetime
 from pepysdiary.diary.factories import EntryFactory
+from pepysdiary.diary.models import Entry
+from pepysdiary.encyclopedia.factories import TopicFactory
+from pepysdiary.encyclopedia.models import Topic
 from pepysdiary.membership.factories import PersonFactory
 
 
@@ -51,6 +59,56 @@ class AnnotationTestCase(TestCase):
         self.assertEqual(len(annotations), 1)
         self.assertIn(visible_annotation, annotations)
 
+    def test_visible_objects_latest_for_objects(self):
+        "It should return the latest visible Annotation on each object"
+        entry_1 = EntryFactory()
+        entry_2 = EntryFactory()
+        entry_3 = EntryFactory()
+        topic = TopicFactory()
+        EntryAnnotationFactory(
+            content_object=entry_1, submit_date=make_datetime("2021-04-09 12:00:00")
+        )
+        latest_1 = EntryAnnotationFactory(
+            content_object=entry_1, submit_date=make_datetime("2021-04-10 12:00:00")
+        )
+        EntryAnnotationFactory(
+            content_object=entry_1,
+            submit_date=make_datetime("2021-04-11 12:00:00"),
+            is_removed=True,
+        )
+        latest_2 = EntryAnnotationFactory(content_object=entry_2)
+        latest_topic = TopicAnnotationFactory(content_object=topic)
+        # Not one of the objects:
+        EntryAnnotationFactory(content_object=entry_3)
+
+        entry_ct = ContentType.objects.get_for_model(Entry)
+        topic_ct = ContentType.objects.get_for_model(Topic)
+        # So that looking up the Site doesn't add a query:
+        Site.objects.get_current()
+        with self.assertNumQueries(1):
+            annotations = Annotation.visible_objects.latest_for_objects(
+                [
+                    (entry_ct.pk, entry_1.pk),
+                    (entry_ct.pk, entry_2.pk),
+                    (topic_ct.pk, topic.pk),
+                    # No Annotations:
+                    (topic_ct.pk, topic.pk + 1),
+                ]
+            )
+
+        self.assertEqual(
+            annotations,
+            {
+                (entry_ct.pk, str(entry_1.pk)): latest_1,
+                (entry_ct.pk, str(entry_2.pk)): latest_2,
+                (topic_ct.pk, str(topic.pk)): latest_topic,
+            },
+        )
+
+    def test_visible_objects_latest_for_objects_none(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(Annotation.visible_objects.latest_for_objects([]), {})
+
     def test_ordering(self):
         "They should be ordered by submit_date ascending"
         entry = EntryFactory()
@@ -147,6 +205,82 @@ class AnnotationTestCase(TestCase):
         self.assertEqual(entry.comment_count, 1)
         self.assertEqual(entry.last_comment_time, annotation_1.submit_date)
 
+    def test_parent_comment_data_on_hide(self):
+        "When hiding an annotation, the parent's comment data should be recalculated"
+        entry = EntryFactory()
+        annotation_1 = EntryAnnotationFactory(
+            content_object=entry, submit_date=make_datetime("2021-04-09 12:00:00")
+        )
+        annotation_2 = EntryAnnotationFactory(
+            content_object=entry, submit_date=make_datetime("2021-04-10 12:00:00")
+        )
+
+        annotation_2.is_removed = True
+        annotation_2.save()
+
+        entry.refresh_from_db()
+
+        self.assertEqual(entry.comment_count, 1)
+        self.assertEqual(entry.last_comment_time, annotation_1.submit_date)
+
+    def test_parent_comment_data_on_unhide(self):
+        "When un-hiding an annotation, the parent's comment data should be updated"
+        entry = EntryFactory()
+        EntryAnnotationFactory(
+            content_object=entry, submit_date=make_datetime("2021-04-09 12:00:00")
+        )
+        annotation = EntryAnnotationFactory(
+            content_object=entry,
+            is_public=False,
+            submit_date=make_datetime("2021-04-10 12:00:00"),
+        )
+
+        annotation = Annotation.objects.get(pk=annotation.pk)
+        annotation.is_public = True
+        annotation.save()
+
+        entry.refresh_from_db()
+
+        self.assertEqual(entry.comment_count, 2)
+        self.assertEqual(entry.last_comment_time, annotation.submit_date)
+
+    def test_parent_comment_data_earlier_annotation(self):
+        "Adding an annotation earlier than the latest shouldn't change the time"
+        entry = EntryFactory()
+        annotation = EntryAnnotationFactory(
+            content_object=entry, submit_date=make_datetime("2021-04-10 12:00:00")
+        )
+        EntryAnnotationFactory(
+            content_object=entry, submit_date=make_datetime("2021-04-09 12:00:00")
+        )
+
+        entry.refresh_from_db()
+
+        self.assertEqual(entry.comment_count, 2)
+        self.assertEqual(entry.last_comment_time, annotation.submit_date)
+
+    def test_parent_comment_data_unchanged(self):
+        "Editing only an annotation's text shouldn't update the parent"
+        entry = EntryFactory()
+        annotation = EntryAnnotationFactory(content_object=entry)
+        annotation = Annotation.objects.get(pk=annotation.pk)
+        annotation.comment = "New text"
+
+        with patch.object(Annotation, "set_parent_comment_data") as set_data:
+            annotation.save()
+            set_data.assert_not_called()
+
+    def test_parent_comment_data_does_not_save_parent(self):
+        "It should update the parent's fields without calling its save() method"
+        entry = EntryFactory()
+
+        with patch("pepysdiary.diary.models.Entry.save") as entry_save:
+            EntryAnnotationFactory(content_object=entry)
+            entry_save.assert_not_called()
+
+        entry.refresh_from_db()
+        self.assertEqual(entry.comment_count, 1)
+
     def test_parent_comment_data_no_content_type_model(self):
         "If the content_type has no associated model saving should raise an exception"
         ct = ContentType()
@@ -4,6 +4,8 @@ from decimal import Decimal
 
 from django.contrib.sites.models import Site
 from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from freezegun import freeze_time
 from rest_framework.test import APITestCase
@@ -14,6 +16,7 @@ from pepysdiary.annotations.factories import (
 )
 from pepysdiary.common.utilities import make_date, make_datetime
 from pepysdiary.diary.factories import EntryFactory
+from pepysdiary.encyclopedia import category_lookups
 from pepysdiary.encyclopedia.factories import (
     PersonTopicFactory,
     PlaceTopicFactory,
@@ -558,6 +561,35 @@ class TopicListViewTestCase(SiteAPITestCase):
             ),
         )
 
+    def test_num_queries(self):
+        "The number of queries shouldn't depend on the number of Topics"
+        # PEOPLE and PLACES need explicit ids, so all Categories here have
+        # them, in case ids assigned by the database would collide.
+        people = Category.add_root(
+            id=category_lookups.PEOPLE, title="People", slug="people"
+        )
+        places = Category.add_root(
+            id=category_lookups.PLACES, title="Places", slug="places"
+        )
+        animals = Category.add_root(id=10001, title="Animals", slug="animals")
+        url = reverse("api:topic-list", kwargs={"format": "json"})
+
+        def count_queries():
+            with CaptureQueriesContext(connection) as context:
+                self.client.get(url, SERVER_NAME="example.com")
+            return len(context.captured_queries)
+
+        for category in (people, places, animals):
+            TopicFactory(categories=[category])
+        # Once to get any one-off queries, like the current Site, out of the way:
+        count_queries()
+        num_queries = count_queries()
+
+        for _ in range(3):
+            for category in (people, places, animals):
+                TopicFactory(categories=[category])
+        self.assertEqual(count_queries(), num_queries)
+
     def test_response_pagination(self):
         """Pagination-related results should be correct."""
         cat = Category.add_root(title="Animals", slug="animals")
@@ -643,6 +675,7 @@ class TopicDetailViewTestCase(SiteAPITestCase):
                 "shape": "",
                 "categories": [f"http://example.com/api/v1/categories/{cat.slug}.json"],
                 "entries": [],
+                "relatedTopics": [],
                 "lastModifiedTime": "2021-06-01T12:00:00Z",
                 "apiURL": f"http://example.com/api/v1/topics/{topic.pk}.json",
                 "webURL": f"http://example.com/encyclopedia/{topic.pk}/",
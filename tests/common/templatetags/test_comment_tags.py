@@ -0,0 +1,120 @@
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.template import Context, RequestContext, Template, TemplateSyntaxError
+from django.test import RequestFactory, TestCase, override_settings
+
+from pepysdiary.annotations.factories import EntryAnnotationFactory
+from pepysdiary.common.caching import fragment_cache_counts
+from pepysdiary.common.templatetags.comment_tags import get_comment_list_cache_key
+from pepysdiary.common.utilities import make_date, make_datetime
+from pepysdiary.diary.factories import EntryFactory
+from pepysdiary.diary.models import Entry
+from pepysdiary.membership.factories import PersonFactory
+from tests.common.test_caching import LOCMEM_CACHES
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RenderCachedCommentListTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.initial_counts = fragment_cache_counts.copy()
+        self.entry = EntryFactory(diary_date=make_date("1660-01-01"))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.annotation = EntryAnnotationFactory(
+                content_object=self.entry,
+                comment="First comment",
+                submit_date=make_datetime("2021-04-09 01:00:00"),
+            )
+
+    def _render(self, user=None, **context):
+        "Renders the tag as a page would, with the context processors"
+        request = RequestFactory().get("/")
+        request.user = user or AnonymousUser()
+        return self._render_context(RequestContext(request, context))
+
+    def _render_context(self, context):
+        # Fetch the Entry again, to get its updated comment data:
+        if "object" not in context:
+            context["object"] = Entry.objects.get(pk=self.entry.pk)
+        return Template(
+            "{% load comment_tags %}{% render_cached_comment_list for object %}"
+        ).render(context)
+
+    def _count_change(self, key):
+        return fragment_cache_counts[key] - self.initial_counts[key]
+
+    def test_renders_comments(self):
+        html = self._render()
+        self.assertIn("First comment", html)
+        self.assertIn(f'id="c{self.annotation.pk}"', html)
+
+    def test_no_comment_form(self):
+        self.assertNotIn("<form", self._render())
+
+    def test_renders_date(self):
+        self.assertIn("on 9 Apr 2021", self._render())
+
+    def test_without_context_processors(self):
+        "It shouldn't need the things the context processors add"
+        html = self._render_context(Context({}))
+        self.assertIn("on 9 Apr 2021", html)
+        self.assertNotIn("Flag", html)
+
+    def test_cached(self):
+        self._render()
+        entry = Entry.objects.get(pk=self.entry.pk)
+        # A plain Context, as the context processors make queries:
+        with self.assertNumQueries(0):
+            html = self._render_context(Context({"object": entry}))
+        self.assertIn("First comment", html)
+        self.assertEqual(self._count_change("miss"), 1)
+        self.assertEqual(self._count_change("hit"), 1)
+
+    def test_new_comment(self):
+        "Posting a comment should change the cached list"
+        self._render()
+        with self.captureOnCommitCallbacks(execute=True):
+            EntryAnnotationFactory(
+                content_object=self.entry,
+                comment="Second comment",
+                submit_date=make_datetime("2021-04-10 01:00:00"),
+            )
+        self.assertIn("Second comment", self._render())
+
+    def test_edited_comment(self):
+        "Editing a comment, which doesn't change the comment count, should too"
+        self._render()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.annotation.comment = "Edited comment"
+            self.annotation.save()
+        html = self._render()
+        self.assertIn("Edited comment", html)
+        self.assertNotIn("First comment", html)
+
+    def test_hidden_comment(self):
+        self._render()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.annotation.is_public = False
+            self.annotation.save()
+        self.assertNotIn("First comment", self._render())
+
+    def test_varies_with_user(self):
+        "Logged-in users see Flag links, so get a different list"
+        self._render()
+        self.assertIn("Flag", self._render(user=PersonFactory()))
+        self.assertNotIn("Flag", self._render())
+
+    def test_varies_with_edit_permission(self):
+        self.assertNotIn("Edit", self._render(user=PersonFactory()))
+        self.assertIn("Edit", self._render(user=PersonFactory(is_superuser=True)))
+
+    def test_cache_key_varies_with_section_title(self):
+        entry = Entry.objects.get(pk=self.entry.pk)
+        self.assertNotEqual(
+            get_comment_list_cache_key(Context({}), entry),
+            get_comment_list_cache_key(Context({"show_section_title": False}), entry),
+        )
+
+    def test_syntax_error(self):
+        with self.assertRaises(TemplateSyntaxError):
+            Template("{% load comment_tags %}{% render_cached_comment_list object %}")
@@ -1,3 +1,5 @@
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.sites.models import Site
 from django.test import TestCase
 
 from pepysdiary.annotations.factories import (
@@ -7,19 +9,26 @@ from pepysdiary.annotations.factories import (
     PostAnnotationFactory,
     TopicAnnotationFactory,
 )
+from pepysdiary.annotations.models import Annotation
 from pepysdiary.common.templatetags.list_tags import (
     latest_commented_articles,
     latest_commented_entries,
     latest_commented_letters,
+    latest_commented_lists,
     latest_commented_posts,
     latest_commented_topics,
 )
 from pepysdiary.common.utilities import make_date, make_datetime
 from pepysdiary.diary.factories import EntryFactory
+from pepysdiary.diary.models import Entry
 from pepysdiary.encyclopedia.factories import TopicFactory
+from pepysdiary.encyclopedia.models import Topic
 from pepysdiary.indepth.factories import PublishedArticleFactory
+from pepysdiary.indepth.models import Article
 from pepysdiary.letters.factories import LetterFactory
+from pepysdiary.letters.models import Letter
 from pepysdiary.news.factories import PublishedPostFactory
+from pepysdiary.news.models import Post
 
 
 class ListTagsTestCase(TestCase):
@@ -345,3 +354,63 @@ class ListTagsTestCase(TestCase):
     def test_no_results(self):
         "If there are no commented items it should return None"
         self.assertIsNone(latest_commented_entries({}, "Title"))
+
+    def test_latest_commented_lists(self):
+        "It should return lists for all the kinds of object with two queries"
+        entry_1 = EntryFactory(diary_date=make_date("1660-01-01"))
+        entry_2 = EntryFactory(diary_date=make_date("1660-01-02"))
+        EntryAnnotationFactory(
+            content_object=entry_1, submit_date=make_datetime("2021-04-09 01:00:00")
+        )
+        EntryAnnotationFactory(
+            content_object=entry_2, submit_date=make_datetime("2021-04-10 01:00:00")
+        )
+        topic_annotation = TopicAnnotationFactory(user_name="Topic commenter")
+        letter_annotation = LetterAnnotationFactory()
+        article_annotation = ArticleAnnotationFactory()
+        post_annotation = PostAnnotationFactory()
+        # So that looking up ContentTypes and the Site doesn't add queries:
+        ContentType.objects.get_for_models(Entry, Letter, Topic, Article, Post)
+        Site.objects.get_current()
+
+        with self.assertNumQueries(2):
+            result = latest_commented_lists(
+                {}, entries=3, letters=1, topics=1, articles=1, posts=1
+            )
+
+        self.assertEqual(
+            [item["obj_title"] for item in result["entries"]],
+            [entry_2.title, entry_1.title],
+        )
+        self.assertEqual(
+            result["topics"][0]["obj_title"], topic_annotation.content_object.title
+        )
+        self.assertEqual(result["topics"][0]["user_name"], "Topic commenter")
+        self.assertEqual(
+            result["topics"][0]["url"], topic_annotation.get_absolute_url()
+        )
+        for name, annotation in (
+            ("letters", letter_annotation),
+            ("articles", article_annotation),
+            ("posts", post_annotation),
+        ):
+            with self.subTest(name=name):
+                self.assertEqual(len(result[name]), 1)
+                self.assertEqual(
+                    result[name][0]["obj_title"], annotation.content_object.title
+                )
+
+    def test_latest_commented_lists_only_requested(self):
+        "It should only include the kinds of object with a quantity"
+        EntryAnnotationFactory()
+        TopicAnnotationFactory()
+        result = latest_commented_lists({}, topics=5)
+        self.assertEqual(list(result.keys()), ["topics"])
+        self.assertEqual(latest_commented_lists({}), {})
+
+    def test_latest_commented_lists_no_visible_comments(self):
+        "Objects whose comments are all now hidden shouldn't be included"
+        annotation = EntryAnnotationFactory()
+        Annotation.objects.filter(pk=annotation.pk).update(is_removed=True)
+        result = latest_commented_lists({}, entries=5)
+        self.assertEqual(result["entries"], [])
@@ -0,0 +1,237 @@
+import json
+import os
+from unittest.mock import Mock, patch
+
+from django.test import TestCase
+from freezegun import freeze_time
+
+from pepysdiary.common import cache_backends
+from pepysdiary.common.cache_backends import (
+    InvalidationListener,
+    LocalLRUCache,
+    TwoTierRedisCache,
+)
+
+
+class LocalLRUCacheTestCase(TestCase):
+    def test_get_missing(self):
+        self.assertEqual(LocalLRUCache().get("a"), (False, None))
+
+    def test_set_and_get(self):
+        lru = LocalLRUCache()
+        lru.set("a", b"1")
+        self.assertEqual(lru.get("a"), (True, b"1"))
+
+    def test_evicts_least_recently_used(self):
+        lru = LocalLRUCache(max_entries=2)
+        lru.set("a", b"1")
+        lru.set("b", b"2")
+        lru.get("a")
+        lru.set("c", b"3")
+        self.assertTrue(lru.get("a")[0])
+        self.assertFalse(lru.get("b")[0])
+        self.assertTrue(lru.get("c")[0])
+        self.assertEqual(lru.evictions, 1)
+
+    def test_expires_after_timeout(self):
+        lru = LocalLRUCache(timeout=30)
+        with freeze_time("2026-01-01 12:00:00") as frozen_time:
+            lru.set("a", b"1")
+            frozen_time.tick(29)
+            self.assertTrue(lru.get("a")[0])
+            frozen_time.tick(1)
+            self.assertFalse(lru.get("a")[0])
+        self.assertEqual(len(lru), 0)
+
+    def test_expires_after_shorter_backend_timeout(self):
+        lru = LocalLRUCache(timeout=30)
+        with freeze_time("2026-01-01 12:00:00") as frozen_time:
+            lru.set("a", b"1", timeout=5)
+            frozen_time.tick(5)
+            self.assertFalse(lru.get("a")[0])
+
+    def test_disabled(self):
+        lru = LocalLRUCache(max_entries=0)
+        lru.set("a", b"1")
+        self.assertFalse(lru.get("a")[0])
+
+    def test_delete(self):
+        lru = LocalLRUCache()
+        lru.set("a", b"1")
+        lru.delete("a")
+        lru.delete("b")
+        self.assertFalse(lru.get("a")[0])
+
+    def test_clear(self):
+        lru = LocalLRUCache()
+        lru.set("a", b"1")
+        lru.clear()
+        self.assertEqual(len(lru), 0)
+
+    def test_set_skipped_after_delete(self):
+        "A value fetched before a key was deleted might be out of date"
+        lru = LocalLRUCache()
+        generation = lru.generation
+        lru.delete("b")
+        lru.set("a", b"1", generation=generation)
+        self.assertFalse(lru.get("a")[0])
+        lru.set("a", b"1", generation=lru.generation)
+        self.assertTrue(lru.get("a")[0])
+
+
+class TwoTierRedisCacheTestCase(TestCase):
+    "Only tests things that don't need a Redis server."
+
+    def setUp(self):
+        self.cache = self.make_cache()
+        # Don't try to subscribe to invalidations:
+        self.listener = InvalidationListener("pepys:cache:invalidate")
+        self.listener.sender_id = "us"
+        self.listener.l1_caches.add(self.cache._l1)
+        self.cache._listener = self.listener
+        self.cache._listener_pid = os.getpid()
+
+    def make_cache(self):
+        return TwoTierRedisCache(
+            "redis://localhost:6379/0",
+            {"OPTIONS": {"L1_MAX_ENTRIES": 10, "L1_TIMEOUT": 60}},
+        )
+
+    def put_in_l1(self, key, value):
+        self.cache._l1.set(
+            self.cache.make_and_validate_key(key),
+            self.cache._cache._serializer.dumps(value),
+        )
+
+    def test_options(self):
+        self.assertEqual(self.cache._l1.max_entries, 10)
+        self.assertEqual(self.cache._l1.timeout, 60)
+        self.assertEqual(self.cache.channel, "pepys:cache:invalidate")
+
+    def test_get_from_l1(self):
+        self.put_in_l1("a", {"b": 1})
+        self.assertEqual(self.cache.get("a"), {"b": 1})
+        self.assertEqual(self.cache.stats["l1_hits"], 1)
+
+    def test_get_from_l1_returns_copies(self):
+        self.put_in_l1("a", {"b": 1})
+        self.cache.get("a")["b"] = 2
+        self.assertEqual(self.cache.get("a"), {"b": 1})
+
+    def test_get_many_from_l1(self):
+        self.put_in_l1("a", 1)
+        self.put_in_l1("b", 2)
+        self.assertEqual(self.cache.get_many(["a", "b"]), {"a": 1, "b": 2})
+
+    def test_get_from_l2_invalidated_during_fetch(self):
+        "A value that's invalidated while we fetch it shouldn't go in L1"
+        client = Mock()
+        client.ttl.return_value = 5
+
+        def get(key):
+            self.listener.drop([key])
+            return self.cache._cache._serializer.dumps(1)
+
+        client.get.side_effect = get
+        with patch.object(self.cache._cache, "get_client", return_value=client):
+            self.assertEqual(self.cache.get("a"), 1)
+        self.assertEqual(self.cache.get_stats()["l1_size"], 0)
+
+    def test_get_many_from_l2_invalidated_during_fetch(self):
+        client = Mock()
+
+        def execute():
+            self.listener.drop(None)
+            return [[self.cache._cache._serializer.dumps(1)], 5]
+
+        client.pipeline.return_value.execute.side_effect = execute
+        with patch.object(self.cache._cache, "get_client", return_value=client):
+            self.assertEqual(self.cache.get_many(["a"]), {"a": 1})
+        self.assertEqual(self.cache.get_stats()["l1_size"], 0)
+
+    def test_get_many_from_l2_uses_redis_expiry(self):
+        "Keys fetched from Redis shouldn't stay in L1 for longer than in Redis"
+        client = Mock()
+        client.pipeline.return_value.execute.return_value = [
+            [self.cache._cache._serializer.dumps(1), None],
+            5,
+            -2,
+        ]
+        with (
+            freeze_time("2026-01-01 12:00:00") as frozen_time,
+            patch.object(self.cache._cache, "get_client", return_value=client),
+        ):
+            self.assertEqual(self.cache.get_many(["a", "b"]), {"a": 1})
+            key = self.cache.make_and_validate_key("a")
+            frozen_time.tick(4)
+            self.assertTrue(self.cache._l1.get(key)[0])
+            frozen_time.tick(1)
+            self.assertFalse(self.cache._l1.get(key)[0])
+        self.assertEqual(self.cache.stats["l2_hits"], 1)
+        self.assertEqual(self.cache.stats["l2_misses"], 1)
+
+    def test_invalidation_from_other_process(self):
+        self.put_in_l1("a", 1)
+        self.put_in_l1("b", 2)
+        key = self.cache.make_and_validate_key("a")
+        self.listener.on_message(
+            {"data": json.dumps({"sender": "them", "keys": [key]}).encode()}
+        )
+        self.assertFalse(self.cache._l1.get(key)[0])
+        self.assertTrue(self.cache._l1.get(self.cache.make_and_validate_key("b"))[0])
+        self.assertEqual(self.cache.get_stats()["l1_invalidations"], 1)
+
+    def test_clear_from_other_process(self):
+        self.put_in_l1("a", 1)
+        self.listener.on_message({"data": json.dumps({"sender": "them", "keys": None})})
+        self.assertEqual(self.cache.get_stats()["l1_size"], 0)
+
+    def test_ignores_own_invalidations(self):
+        self.put_in_l1("a", 1)
+        key = self.cache.make_and_validate_key("a")
+        self.listener.on_message({"data": json.dumps({"sender": "us", "keys": [key]})})
+        self.assertTrue(self.cache._l1.get(key)[0])
+
+    def test_invalidates_other_instances_in_process(self):
+        "Other threads' instances should drop the key without a message"
+        other = self.make_cache()
+        other._listener = self.listener
+        other._listener_pid = os.getpid()
+        self.listener.l1_caches.add(other._l1)
+        key = self.cache.make_and_validate_key("a")
+        other._l1.set(key, other._cache._serializer.dumps(1))
+        with patch.object(self.cache._cache, "get_client"):
+            self.cache.delete("a")
+        self.assertFalse(other._l1.get(key)[0])
+
+
+@patch.dict(cache_backends._listeners, clear=True)
+class TwoTierRedisCacheListenerTestCase(TestCase):
+    def make_cache(self):
+        return TwoTierRedisCache(
+            "redis://localhost:6379/0", {"OPTIONS": {"L1_MAX_ENTRIES": 10}}
+        )
+
+    def test_one_listener_per_process(self):
+        "Instances in the same process should share one listener thread"
+        caches = [self.make_cache(), self.make_cache()]
+        client = Mock()
+        for cache in caches:
+            with patch.object(cache._cache, "get_client", return_value=client):
+                cache._ensure_listener()
+        self.assertIs(caches[0]._listener, caches[1]._listener)
+        self.assertEqual(set(caches[0]._listener.l1_caches), {c._l1 for c in caches})
+        client.pubsub.return_value.run_in_thread.assert_called_once()
+
+    def test_new_listener_after_fork(self):
+        "A forked process should start its own listener"
+        cache = self.make_cache()
+        client = Mock()
+        with patch.object(cache._cache, "get_client", return_value=client):
+            cache._ensure_listener()
+            listener = cache._listener
+            with patch("os.getpid", return_value=os.getpid() + 1):
+                cache._ensure_listener()
+        self.assertIsNot(cache._listener, listener)
+        self.assertEqual(list(cache_backends._listeners.values()), [cache._listener])
+        self.assertEqual(client.pubsub.return_value.run_in_thread.call_count, 2)
@@ -0,0 +1,144 @@
+from django.core.cache import cache
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+
+from pepysdiary.common.cache_stats import (
+    InstrumentedCache,
+    cache_stats,
+    format_metrics,
+    get_url_name,
+)
+from pepysdiary.common.caching import cache_page_swr
+
+LOCMEM_CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "test-cache-stats",
+    }
+}
+
+
+class CacheStatsTestCase(TestCase):
+    def setUp(self):
+        cache_stats.reset()
+
+    def tearDown(self):
+        cache_stats.reset()
+
+    def test_record(self):
+        cache_stats.record("home", hits=1)
+        cache_stats.record("home", hits=1, misses=1)
+        stats = cache_stats.get_stats()
+        self.assertEqual(stats["home"]["hits"], 2)
+        self.assertEqual(stats["home"]["misses"], 1)
+        self.assertEqual(stats["home"]["stores"], 0)
+
+    def test_totals(self):
+        cache_stats.record("home", hits=1)
+        cache_stats.record("recent", hits=2, bytes=100)
+        totals = cache_stats.get_totals()
+        self.assertEqual(totals["hits"], 3)
+        self.assertEqual(totals["bytes"], 100)
+
+    def test_reset(self):
+        cache_stats.record("home", hits=1)
+        cache_stats.reset()
+        self.assertEqual(cache_stats.get_stats(), {})
+
+    @override_settings(PEPYS_CACHE_STATS=False)
+    def test_disabled(self):
+        self.assertFalse(cache_stats.enabled)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, PEPYS_CACHE_STATS=True)
+class InstrumentedCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        cache_stats.reset()
+
+    def tearDown(self):
+        cache_stats.reset()
+
+    def test_records_backend_calls(self):
+        instrumented = InstrumentedCache(cache)
+        instrumented.set("a", 1)
+        self.assertEqual(instrumented.get("a"), 1)
+        totals = cache_stats.get_totals()
+        self.assertEqual(totals["backend_calls"], 2)
+        self.assertGreater(totals["backend_seconds"], 0)
+
+    def test_records_page_stores(self):
+        instrumented = InstrumentedCache(cache)
+        instrumented.set("a", HttpResponse("Hello"))
+        instrumented.set("b", {"response": HttpResponse("Hi"), "fresh_until": 0})
+        instrumented.set("c", ["Accept-Encoding"])
+        instrumented.set("d", StreamingHttpResponse(["Hi"]))
+        totals = cache_stats.get_totals()
+        self.assertEqual(totals["stores"], 2)
+        self.assertEqual(totals["bytes"], 7)
+
+    def test_passes_through_other_attributes(self):
+        self.assertEqual(InstrumentedCache(cache).key_prefix, cache.key_prefix)
+
+
+class GetUrlNameTestCase(TestCase):
+    def test_resolves(self):
+        request = RequestFactory().get("/recent/")
+        self.assertEqual(get_url_name(request), "recent")
+
+    def test_namespace(self):
+        request = RequestFactory().get("/api/v1/entries/1660-01-01")
+        self.assertEqual(get_url_name(request), "v1:entry-detail")
+
+    def test_unresolved(self):
+        request = RequestFactory().get("/nothing-here/")
+        self.assertEqual(get_url_name(request), "<unresolved>")
+
+
+@override_settings(CACHES=LOCMEM_CACHES, PEPYS_CACHE_STATS=True)
+class CachePageSWRStatsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        cache_stats.reset()
+        self.view = cache_page_swr(60)(lambda request: HttpResponse("Hello"))
+
+    def tearDown(self):
+        cache_stats.reset()
+
+    def test_miss_then_hit(self):
+        self.view(RequestFactory().get("/recent/"))
+        self.view(RequestFactory().get("/recent/"))
+        stats = cache_stats.get_stats()["recent"]
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["stores"], 1)
+        self.assertEqual(stats["bytes"], 5)
+        self.assertGreater(stats["backend_calls"], 0)
+
+    @override_settings(PEPYS_CACHE_STATS=False)
+    def test_disabled(self):
+        self.view(RequestFactory().get("/recent/"))
+        self.assertEqual(cache_stats.get_stats(), {})
+
+
+class FormatMetricsTestCase(TestCase):
+    def test_format(self):
+        text = format_metrics(
+            [
+                ("hits_total", "counter", "Hits.", [({"url_name": "home"}, 3)]),
+                ("size", "gauge", "Size.", [({}, 10)]),
+            ]
+        )
+        self.assertEqual(
+            text,
+            "# HELP hits_total Hits.\n"
+            "# TYPE hits_total counter\n"
+            'hits_total{url_name="home"} 3\n'
+            "# HELP size Size.\n"
+            "# TYPE size gauge\n"
+            "size 10\n",
+        )
+
+    def test_escapes_labels(self):
+        text = format_metrics([("m", "counter", "M.", [({"l": 'a"b\\c'}, 1)])])
+        self.assertIn('m{l="a\\"b\\\\c"} 1', text)
@@ -0,0 +1,216 @@
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from freezegun import freeze_time
+
+from pepysdiary.common.caching import (
+    cache_page_swr,
+    fragment_cache_counts,
+    get_cache_tag_versions,
+    get_cache_tags_key_prefix,
+    get_or_render_fragment,
+    invalidate_cache_tags,
+    make_cache_tag,
+    page_cache_counts,
+)
+from pepysdiary.diary.models import Entry
+
+LOCMEM_CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "test-caching",
+    }
+}
+
+
+class MakeCacheTagTestCase(TestCase):
+    def test_model_tag(self):
+        self.assertEqual(make_cache_tag(Entry), "diary.entry")
+
+    def test_object_tag(self):
+        self.assertEqual(make_cache_tag(Entry, "1661-01-02"), "diary.entry:1661-01-02")
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CacheTagVersionsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_versions_are_remembered(self):
+        versions = get_cache_tag_versions(["a", "b"])
+        self.assertEqual(set(versions.keys()), {"a", "b"})
+        self.assertEqual(get_cache_tag_versions(["a", "b"]), versions)
+
+    def test_key_prefix_none_without_tags(self):
+        self.assertIsNone(get_cache_tags_key_prefix([]))
+
+    def test_key_prefix_ignores_order(self):
+        self.assertEqual(
+            get_cache_tags_key_prefix(["a", "b"]), get_cache_tags_key_prefix(["b", "a"])
+        )
+
+    def test_invalidate_changes_key_prefix(self):
+        prefix = get_cache_tags_key_prefix(["a", "b"])
+        other_prefix = get_cache_tags_key_prefix(["c"])
+        with self.captureOnCommitCallbacks(execute=True):
+            invalidate_cache_tags(["b"])
+        self.assertNotEqual(get_cache_tags_key_prefix(["a", "b"]), prefix)
+        self.assertEqual(get_cache_tags_key_prefix(["c"]), other_prefix)
+
+    def test_invalidate_waits_for_commit(self):
+        prefix = get_cache_tags_key_prefix(["a"])
+        with self.captureOnCommitCallbacks(execute=False):
+            invalidate_cache_tags(["a"])
+        self.assertEqual(get_cache_tags_key_prefix(["a"]), prefix)
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES, PEPYS_CACHE_STALE_TIMEOUT=600, PEPYS_CACHE_LOCK_WAIT=0
+)
+class CachePageSWRTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.calls = 0
+        self.initial_counts = page_cache_counts.copy()
+
+        def view(request):
+            self.calls += 1
+            return HttpResponse(f"Response {self.calls}")
+
+        self.uncached_view = view
+        self.view = cache_page_swr(60)(view)
+
+    def _get(self):
+        return self.view(self.factory.get("/fake-path/")).content.decode()
+
+    def _count_change(self, key):
+        return page_cache_counts[key] - self.initial_counts[key]
+
+    def test_fresh(self):
+        "A fresh page should be served from the cache"
+        with freeze_time("2021-04-10 12:00:00") as frozen_time:
+            self.assertEqual(self._get(), "Response 1")
+            frozen_time.tick(59)
+            self.assertEqual(self._get(), "Response 1")
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(self._count_change("miss"), 1)
+        self.assertEqual(self._count_change("hit"), 1)
+
+    def test_stale_revalidated(self):
+        "A stale page should be regenerated if nothing else is doing so"
+        with freeze_time("2021-04-10 12:00:00") as frozen_time:
+            self._get()
+            frozen_time.tick(61)
+            self.assertEqual(self._get(), "Response 2")
+            self.assertEqual(self._get(), "Response 2")
+        self.assertEqual(self._count_change("revalidated"), 1)
+
+    def test_stale_served_when_locked(self):
+        "A stale page should be served while another request regenerates it"
+        with freeze_time("2021-04-10 12:00:00") as frozen_time:
+            self._get()
+            frozen_time.tick(61)
+            with patch.object(LocMemCache, "add", return_value=False):
+                self.assertEqual(self._get(), "Response 1")
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(self._count_change("contended"), 1)
+        self.assertEqual(self._count_change("stale"), 1)
+
+    def test_expired(self):
+        "After the stale_timeout, the page should be regenerated"
+        with freeze_time("2021-04-10 12:00:00") as frozen_time:
+            self._get()
+            frozen_time.tick(661)
+            with patch.object(LocMemCache, "add", return_value=False):
+                self.assertEqual(self._get(), "Response 2")
+        self.assertEqual(self._count_change("wait_timeout"), 1)
+
+    def test_lock_released(self):
+        "The lock should be released once the page is cached"
+        with freeze_time("2021-04-10 12:00:00") as frozen_time:
+            self._get()
+            frozen_time.tick(61)
+            self._get()
+            frozen_time.tick(61)
+            self.assertEqual(self._get(), "Response 3")
+
+    def test_browser_timeout(self):
+        "Browsers should only cache the page for browser_timeout seconds"
+        view = cache_page_swr(3600, browser_timeout=30)(self.uncached_view)
+        response = view(self.factory.get("/fake-path/"))
+        self.assertEqual(response["Cache-Control"], "max-age=30")
+
+    @override_settings(PEPYS_CACHE_BROWSER_TIMEOUT=30)
+    def test_browser_timeout_default(self):
+        view = cache_page_swr(3600)(self.uncached_view)
+        response = view(self.factory.get("/fake-path/"))
+        self.assertEqual(response["Cache-Control"], "max-age=30")
+
+    def test_browser_timeout_longer_than_timeout(self):
+        "Browsers shouldn't cache the page for longer than we do"
+        response = self.view(self.factory.get("/fake-path/"))
+        self.assertEqual(response["Cache-Control"], "max-age=60")
+        view = cache_page_swr(20, browser_timeout=30)(self.uncached_view)
+        response = view(self.factory.get("/other-path/"))
+        self.assertEqual(response["Cache-Control"], "max-age=20")
+
+    def test_lock_released_after_exception(self):
+        "If the view raises an exception, the lock should be released"
+
+        def view(request):
+            self.calls += 1
+            if self.calls == 1:
+                raise ValueError
+            return HttpResponse(f"Response {self.calls}")
+
+        self.view = cache_page_swr(60)(view)
+        with self.assertRaises(ValueError):
+            self._get()
+        self.assertEqual(self._get(), "Response 2")
+        self.assertEqual(self._count_change("miss"), 2)
+        self.assertEqual(self._count_change("contended"), 0)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class GetOrRenderFragmentTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+        self.initial_counts = fragment_cache_counts.copy()
+
+    def _render(self):
+        self.calls += 1
+        return f"<p>Fragment {self.calls}</p>"
+
+    def _count_change(self, key):
+        return fragment_cache_counts[key] - self.initial_counts[key]
+
+    def test_renders_then_caches(self):
+        self.assertEqual(
+            get_or_render_fragment("key", self._render, 60), "<p>Fragment 1</p>"
+        )
+        self.assertEqual(
+            get_or_render_fragment("key", self._render, 60), "<p>Fragment 1</p>"
+        )
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(self._count_change("miss"), 1)
+        self.assertEqual(self._count_change("hit"), 1)
+
+    def test_different_keys(self):
+        get_or_render_fragment("key 1", self._render, 60)
+        self.assertEqual(
+            get_or_render_fragment("key 2", self._render, 60), "<p>Fragment 2</p>"
+        )
+        self.assertEqual(self._count_change("miss"), 2)
+
+    def test_records_seconds(self):
+        "The time saved by a hit should be the time the fragment took to render"
+        with patch("pepysdiary.common.caching.time.perf_counter", side_effect=[1, 3]):
+            get_or_render_fragment("key", self._render, 60)
+        get_or_render_fragment("key", self._render, 60)
+        self.assertEqual(self._count_change("render_seconds"), 2)
+        self.assertEqual(self._count_change("saved_seconds"), 2)
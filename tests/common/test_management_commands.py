@@ -0,0 +1,148 @@
+import re
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+from freezegun import freeze_time
+
+from pepysdiary.common.utilities import make_date
+from pepysdiary.diary.factories import EntryFactory
+from pepysdiary.diary.models import Entry
+from pepysdiary.encyclopedia.factories import TopicFactory
+from pepysdiary.letters.factories import LetterFactory
+from pepysdiary.letters.models import Letter
+
+
+class ReindexSearchTestCase(TestCase):
+    """
+    In a TestCase the search_documents aren't set on save, because
+    transaction.on_commit() callbacks never run. So all objects start
+    without one.
+    """
+
+    def test_reindexes_all_models(self):
+        "It should set the search_document of all searchable objects"
+        EntryFactory(text="<p>Up betimes and to the office.</p>")
+        LetterFactory(text="<p>Sir, I received your letter.</p>")
+
+        call_command("reindex_search", stdout=StringIO())
+
+        self.assertEqual(Entry.objects.filter(search_document="office").count(), 1)
+        self.assertEqual(Letter.objects.filter(search_document="letter").count(), 1)
+
+    def test_reindexes_chosen_models(self):
+        "It should only set the search_document of the chosen models"
+        EntryFactory(text="<p>Up betimes and to the office.</p>")
+        LetterFactory(text="<p>Sir, I received your letter.</p>")
+
+        call_command("reindex_search", models=["entry"], stdout=StringIO())
+
+        self.assertEqual(Entry.objects.filter(search_document="office").count(), 1)
+        self.assertEqual(Letter.objects.filter(search_document="letter").count(), 0)
+
+    def test_chunks(self):
+        "It should update all objects when there are several chunks"
+        for _ in range(5):
+            EntryFactory(text="<p>Up betimes and to the office.</p>")
+
+        out = StringIO()
+        call_command(
+            "reindex_search", models=["entry"], chunk_size=2, verbosity=2, stdout=out
+        )
+
+        self.assertEqual(Entry.objects.filter(search_document="office").count(), 5)
+        self.assertIn("Entries: 2 of 5", out.getvalue())
+        self.assertIn("Re-indexed 5 Entries", out.getvalue())
+
+    def test_invalid_model(self):
+        with self.assertRaises(CommandError):
+            call_command("reindex_search", models=["person"])
+
+    def test_invalid_chunk_size(self):
+        with self.assertRaises(CommandError):
+            call_command("reindex_search", chunk_size=0)
+
+
+@freeze_time("2021-04-10 23:00:05", tz_offset=0)
+@override_settings(YEARS_OFFSET=353)
+class WarmCacheTestCase(TestCase):
+    def setUp(self):
+        self.topic = TopicFactory()
+        self.entry = EntryFactory(
+            diary_date=make_date("1668-04-10"),
+            text=f'<a href="https://www.pepysdiary.com/encyclopedia/{self.topic.pk}/">'
+            "Cat</a>",
+        )
+
+    def test_requests_pages(self):
+        "It should request all the pages that change when an Entry is published"
+        out = StringIO()
+        call_command("warm_cache", host="testserver", verbosity=2, stdout=out)
+        output = out.getvalue()
+
+        self.assertIn("200 0.00s /\n", output)
+        self.assertIn("200 0.00s /diary/rss/\n", output)
+        self.assertIn("200 0.00s /diary/1668/04/10/\n", output)
+        self.assertIn("200 0.00s /diary/1668/04/\n", output)
+        self.assertIn("200 0.00s /api/v1/entries/1668-04-10\n", output)
+        self.assertIn(f"200 0.00s /encyclopedia/{self.topic.pk}/\n", output)
+        self.assertIn("Warmed 6 page(s)", output)
+
+    def test_no_published_entry(self):
+        "If there's no Entry for today, it should still warm the other pages"
+        self.entry.delete()
+        out = StringIO()
+        call_command("warm_cache", host="testserver", stdout=out)
+        self.assertIn("Warmed 2 page(s)", out.getvalue())
+
+    def test_invalid_delay(self):
+        with self.assertRaises(CommandError):
+            call_command("warm_cache", delay=-1, stdout=StringIO())
+
+
+@freeze_time("2021-04-10 23:00:05", tz_offset=0)
+@override_settings(YEARS_OFFSET=353)
+class AuditQuerySizesTestCase(TestCase):
+    def setUp(self):
+        self.topic = TopicFactory(wikipedia_html="<p>" + "Cat " * 1000 + "</p>")
+        self.entry = EntryFactory(
+            diary_date=make_date("1668-04-10"),
+            text="<p>Up betimes.</p>",
+        )
+        self.topic.diary_references.add(self.entry)
+
+    def test_audits_pages(self):
+        "It should output the sizes for all the major pages, and the total"
+        out = StringIO()
+        call_command("audit_query_sizes", host="testserver", stdout=out)
+        output = out.getvalue()
+
+        for label in (
+            "Home",
+            "Entries RSS",
+            "Topics RSS",
+            "Encyclopedia",
+            "Map",
+            "Search entries",
+            "Search topics",
+            "API entries",
+            "API topics",
+            "Entry",
+            "Entry month",
+            "API entry",
+            "Topic",
+            "API topic",
+            "Total",
+        ):
+            self.assertIn(f"\n{label}: ", f"\n{output}")
+
+    def test_deferring_fetches_less(self):
+        "The Topics' list in the API shouldn't fetch their Wikipedia HTML"
+        out = StringIO()
+        call_command("audit_query_sizes", host="testserver", stdout=out)
+        match = re.search(
+            r"^API topics: .* ([\d,]+) -> ([\d,]+) bytes", out.getvalue(), re.M
+        )
+        before, after = (int(size.replace(",", "")) for size in match.groups())
+        self.assertGreater(before - after, 4000)
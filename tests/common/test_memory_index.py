@@ -0,0 +1,69 @@
+from unittest.mock import patch
+
+from django.core.signals import request_finished, request_started
+from django.db import transaction
+from django.test import TestCase
+
+from pepysdiary.common import memory_index
+from pepysdiary.common.memory_index import MemoryIndex
+
+
+class NumbersIndex(MemoryIndex):
+    cache_key = "tests:numbers_index_version"
+
+    def __init__(self):
+        super().__init__()
+        self.builds = 0
+
+    def build_index(self):
+        self.builds += 1
+        return [1, 2, 3]
+
+
+class MemoryIndexTestCase(TestCase):
+    def setUp(self):
+        self.index = NumbersIndex()
+
+    def tearDown(self):
+        memory_index._indexes.remove(self.index)
+
+    def test_build_index_required(self):
+        index = MemoryIndex()
+        memory_index._indexes.remove(index)
+        with self.assertRaises(NotImplementedError):
+            index.build_index()
+
+    def test_builds_once(self):
+        self.assertEqual(self.index._get_index(), [1, 2, 3])
+        self.index._get_index()
+        self.assertEqual(self.index.builds, 1)
+
+    def test_rebuilt_after_invalidate(self):
+        self.index._get_index()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.index.invalidate()
+        self.index._get_index()
+        self.assertEqual(self.index.builds, 2)
+
+    def test_rebuilt_after_savepoint_ends(self):
+        "It might have been built from data that was rolled back"
+        with transaction.atomic():
+            self.index._get_index()
+            self.index._get_index()
+        self.assertEqual(self.index.builds, 1)
+        self.index._get_index()
+        self.assertEqual(self.index.builds, 2)
+
+    def test_request_signals(self):
+        "Every index should only check its version once per request"
+        self.index._get_index()
+        request_started.send(sender=self.__class__)
+        try:
+            with patch("pepysdiary.common.memory_index.cache") as mock_cache:
+                mock_cache.get.return_value = self.index._version
+                self.index._get_index()
+                self.index._get_index()
+            self.assertEqual(mock_cache.get.call_count, 1)
+        finally:
+            request_finished.send(sender=self.__class__)
+        self.assertFalse(hasattr(self.index._local, "version_checked"))
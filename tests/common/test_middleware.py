@@ -59,6 +59,16 @@ class InitialViewTestCase(CookiesTestCase):
         self.assertNotIn("prev_visit_end", self.cookies)
 
 
+@freeze_time("2021-04-10 12:00:00", tz_offset=0)
+class NonHTMLViewTestCase(CookiesTestCase):
+    "Tests for responses that aren't HTML pages"
+
+    def test_no_cookies(self):
+        "Cookies shouldn't be set on non-HTML responses, like feeds"
+        response = self.client.get("/diary/rss/")
+        self.assertEqual(len(response.cookies), 0)
+
+
 @freeze_time("2021-04-10 12:00:00", tz_offset=0)
 class SecondViewTestCase(CookiesTestCase):
     "Tests for a second view in the same visit, no previous visits"
@@ -83,7 +93,7 @@ class SecondViewTestCase(CookiesTestCase):
         )
         self._set_cookie_data("visit_start", expires_time)
         self._set_cookie_data("last_view", expires_time)
-        self.client.get("/")
+        self.response = self.client.get("/")
         self.cookies = self.client.cookies
 
     def test_visit_start_cookie_second_view(self):
@@ -103,7 +113,54 @@ class SecondViewTestCase(CookiesTestCase):
         self.assertEqual(self.cookies["visit_start"]["max-age"], MAX_AGE)
 
     def test_last_view_cookie_second_view(self):
-        "On a second view in the same visit, last_view cookie should set to NOW"
+        "If last_view is recent, the last_view cookie should remain the same"
+        self.assertIn("last_view", self.cookies)
+        self.assertEqual(
+            self.cookies["last_view"].value,
+            str(int(make_datetime("2021-04-10 11:55:00").timestamp())),
+        )
+
+    def test_prev_visit_end_cookie_second_view(self):
+        "On a second view in the same visit, prev_visit_end should not be set"
+        self.assertNotIn("prev_visit_end", self.cookies)
+
+    def test_no_set_cookie_second_view(self):
+        "If no cookies need changing, none are set, and it can be cached"
+        self.assertEqual(len(self.response.cookies), 0)
+        self.assertNotIn("private", self.response.get("Cache-Control", ""))
+
+
+@freeze_time("2021-04-10 12:00:00", tz_offset=0)
+class LaterViewTestCase(CookiesTestCase):
+    "Tests for a later view in the same visit, no previous visits"
+
+    def setUp(self):
+        # Thirty minutes ago:
+        visit_start_time = make_datetime("2021-04-10 11:30:00")
+        # Fifteen minutes ago, more than last_view_interval:
+        last_view_time = make_datetime("2021-04-10 11:45:00")
+        expires_time = make_datetime("2021-04-24 11:45:01")
+
+        self.client.cookies = SimpleCookie(
+            {
+                "visit_start": str(int(visit_start_time.timestamp())),
+                "last_view": str(int(last_view_time.timestamp())),
+            }
+        )
+        self._set_cookie_data("visit_start", expires_time)
+        self._set_cookie_data("last_view", expires_time)
+        self.response = self.client.get("/")
+        self.cookies = self.client.cookies
+
+    def test_visit_start_cookie_later_view(self):
+        "visit_start cookie should remain the same"
+        self.assertEqual(
+            self.cookies["visit_start"].value,
+            str(int(make_datetime("2021-04-10 11:30:00").timestamp())),
+        )
+
+    def test_last_view_cookie_later_view(self):
+        "last_view cookie should be set to NOW"
         self.assertIn("last_view", self.cookies)
         self.assertEqual(self.cookies["last_view"].value, str(int(time.time())))
         # 14 days ahead:
@@ -112,11 +169,11 @@ class SecondViewTestCase(CookiesTestCase):
             make_datetime("2021-04-24 12:00:01").strftime(EXPIRES_FORMAT),
         )
         self.assertEqual(self.cookies["last_view"]["path"], "/")
-        self.assertEqual(self.cookies["visit_start"]["max-age"], MAX_AGE)
+        self.assertEqual(self.cookies["last_view"]["max-age"], MAX_AGE)
 
-    def test_prev_visit_end_cookie_second_view(self):
-        "On a second view in the same visit, prev_visit_end should not be set"
-        self.assertNotIn("prev_visit_end", self.cookies)
+    def test_cache_control_later_view(self):
+        "A response that sets cookies shouldn't be cached by others"
+        self.assertIn("private", self.response["Cache-Control"])
 
 
 @freeze_time("2021-04-10 12:00:00", tz_offset=0)
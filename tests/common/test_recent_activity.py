@@ -0,0 +1,199 @@
+from unittest.mock import patch
+
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.sites.models import Site
+from django.core.cache import cache
+from django.db.models.signals import post_delete
+from django.test import TestCase, override_settings
+
+from pepysdiary.annotations.factories import (
+    EntryAnnotationFactory,
+    TopicAnnotationFactory,
+)
+from pepysdiary.common import recent_activity
+from pepysdiary.common.utilities import make_date, make_datetime
+from pepysdiary.diary.factories import EntryFactory
+from pepysdiary.diary.models import Entry
+from pepysdiary.encyclopedia.factories import TopicFactory
+from pepysdiary.encyclopedia.models import Category, RelatedTopic, Topic
+from pepysdiary.letters.models import Letter
+from tests.common.test_caching import LOCMEM_CACHES
+
+
+class GetKindTestCase(TestCase):
+    def test_kinds(self):
+        self.assertEqual(recent_activity.get_kind(Entry), "entries")
+        self.assertEqual(recent_activity.get_kind(Topic), "topics")
+        self.assertEqual(recent_activity.get_kind(Letter), "letters")
+
+    def test_no_kind(self):
+        self.assertIsNone(recent_activity.get_kind(Category))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RecentActivityTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.entry_1 = EntryFactory(title="Entry 1", diary_date=make_date("1660-01-01"))
+        self.entry_2 = EntryFactory(title="Entry 2", diary_date=make_date("1660-01-02"))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.annotation_1 = EntryAnnotationFactory(
+                content_object=self.entry_1,
+                submit_date=make_datetime("2021-04-09 01:00:00"),
+            )
+            self.annotation_2 = EntryAnnotationFactory(
+                content_object=self.entry_2,
+                submit_date=make_datetime("2021-04-10 01:00:00"),
+            )
+
+    def get_annotation_ids(self, kind="entries"):
+        return [row["annotation_id"] for row in recent_activity.get_activity()[kind]]
+
+    def test_rebuilds_when_not_cached(self):
+        cache.clear()
+        # ContentTypes and the current Site are cached for the life of the
+        # process, but other tests can clear those caches, so make sure
+        # they're not queried here:
+        ContentType.objects.get_for_models(
+            *(apps.get_model(label) for label in recent_activity.KINDS.values())
+        )
+        Site.objects.get_current()
+        with self.assertNumQueries(2):
+            activity = recent_activity.get_activity()
+        self.assertEqual(list(activity), list(recent_activity.KINDS))
+        self.assertEqual(
+            [row["annotation_id"] for row in activity["entries"]],
+            [self.annotation_2.pk, self.annotation_1.pk],
+        )
+        self.assertEqual(activity["topics"], [])
+
+    def test_no_queries_when_cached(self):
+        recent_activity.get_activity()
+        with self.assertNumQueries(0):
+            activity = recent_activity.get_activity("entries", "topics")
+        self.assertEqual(list(activity), ["entries", "topics"])
+
+    def test_row(self):
+        row = recent_activity.get_activity("entries")["entries"][0]
+        self.assertEqual(row["object_pk"], str(self.entry_2.pk))
+        self.assertEqual(row["obj_title"], "Entry 2")
+        self.assertEqual(row["submit_date"], make_datetime("2021-04-10 01:00:00"))
+        self.assertEqual(row["url"], self.annotation_2.get_absolute_url())
+
+    def test_adds_new_annotation(self):
+        "A new Annotation should be added without rebuilding the list"
+        with self.captureOnCommitCallbacks(execute=True):
+            annotation = EntryAnnotationFactory(
+                content_object=self.entry_1,
+                submit_date=make_datetime("2021-04-11 01:00:00"),
+            )
+        self.assertEqual(
+            self.get_annotation_ids(), [annotation.pk, self.annotation_2.pk]
+        )
+
+    def test_adds_new_annotation_releases_lock(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            EntryAnnotationFactory(content_object=self.entry_1)
+        self.assertIsNone(cache.get(f"{recent_activity.CACHE_KEY_PREFIX}:entries:lock"))
+
+    @patch.object(recent_activity, "LOCK_WAIT", 0)
+    def test_adds_new_annotation_when_locked(self):
+        "If another process is changing the list, it should be made afresh"
+        recent_activity.get_activity()
+        cache.add(f"{recent_activity.CACHE_KEY_PREFIX}:entries:lock", value=True)
+        with (
+            patch.object(
+                recent_activity,
+                "rebuild_activity",
+                wraps=recent_activity.rebuild_activity,
+            ) as rebuild,
+            self.captureOnCommitCallbacks(execute=True),
+        ):
+            annotation = EntryAnnotationFactory(
+                content_object=self.entry_1,
+                submit_date=make_datetime("2021-04-11 01:00:00"),
+            )
+        rebuild.assert_called_once_with("entries")
+        self.assertEqual(
+            self.get_annotation_ids(), [annotation.pk, self.annotation_2.pk]
+        )
+
+    def test_adds_new_annotation_to_its_kind(self):
+        topic = TopicFactory(title="Topic 1")
+        with self.captureOnCommitCallbacks(execute=True):
+            annotation = TopicAnnotationFactory(
+                content_object=topic,
+                submit_date=make_datetime("2021-04-11 01:00:00"),
+            )
+        self.assertEqual(self.get_annotation_ids("topics"), [annotation.pk])
+        self.assertEqual(
+            self.get_annotation_ids(), [self.annotation_2.pk, self.annotation_1.pk]
+        )
+
+    def test_ignores_older_annotation(self):
+        "An Annotation older than its object's listed one shouldn't replace it"
+        with self.captureOnCommitCallbacks(execute=True):
+            EntryAnnotationFactory(
+                content_object=self.entry_2,
+                submit_date=make_datetime("2021-04-01 01:00:00"),
+            )
+        self.assertEqual(
+            self.get_annotation_ids(), [self.annotation_2.pk, self.annotation_1.pk]
+        )
+
+    def test_hidden_annotation(self):
+        "Hiding a listed Annotation should rebuild its list"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.annotation_2.is_public = False
+            self.annotation_2.save()
+        self.assertEqual(self.get_annotation_ids(), [self.annotation_1.pk])
+
+    def test_removed_annotation(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.annotation_1.is_removed = True
+            self.annotation_1.save()
+        self.assertEqual(self.get_annotation_ids(), [self.annotation_2.pk])
+
+    def test_deleted_annotation(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.annotation_2.delete()
+        self.assertEqual(self.get_annotation_ids(), [self.annotation_1.pk])
+
+    def test_updates_object_title(self):
+        recent_activity.get_activity()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.entry_1.title = "New title"
+            self.entry_1.save()
+        with self.assertNumQueries(0):
+            row = recent_activity.get_activity("entries")["entries"][1]
+        self.assertEqual(row["obj_title"], "New title")
+
+    def test_deleted_object(self):
+        recent_activity.get_activity()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.entry_2.delete()
+        self.assertEqual(self.get_annotation_ids(), [self.annotation_1.pk])
+
+    def test_only_connected_to_kinds(self):
+        "Other models' objects can still be deleted in bulk"
+        self.assertTrue(post_delete.has_listeners(Letter))
+        self.assertFalse(post_delete.has_listeners(RelatedTopic))
+
+    def test_length(self):
+        "Only ACTIVITY_LENGTH objects of each kind should be kept"
+        with self.captureOnCommitCallbacks(execute=True):
+            for day in range(1, recent_activity.ACTIVITY_LENGTH + 1):
+                EntryAnnotationFactory(
+                    content_object=EntryFactory(
+                        diary_date=make_date(f"1661-01-{day:02d}")
+                    ),
+                    submit_date=make_datetime(f"2021-05-{day:02d} 01:00:00"),
+                )
+        activity = recent_activity.get_activity("entries")["entries"]
+        self.assertEqual(len(activity), recent_activity.ACTIVITY_LENGTH)
+        self.assertNotIn(
+            self.annotation_2.pk, [row["annotation_id"] for row in activity]
+        )
+        cache.clear()
+        self.assertEqual(recent_activity.get_activity("entries")["entries"], activity)
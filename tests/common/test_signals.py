@@ -0,0 +1,180 @@
+from django.contrib.postgres.search import SearchQuery
+from django.core.cache import cache
+from django.db.models.signals import pre_delete
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from pepysdiary.annotations.factories import EntryAnnotationFactory
+from pepysdiary.common.caching import get_cache_tag_versions
+from pepysdiary.common.signals import reindex_counts
+from pepysdiary.common.utilities import make_date
+from pepysdiary.diary.factories import EntryFactory
+from pepysdiary.diary.models import Entry
+from pepysdiary.encyclopedia.factories import TopicFactory
+from pepysdiary.encyclopedia.models import RelatedTopic, Topic
+from tests.common.test_caching import LOCMEM_CACHES
+
+
+class OnSaveTestCase(TestCase):
+    def setUp(self):
+        self.entry = EntryFactory(text="<p>Up betimes.</p>")
+        self.initial_counts = reindex_counts.copy()
+
+    def _count_change(self, key):
+        return reindex_counts[key] - self.initial_counts[key]
+
+    def test_reindexes_new_object(self):
+        "A newly-created object should always be indexed"
+        EntryFactory()
+        self.assertEqual(self._count_change("updated"), 1)
+        self.assertEqual(self._count_change("skipped"), 0)
+
+    def test_reindexes_changed_object(self):
+        "If an indexed field has changed, the object should be indexed"
+        entry = Entry.objects.get(pk=self.entry.pk)
+        entry.text = "<p>And so to bed.</p>"
+        entry.save()
+        self.assertEqual(self._count_change("updated"), 1)
+        self.assertEqual(self._count_change("skipped"), 0)
+
+    def test_skips_unchanged_object(self):
+        "If no indexed fields have changed, the object should not be indexed"
+        # search_document is still deferred, but it isn't one of search_fields.
+        entry = Entry.objects.with_large_fields("text", "footnotes").get(
+            pk=self.entry.pk
+        )
+        entry.comment_count = 10
+        entry.save()
+        self.assertEqual(self._count_change("updated"), 0)
+        self.assertEqual(self._count_change("skipped"), 1)
+
+    def test_skips_after_save(self):
+        "After saving, the saved components are what later saves are compared to"
+        self.entry.text = "<p>And so to bed.</p>"
+        self.entry.save()
+        self.entry.save()
+        self.assertEqual(self._count_change("updated"), 1)
+        self.assertEqual(self._count_change("skipped"), 1)
+
+    def test_reindexes_deferred_object(self):
+        "If an object was loaded with deferred fields, it should be indexed"
+        entry = Entry.objects.only("id", "comment_count").get(pk=self.entry.pk)
+        entry.comment_count = 10
+        entry.save()
+        self.assertEqual(self._count_change("updated"), 1)
+
+
+class OnSaveTransactionTestCase(TransactionTestCase):
+    "Using TransactionTestCase so that the search_document updates happen"
+
+    def test_new_topic_is_searchable(self):
+        "Topic.save() saves twice; the second mustn't wipe the new index"
+        topic = TopicFactory(title="Cats zzq")
+        self.assertIsNotNone(
+            Topic.objects.filter(pk=topic.pk)
+            .values_list("search_document", flat=True)
+            .get()
+        )
+        self.assertEqual(
+            list(Topic.objects.filter(search_document=SearchQuery("zzq"))), [topic]
+        )
+
+    def test_search_document_not_saved(self):
+        "Saving an object again shouldn't write its search_document"
+        entry = EntryFactory(title="Cats zzq")
+        entry.comment_count = 10
+        entry.save()
+        self.assertEqual(
+            list(Entry.objects.filter(search_document=SearchQuery("zzq"))), [entry]
+        )
+
+
+TOPIC_URL = "https://www.pepysdiary.com/encyclopedia/"
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ExpireCacheTagsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.topic = TopicFactory()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.entry = EntryFactory(
+                diary_date=make_date("1661-01-02"),
+                text=f'<a href="{TOPIC_URL}{self.topic.pk}/">Cat</a>',
+            )
+        self.tags = [
+            "diary.entry",
+            "diary.entry:1661-01-02",
+            "diary.entry:1661-01",
+            f"encyclopedia.topic:{self.topic.pk}",
+        ]
+        self.versions = get_cache_tag_versions(self.tags)
+
+    def test_entry_save(self):
+        "Saving an Entry expires its tags and those of Topics it refers to"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.entry.save()
+        versions = get_cache_tag_versions(self.tags)
+        for tag in self.tags:
+            self.assertNotEqual(versions[tag], self.versions[tag], tag)
+
+    def test_entry_delete(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.entry.delete()
+        versions = get_cache_tag_versions(self.tags)
+        self.assertNotEqual(versions["diary.entry"], self.versions["diary.entry"])
+
+    def test_annotation_save(self):
+        "Posting an Annotation expires the tags of the Entry it's on"
+        with self.captureOnCommitCallbacks(execute=True):
+            EntryAnnotationFactory(content_object=self.entry)
+        versions = get_cache_tag_versions(self.tags)
+        self.assertNotEqual(
+            versions["diary.entry:1661-01-02"],
+            self.versions["diary.entry:1661-01-02"],
+        )
+
+    def test_annotation_save_expires_its_entry_and_month(self):
+        "The month's pages show the Entries' numbers of annotations"
+        with self.captureOnCommitCallbacks(execute=True):
+            EntryAnnotationFactory(content_object=self.entry)
+        versions = get_cache_tag_versions(self.tags)
+        for tag in ("diary.entry:1661-01-02", "diary.entry:1661-01"):
+            self.assertNotEqual(versions[tag], self.versions[tag], tag)
+
+    def test_annotation_save_doesnt_expire_all_entries(self):
+        "Posting an Annotation shouldn't expire all Entries, or the Topics"
+        with self.captureOnCommitCallbacks(execute=True):
+            EntryAnnotationFactory(content_object=self.entry)
+        versions = get_cache_tag_versions(self.tags)
+        for tag in ("diary.entry", self.tags[3]):
+            self.assertEqual(versions[tag], self.versions[tag], tag)
+
+    def test_annotation_save_expires_recent_activity(self):
+        versions = get_cache_tag_versions(["annotations.annotation"])
+        with self.captureOnCommitCallbacks(execute=True):
+            EntryAnnotationFactory(content_object=self.entry)
+        self.assertNotEqual(
+            get_cache_tag_versions(["annotations.annotation"]), versions
+        )
+
+    def test_other_entry_unaffected(self):
+        other_versions = get_cache_tag_versions(["diary.entry:1661-01-03"])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.entry.save()
+        self.assertEqual(
+            get_cache_tag_versions(["diary.entry:1661-01-03"]), other_versions
+        )
+
+    def test_m2m_changed(self):
+        "Adding a reference expires the tags of both the Entry and the Topic"
+        topic = TopicFactory()
+        topic_tag = f"encyclopedia.topic:{topic.pk}"
+        versions = get_cache_tag_versions([topic_tag])
+        with self.captureOnCommitCallbacks(execute=True):
+            topic.diary_references.add(self.entry)
+        self.assertNotEqual(get_cache_tag_versions([topic_tag]), versions)
+
+    def test_only_connected_to_tagged_models(self):
+        "Other models' objects can still be deleted in bulk"
+        self.assertTrue(pre_delete.has_listeners(Entry))
+        self.assertFalse(pre_delete.has_listeners(RelatedTopic))
@@ -183,6 +183,23 @@ class CommonURLsTestCase(TestCase):
     def test_recent_view(self):
         self.assertEqual(resolve("/recent/").func.view_class, common_views.RecentView)
 
+    def test_recent_json_url(self):
+        self.assertEqual(reverse("recent_json"), "/recent/activity.json")
+
+    def test_recent_json_view(self):
+        self.assertEqual(
+            resolve("/recent/activity.json").func.view_class,
+            common_views.RecentActivityJSONView,
+        )
+
+    def test_cache_stats_url(self):
+        self.assertEqual(reverse("cache_stats"), "/cache-stats/")
+
+    def test_cache_stats_view(self):
+        self.assertEqual(
+            resolve("/cache-stats/").func.view_class, common_views.CacheStatsView
+        )
+
 
 class DjangoDebugToolbarTestCase(TestCase):
     "Check it's there with DEBUG=True, not there otherwise"
@@ -1,6 +1,10 @@
+import json
 import os
 import tempfile
 
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.http.request import QueryDict
 from django.test import override_settings
@@ -8,13 +12,16 @@ from freezegun import freeze_time
 
 from pepysdiary.annotations.factories import EntryAnnotationFactory
 from pepysdiary.common import views
+from pepysdiary.common.cache_stats import cache_stats
 from pepysdiary.common.utilities import make_date, make_datetime
 from pepysdiary.diary.factories import EntryFactory
 from pepysdiary.encyclopedia.factories import TopicFactory
 from pepysdiary.indepth.factories import DraftArticleFactory, PublishedArticleFactory
 from pepysdiary.letters.factories import LetterFactory
+from pepysdiary.membership.factories import PersonFactory, StaffPersonFactory
 from pepysdiary.news.factories import DraftPostFactory, PublishedPostFactory
 from tests import ViewTestCase, ViewTransactionTestCase
+from tests.common.test_caching import LOCMEM_CACHES
 
 # Location for files used in tests
 ASSET_DIR = os.path.dirname(__file__) + "/../assets/"
@@ -29,6 +36,59 @@ class HomeViewTestCase(ViewTestCase):
         response = views.HomeView.as_view()(self.request)
         self.assertEqual(response.template_name[0], "common/home.html")
 
+    @freeze_time("2021-04-10 21:00:00", tz_offset=0)
+    def test_cached_until_next_publication(self):
+        "The cache should expire when the next Entry is published, at 11pm"
+        self.assertEqual(views.HomeView().get_cache_timeout(), 7200)
+
+    @freeze_time("2021-04-10 23:30:00", tz_offset=0)
+    def test_cached_until_next_publication_tomorrow(self):
+        "After 11pm the cache should expire at 11pm tomorrow"
+        self.assertEqual(views.HomeView().get_cache_timeout(), 84600)
+
+    @freeze_time("2021-04-10 21:00:00", tz_offset=0)
+    def test_browser_cache_timeout(self):
+        "Browsers should only cache the page briefly, as comments expire it"
+        response = views.HomeView.as_view()(self.request)
+        # The cache headers are only set once the response is rendered:
+        response.render()
+        self.assertIn("max-age=60", response["Cache-Control"])
+
+    @freeze_time("2021-04-10 22:59:30", tz_offset=0)
+    def test_browser_cache_timeout_before_publication(self):
+        "Browsers shouldn't cache the page beyond the next publication"
+        response = views.HomeView.as_view()(self.request)
+        response.render()
+        self.assertIn("max-age=30", response["Cache-Control"])
+
+    @freeze_time("2021-04-10 12:00:00", tz_offset=0)
+    @override_settings(CACHES=LOCMEM_CACHES, YEARS_OFFSET=353)
+    def test_cache_expires_after_comment(self):
+        "The page shows the Entries' numbers of annotations"
+        cache.clear()
+        entry = EntryFactory(diary_date=make_date("1668-04-09"))
+        self.assertIn("Read 0 annotations", self._get_cached_home())
+        with self.captureOnCommitCallbacks(execute=True):
+            EntryAnnotationFactory(content_object=entry)
+        self.assertIn("Read 1 annotation by", self._get_cached_home())
+
+    @freeze_time("2021-04-10 12:00:00", tz_offset=0)
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_cache_expires_after_post_published(self):
+        cache.clear()
+        self.assertNotIn("New post", self._get_cached_home())
+        with self.captureOnCommitCallbacks(execute=True):
+            PublishedPostFactory(title="New post")
+        self.assertIn("New post", self._get_cached_home())
+
+    def _get_cached_home(self):
+        request = self.factory.get("/fake-path/")
+        request.user = AnonymousUser()
+        response = views.HomeView.as_view()(request)
+        if hasattr(response, "render"):
+            response.render()
+        return response.content.decode()
+
     @freeze_time("2021-04-10 12:00:00", tz_offset=0)
     @override_settings(YEARS_OFFSET=353)
     def test_context_entry_list(self):
@@ -372,6 +432,95 @@ class RecentViewTestCase(ViewTestCase):
         response = views.RecentView.as_view()(self.request)
         self.assertEqual(response.template_name[0], "common/recent.html")
 
+    def test_cache_tags(self):
+        "The lists include the titles of all these kinds of objects"
+        self.assertEqual(
+            set(views.RecentView().get_cache_tags()),
+            {
+                "annotations.annotation",
+                "diary.entry",
+                "encyclopedia.topic",
+                "indepth.article",
+                "letters.letter",
+                "news.post",
+            },
+        )
+
+
+class RecentActivityJSONViewTestCase(ViewTestCase):
+    def test_response(self):
+        entry = EntryFactory(title="Entry 1", diary_date=make_date("1660-01-01"))
+        annotation = EntryAnnotationFactory(
+            content_object=entry,
+            user_name="Bob",
+            comment="Hello",
+            submit_date=make_datetime("2021-04-09 01:00:00"),
+        )
+        response = views.RecentActivityJSONView.as_view()(self.request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Cache-Control"], "public, max-age=60")
+        data = json.loads(response.content)
+        self.assertEqual(
+            list(data), ["entries", "topics", "letters", "articles", "posts"]
+        )
+        self.assertEqual(
+            data["entries"],
+            [
+                {
+                    "title": "Entry 1",
+                    "url": f"http://testserver{annotation.get_absolute_url()}",
+                    "user_name": "Bob",
+                    "text": "Hello",
+                    "submit_date": "2021-04-09T01:00:00+00:00",
+                }
+            ],
+        )
+        self.assertEqual(data["topics"], [])
+
+
+class CacheStatsViewTestCase(ViewTestCase):
+    def setUp(self):
+        super().setUp()
+        cache_stats.reset()
+        cache_stats.record("home", hits=2, misses=1, stores=1, bytes=500)
+
+    def tearDown(self):
+        cache_stats.reset()
+
+    def test_anonymous_denied(self):
+        self.request.user = AnonymousUser()
+        with self.assertRaises(PermissionDenied):
+            views.CacheStatsView.as_view()(self.request)
+
+    def test_non_staff_denied(self):
+        self.request.user = PersonFactory()
+        with self.assertRaises(PermissionDenied):
+            views.CacheStatsView.as_view()(self.request)
+
+    def test_text(self):
+        self.request.user = StaffPersonFactory()
+        response = views.CacheStatsView.as_view()(self.request)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        content = response.content.decode()
+        self.assertIn('pepys_cache_hits_total{url_name="home"} 2', content)
+        self.assertIn('pepys_cache_stored_bytes_total{url_name="home"} 500', content)
+        self.assertIn('pepys_cache_fragment_seconds_total{kind="saved"}', content)
+
+    def test_json(self):
+        request = self.factory.get("/fake-path/", {"format": "json"})
+        request.user = StaffPersonFactory()
+        response = views.CacheStatsView.as_view()(request)
+        data = json.loads(response.content)
+        self.assertEqual(data["urls"]["home"]["misses"], 1)
+        self.assertEqual(data["totals"]["stores"], 1)
+        self.assertIn("fragments", data)
+
+    def test_never_cached(self):
+        self.request.user = StaffPersonFactory()
+        response = views.CacheStatsView.as_view()(self.request)
+        self.assertIn("no-cache", response["Cache-Control"])
+
 
 # No tests for the RedirectViews here because we fully test the URLs
 # that they redirect in common/tests_urls.py.
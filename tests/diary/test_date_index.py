@@ -0,0 +1,92 @@
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from pepysdiary.common.utilities import make_date
+from pepysdiary.diary.date_index import entry_date_index
+from pepysdiary.diary.factories import EntryFactory
+
+
+class EntryDateIndexTestCase(TestCase):
+    def setUp(self):
+        self.entry_1 = EntryFactory(diary_date=make_date("1661-01-31"))
+        self.entry_2 = EntryFactory(diary_date=make_date("1661-02-01"))
+        self.entry_3 = EntryFactory(diary_date=make_date("1661-02-03"))
+
+    def test_contains(self):
+        self.assertTrue(entry_date_index.contains(make_date("1661-02-01")))
+        self.assertFalse(entry_date_index.contains(make_date("1661-02-02")))
+
+    def test_previous_date(self):
+        d = entry_date_index.previous_date(make_date("1661-02-03"))
+        self.assertEqual(d, make_date("1661-02-01"))
+
+    def test_previous_date_between_entries(self):
+        d = entry_date_index.previous_date(make_date("1661-02-02"))
+        self.assertEqual(d, make_date("1661-02-01"))
+
+    def test_previous_date_none(self):
+        self.assertIsNone(entry_date_index.previous_date(make_date("1661-01-31")))
+
+    def test_next_date(self):
+        d = entry_date_index.next_date(make_date("1661-02-01"))
+        self.assertEqual(d, make_date("1661-02-03"))
+
+    def test_next_date_none(self):
+        self.assertIsNone(entry_date_index.next_date(make_date("1661-02-03")))
+
+    def test_previous_entry(self):
+        entry = entry_date_index.previous_entry(make_date("1661-02-01"))
+        self.assertEqual(entry, self.entry_1)
+        self.assertEqual(entry.title, self.entry_1.title)
+        self.assertEqual(entry.get_absolute_url(), self.entry_1.get_absolute_url())
+
+    def test_next_entry(self):
+        entry = entry_date_index.next_entry(make_date("1661-02-01"))
+        self.assertEqual(entry, self.entry_3)
+
+    def test_uses_no_queries_once_built(self):
+        entry_date_index.contains(make_date("1661-02-01"))
+        with self.assertNumQueries(0):
+            entry_date_index.previous_entry(make_date("1661-02-01"))
+            entry_date_index.next_entry(make_date("1661-02-01"))
+
+    def test_rebuilt_after_save(self):
+        entry_date_index.contains(make_date("1661-02-02"))
+        EntryFactory(diary_date=make_date("1661-02-02"))
+        self.assertTrue(entry_date_index.contains(make_date("1661-02-02")))
+
+    def test_rebuilt_after_delete(self):
+        entry_date_index.contains(make_date("1661-02-03"))
+        self.entry_3.delete()
+        self.assertFalse(entry_date_index.contains(make_date("1661-02-03")))
+
+    def test_checks_version_every_time_outside_requests(self):
+        entry_date_index.contains(make_date("1661-02-01"))
+        with patch("pepysdiary.common.memory_index.cache") as mock_cache:
+            mock_cache.get.return_value = entry_date_index._version
+            entry_date_index.contains(make_date("1661-02-01"))
+            entry_date_index.next_date(make_date("1661-02-01"))
+        self.assertEqual(mock_cache.get.call_count, 2)
+
+    def test_checks_version_once_per_request(self):
+        entry_date_index.contains(make_date("1661-02-01"))
+        entry_date_index.request_started()
+        try:
+            with patch("pepysdiary.common.memory_index.cache") as mock_cache:
+                mock_cache.get.return_value = entry_date_index._version
+                entry_date_index.contains(make_date("1661-02-01"))
+                entry_date_index.next_date(make_date("1661-02-01"))
+                entry_date_index.previous_entry(make_date("1661-02-01"))
+            self.assertEqual(mock_cache.get.call_count, 1)
+        finally:
+            entry_date_index.request_finished()
+
+    def test_rebuilt_after_save_during_request(self):
+        entry_date_index.request_started()
+        try:
+            entry_date_index.contains(make_date("1661-02-02"))
+            EntryFactory(diary_date=make_date("1661-02-02"))
+            self.assertTrue(entry_date_index.contains(make_date("1661-02-02")))
+        finally:
+            entry_date_index.request_finished()
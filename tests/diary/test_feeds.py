@@ -13,6 +13,12 @@ class LatestEntriesFeedTestCase(FeedTestCase):
         feed = self.get_feed_element("/diary/rss/")
         self.assertEqual(feed.getAttribute("version"), "2.0")
 
+    @freeze_time("2021-04-07 22:59:30", tz_offset=0)
+    def test_cached_until_next_publication(self):
+        "The cache should expire when the next Entry is published, at 11pm"
+        response = self.client.get("/diary/rss/")
+        self.assertIn("max-age=30", response["Cache-Control"])
+
     @freeze_time("2021-04-07 12:00:00", tz_offset=0)
     @override_settings(YEARS_OFFSET=353)
     def test_channel_element(self):
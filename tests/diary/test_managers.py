@@ -1,11 +1,14 @@
+from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import TestCase, override_settings
 from freezegun import freeze_time
 
-from pepysdiary.common.utilities import make_date
+from pepysdiary.common.managers import large_fields_not_deferred
+from pepysdiary.common.utilities import make_date, make_datetime
 from pepysdiary.diary.factories import EntryFactory
 from pepysdiary.diary.models import Entry
 from pepysdiary.encyclopedia.factories import TopicFactory
+from tests.common.test_caching import LOCMEM_CACHES
 
 
 class EntryManagerTestCase(TestCase):
@@ -44,6 +47,41 @@ class EntryManagerTestCase(TestCase):
         d = Entry.objects.most_recent_entry_date()
         self.assertEqual(d, make_date("1667-02-28"))
 
+    @freeze_time("2021-02-01 22:59:59", tz_offset=0)
+    def test_next_publication_time_before_11pm(self):
+        "Before 11pm, should return 11pm today"
+        self.assertEqual(
+            Entry.objects.next_publication_time(),
+            make_datetime("2021-02-01 23:00:00"),
+        )
+
+    @freeze_time("2021-02-01 23:00:00", tz_offset=0)
+    def test_next_publication_time_after_11pm(self):
+        "From 11pm, should return 11pm tomorrow"
+        self.assertEqual(
+            Entry.objects.next_publication_time(),
+            make_datetime("2021-02-02 23:00:00"),
+        )
+
+    @freeze_time("2021-02-01 22:00:00", tz_offset=0)
+    @override_settings(YEARS_OFFSET=353)
+    def test_next_publication_time_matches_most_recent_entry_date(self):
+        "most_recent_entry_date() should change at next_publication_time()"
+        before = Entry.objects.most_recent_entry_date()
+        with freeze_time(Entry.objects.next_publication_time()):
+            after = Entry.objects.most_recent_entry_date()
+        self.assertEqual(before, make_date("1668-01-31"))
+        self.assertEqual(after, make_date("1668-02-01"))
+
+    @freeze_time("2021-02-01 21:30:00", tz_offset=0)
+    def test_seconds_until_next_publication(self):
+        self.assertEqual(Entry.objects.seconds_until_next_publication(), 5400)
+
+    @freeze_time("2021-02-01 22:59:59.5", tz_offset=0)
+    def test_seconds_until_next_publication_minimum(self):
+        "It should never return less than 1"
+        self.assertEqual(Entry.objects.seconds_until_next_publication(), 1)
+
     def test_all_years_months_invalid_format(self):
         with self.assertRaises(ValueError):
             Entry.objects.all_years_months(month_format="c")
@@ -139,3 +177,105 @@ class EntryManagerTestCase(TestCase):
 
         # Tidy up the file
         topic_1.thumbnail.delete()
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_get_brief_references_queries(self):
+        "It should use one query for all the Entries once Topics are cached"
+        cache.clear()
+        topic_1 = TopicFactory()
+        topic_2 = TopicFactory()
+        entries = [
+            EntryFactory(diary_date=make_date(f"1660-01-0{day}")) for day in (1, 2, 3)
+        ]
+        for entry in entries:
+            entry.topics.add(topic_1, topic_2)
+
+        with self.assertNumQueries(2):
+            Entry.objects.get_brief_references(entries)
+        with self.assertNumQueries(1):
+            references = Entry.objects.get_brief_references(entries)
+        self.assertEqual(list(references.keys()), [str(topic_1.pk), str(topic_2.pk)])
+
+    def test_get_brief_references_none(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(Entry.objects.get_brief_references([]), {})
+
+    def test_get_references_version(self):
+        "It should only change when the referenced Topics change"
+        topic_1 = TopicFactory()
+        topic_2 = TopicFactory()
+        entry = EntryFactory()
+        entry.topics.add(topic_1)
+
+        with self.assertNumQueries(1):
+            version = Entry.objects.get_references_version([entry])
+        self.assertEqual(Entry.objects.get_references_version([entry]), version)
+
+        topic_2.save()
+        self.assertEqual(Entry.objects.get_references_version([entry]), version)
+
+        topic_1.save()
+        version_2 = Entry.objects.get_references_version([entry])
+        self.assertNotEqual(version_2, version)
+
+        entry.topics.add(topic_2)
+        self.assertNotEqual(Entry.objects.get_references_version([entry]), version_2)
+
+
+class EntryManagerLargeFieldsTestCase(TestCase):
+    def setUp(self):
+        self.entry = EntryFactory(text="<p>Up betimes.</p>", footnotes="<p>1.</p>")
+
+    def test_defers_large_fields(self):
+        entry = Entry.objects.get(pk=self.entry.pk)
+        self.assertEqual(
+            entry.get_deferred_fields(), {"text", "footnotes", "search_document"}
+        )
+
+    def test_defers_large_fields_of_related_objects(self):
+        topic = TopicFactory(diary_references=[self.entry])
+        entry = topic.diary_references.get()
+        self.assertEqual(
+            entry.get_deferred_fields(), {"text", "footnotes", "search_document"}
+        )
+
+    def test_deferred_fields_are_still_available(self):
+        entry = Entry.objects.get(pk=self.entry.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(entry.text, "<p>Up betimes.</p>")
+
+    def test_with_large_fields_all(self):
+        entry = Entry.objects.with_large_fields().get(pk=self.entry.pk)
+        self.assertEqual(entry.get_deferred_fields(), set())
+
+    def test_with_large_fields_some(self):
+        entry = Entry.objects.with_large_fields("text", "footnotes").get(
+            pk=self.entry.pk
+        )
+        self.assertEqual(entry.get_deferred_fields(), {"search_document"})
+        with self.assertNumQueries(0):
+            self.assertEqual(entry.footnotes, "<p>1.</p>")
+
+    def test_with_large_fields_chained(self):
+        entry = Entry.objects.filter(pk=self.entry.pk).with_large_fields("text").get()
+        self.assertEqual(entry.get_deferred_fields(), {"footnotes", "search_document"})
+
+    def test_with_large_fields_invalid(self):
+        with self.assertRaises(ValueError):
+            Entry.objects.with_large_fields("text", "title")
+
+    def test_only_loads_large_fields(self):
+        "only() should load any large fields it's given"
+        entry = Entry.objects.only("pk", "text").get(pk=self.entry.pk)
+        self.assertNotIn("text", entry.get_deferred_fields())
+        self.assertIn("title", entry.get_deferred_fields())
+
+    def test_large_fields_not_deferred(self):
+        with large_fields_not_deferred():
+            entry = Entry.objects.get(pk=self.entry.pk)
+            entry_2 = Entry.objects.with_large_fields("text").get(pk=self.entry.pk)
+        self.assertEqual(entry.get_deferred_fields(), set())
+        self.assertEqual(entry_2.get_deferred_fields(), set())
+        # And it's back to normal afterwards:
+        entry = Entry.objects.get(pk=self.entry.pk)
+        self.assertIn("text", entry.get_deferred_fields())
@@ -63,6 +63,31 @@ class EntryTestCase(TestCase):
         self.assertEqual(len(topic_3_refs), 1)
         self.assertEqual(topic_3_refs[0], entry)
 
+    def test_makes_references_ignores_missing_topics(self):
+        "References to Topics that don't exist should be ignored"
+        topic = TopicFactory()
+        entry = EntryFactory(
+            text=(
+                f'<a href="http://www.pepysdiary.com/encyclopedia/{topic.id}/">a</a>'
+                f'<a href="http://www.pepysdiary.com/encyclopedia/{topic.id + 1}/">b'
+                "</a>"
+            )
+        )
+        self.assertEqual(list(entry.topics.all()), [topic])
+
+    def test_save_deferred_doesnt_fetch_text(self):
+        "Saving an Entry whose text wasn't loaded shouldn't fetch it"
+        topic = TopicFactory()
+        EntryFactory(
+            text=f'<a href="http://www.pepysdiary.com/encyclopedia/{topic.id}/">a</a>'
+        )
+        entry = Entry.objects.get()
+        # The UPDATE, and getting its Topics' cache tags:
+        with self.assertNumQueries(2):
+            entry.save()
+        self.assertIn("text", entry.get_deferred_fields())
+        self.assertEqual(list(entry.topics.all()), [topic])
+
     def test_get_absolute_url(self):
         "It should return the correct URL"
         entry = EntryFactory(diary_date=make_date("1660-01-01"))
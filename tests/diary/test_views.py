@@ -1,8 +1,11 @@
+import json
+
 from django.http.response import Http404
 
 from pepysdiary.common.utilities import make_date
 from pepysdiary.diary import views
 from pepysdiary.diary.factories import EntryFactory, SummaryFactory
+from pepysdiary.diary.models import Entry
 from pepysdiary.encyclopedia.factories import TopicFactory
 from tests import ViewTestCase
 
@@ -44,33 +47,29 @@ class EntryDetailViewTestCase(ViewTestCase):
         self.assertEqual(data["entry"], data["object"])
         self.assertEqual(data["entry"], entry)
 
-    def test_context_data_tooltip_references(self):
-        "The tooltip_references are sent to the template"
+    def test_context_data_entry_fields(self):
+        "The Entry's text and footnotes should be fetched with it"
+        EntryFactory(diary_date=make_date("1661-01-02"))
+        response = views.EntryDetailView.as_view()(
+            self.request, year="1661", month="01", day="02"
+        )
+        self.assertEqual(
+            response.context_data["entry"].get_deferred_fields(), {"search_document"}
+        )
+
+    def test_context_data_tooltips_url(self):
+        "The versioned URL of the tooltips' data is sent to the template"
         entry = EntryFactory(diary_date=make_date("1661-01-02"))
-        topic_1 = TopicFactory(title="Cats", tooltip_text="About cats")
-        topic_2 = TopicFactory(title="Dogs", tooltip_text="About dogs")
-        topic_1.diary_references.add(entry)
-        topic_2.diary_references.add(entry)
+        TopicFactory().diary_references.add(entry)
 
         response = views.EntryDetailView.as_view()(
             self.request, year="1661", month="01", day="02"
         )
 
-        self.assertIn("tooltip_references", response.context_data)
+        version = Entry.objects.get_references_version([entry])
         self.assertEqual(
-            response.context_data["tooltip_references"],
-            {
-                str(topic_1.pk): {
-                    "title": "Cats",
-                    "text": "About cats",
-                    "thumbnail_url": "",
-                },
-                str(topic_2.pk): {
-                    "title": "Dogs",
-                    "text": "About dogs",
-                    "thumbnail_url": "",
-                },
-            },
+            response.context_data["tooltips_url"],
+            f"/diary/1661/01/02/tooltips.json?v={version}",
         )
 
     def test_context_data_next_previous(self):
@@ -135,6 +134,27 @@ class EntryMonthArchiveViewTestCase(ViewTestCase):
         self.assertEqual(entries[1], entry_1)
         self.assertEqual(entries[2], entry_2)
 
+    def test_context_next_previous_month(self):
+        "It should skip months with no Entries"
+        EntryFactory(diary_date=make_date("1660-11-30"))
+        EntryFactory(diary_date=make_date("1661-01-02"))
+        EntryFactory(diary_date=make_date("1661-03-15"))
+        response = views.EntryMonthArchiveView.as_view()(
+            self.request, year="1661", month="01"
+        )
+        self.assertEqual(
+            response.context_data["previous_month"], make_date("1660-11-01")
+        )
+        self.assertEqual(response.context_data["next_month"], make_date("1661-03-01"))
+
+    def test_context_no_next_previous_month(self):
+        EntryFactory(diary_date=make_date("1661-01-02"))
+        response = views.EntryMonthArchiveView.as_view()(
+            self.request, year="1661", month="01"
+        )
+        self.assertIsNone(response.context_data["previous_month"])
+        self.assertIsNone(response.context_data["next_month"])
+
     def test_context_entries(self):
         "entry_list and object_list should exist in the context"
         entry = EntryFactory(diary_date=make_date("1661-01-02"))
@@ -153,46 +173,130 @@ class EntryMonthArchiveViewTestCase(ViewTestCase):
             response.context_data["object_list"], response.context_data["entry_list"]
         )
 
-    def test_context_tooltip_references(self):
-        "The correct tooltip references should be included in the context"
-
-        topic_1 = TopicFactory(title="Cats", tooltip_text="About cats")
-        topic_2 = TopicFactory(title="Dogs", tooltip_text="About dogs")
-        topic_3 = TopicFactory(title="Fish", tooltip_text="About fish")
-
+    def test_context_tooltips_url(self):
+        "The versioned URL of the tooltips' data should be in the context"
         entry_1 = EntryFactory(diary_date=make_date("1661-01-02"))
-        topic_1.diary_references.add(entry_1)
-        topic_2.diary_references.add(entry_1)
-
         entry_2 = EntryFactory(diary_date=make_date("1661-01-03"))
-        topic_2.diary_references.add(entry_2)
-        topic_3.diary_references.add(entry_2)
+        TopicFactory().diary_references.add(entry_1, entry_2)
 
         response = views.EntryMonthArchiveView.as_view()(
             self.request, year="1661", month="01"
         )
-        self.assertIn("tooltip_references", response.context_data)
+
+        version = Entry.objects.get_references_version([entry_1, entry_2])
         self.assertEqual(
-            response.context_data["tooltip_references"],
+            response.context_data["tooltips_url"],
+            f"/diary/1661/01/tooltips.json?v={version}",
+        )
+
+
+class EntryTooltipsViewTestCase(ViewTestCase):
+    def setUp(self):
+        super().setUp()
+        self.entry = EntryFactory(diary_date=make_date("1661-01-02"))
+        self.topic_1 = TopicFactory(title="Cats", tooltip_text="About cats")
+        self.topic_2 = TopicFactory(title="Dogs", tooltip_text="About dogs")
+        self.topic_1.diary_references.add(self.entry)
+        self.topic_2.diary_references.add(self.entry)
+        self.version = Entry.objects.get_references_version([self.entry])
+
+    def get_response(self, request):
+        return views.EntryTooltipsView.as_view()(
+            request, year="1661", month="01", day="02"
+        )
+
+    def test_response(self):
+        response = self.get_response(self.request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertEqual(
+            json.loads(response.content),
             {
-                str(topic_1.pk): {
+                str(self.topic_1.pk): {
                     "title": "Cats",
                     "text": "About cats",
                     "thumbnail_url": "",
                 },
-                str(topic_2.pk): {
+                str(self.topic_2.pk): {
                     "title": "Dogs",
                     "text": "About dogs",
                     "thumbnail_url": "",
                 },
-                str(topic_3.pk): {
-                    "title": "Fish",
-                    "text": "About fish",
-                    "thumbnail_url": "",
-                },
             },
         )
 
+    def test_response_404_no_entry(self):
+        with self.assertRaises(Http404):
+            views.EntryTooltipsView.as_view()(
+                self.request, year="1661", month="01", day="03"
+            )
+
+    def test_etag(self):
+        response = self.get_response(self.request)
+        self.assertEqual(response["ETag"], f'"{self.version}"')
+
+    def test_not_modified(self):
+        "It returns 304 if the request's ETag is the current one"
+        request = self.factory.get(
+            "/fake-path/", headers={"if-none-match": f'"{self.version}"'}
+        )
+        response = self.get_response(request)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], f'"{self.version}"')
+
+    def test_modified(self):
+        "It returns 200 if a Topic has changed since the request's ETag"
+        self.topic_1.save()
+        request = self.factory.get(
+            "/fake-path/", headers={"if-none-match": f'"{self.version}"'}
+        )
+        response = self.get_response(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], f'"{self.version}"')
+
+    def test_cache_control_versioned(self):
+        "It can be cached for a long time if the URL has the current version"
+        request = self.factory.get("/fake-path/", {"v": self.version})
+        response = self.get_response(request)
+        self.assertEqual(response["Cache-Control"], "public, max-age=31536000")
+
+    def test_cache_control_unversioned(self):
+        "It should be revalidated every time if the URL has no/another version"
+        for data in ({}, {"v": "old"}):
+            with self.subTest(data=data):
+                request = self.factory.get("/fake-path/", data)
+                response = self.get_response(request)
+                self.assertEqual(response["Cache-Control"], "public, max-age=0")
+
+
+class EntryMonthTooltipsViewTestCase(ViewTestCase):
+    def test_response(self):
+        topic_1 = TopicFactory(title="Cats", tooltip_text="About cats")
+        topic_2 = TopicFactory(title="Dogs", tooltip_text="About dogs")
+        topic_1.diary_references.add(EntryFactory(diary_date=make_date("1661-01-02")))
+        topic_2.diary_references.add(EntryFactory(diary_date=make_date("1661-01-03")))
+        # Shouldn't be included:
+        TopicFactory().diary_references.add(
+            EntryFactory(diary_date=make_date("1661-02-01"))
+        )
+
+        response = views.EntryMonthTooltipsView.as_view()(
+            self.request, year="1661", month="01"
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            list(json.loads(response.content).keys()),
+            [str(topic_1.pk), str(topic_2.pk)],
+        )
+
+    def test_response_404_no_entries(self):
+        EntryFactory(diary_date=make_date("1661-02-01"))
+        with self.assertRaises(Http404):
+            views.EntryMonthTooltipsView.as_view()(
+                self.request, year="1661", month="01"
+            )
+
 
 class EntryArchiveIndexViewTestCase(ViewTestCase):
     def test_response_200(self):
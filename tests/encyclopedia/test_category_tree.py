@@ -0,0 +1,78 @@
+from django.test import TestCase
+
+from pepysdiary.encyclopedia.category_tree import category_tree
+from pepysdiary.encyclopedia.models import Category
+
+
+class CategoryTreeTestCase(TestCase):
+    def setUp(self):
+        # Categories are ordered by title, so we add them in that order to
+        # avoid changing the paths of ones we've already created.
+        self.animals = Category.add_root(title="Animals", slug="animals")
+        self.food = Category.add_root(title="Food", slug="food")
+        self.drink = self.food.add_child(title="Drink", slug="drink")
+        self.ale = self.drink.add_child(title="Ale", slug="ale")
+        self.wine = self.drink.add_child(title="Wine", slug="wine")
+
+    def test_get_categories(self):
+        self.assertEqual(
+            [c.slug for c in category_tree.get_categories()],
+            ["animals", "food", "drink", "ale", "wine"],
+        )
+
+    def test_get_categories_fields(self):
+        category = category_tree.get_categories()[3]
+        self.assertEqual(category, self.ale)
+        self.assertEqual(category.title, "Ale")
+        self.assertEqual(category.depth, 3)
+        self.assertEqual(category.topic_count, 0)
+
+    def test_get_slug_path(self):
+        self.assertEqual(category_tree.get_slug_path(self.ale), "food/drink/ale")
+
+    def test_get_slug_path_root(self):
+        self.assertEqual(category_tree.get_slug_path(self.food), "food")
+
+    def test_get_ancestors(self):
+        self.assertEqual(category_tree.get_ancestors(self.ale), [self.food, self.drink])
+
+    def test_get_ancestors_root(self):
+        self.assertEqual(category_tree.get_ancestors(self.food), [])
+
+    def test_get_children(self):
+        self.assertEqual(category_tree.get_children(self.drink), [self.ale, self.wine])
+
+    def test_get_children_none(self):
+        self.assertEqual(category_tree.get_children(self.wine), [])
+
+    def test_get_annotated_list(self):
+        "It should be the same as treebeard's version"
+        self.assertEqual(
+            category_tree.get_annotated_list(), Category.get_annotated_list()
+        )
+
+    def test_uses_no_queries_once_built(self):
+        category_tree.get_categories()
+        with self.assertNumQueries(0):
+            self.ale.get_absolute_url()
+            category_tree.get_children(self.drink)
+            category_tree.get_ancestors(self.wine)
+
+    def test_rebuilt_after_save(self):
+        category_tree.get_categories()
+        beer = self.drink.add_child(title="Beer", slug="beer")
+        self.drink.refresh_from_db()
+        self.assertEqual(
+            category_tree.get_children(self.drink), [self.ale, beer, self.wine]
+        )
+
+    def test_rebuilt_after_delete(self):
+        category_tree.get_categories()
+        self.wine.delete()
+        self.assertEqual(category_tree.get_children(self.drink), [self.ale])
+
+    def test_rebuilt_after_move(self):
+        category_tree.get_categories()
+        self.wine.move(self.animals, "sorted-child")
+        self.wine.refresh_from_db()
+        self.assertEqual(category_tree.get_slug_path(self.wine), "animals/wine")
@@ -1,10 +1,17 @@
+import shutil
+import tempfile
 from io import StringIO
+from pathlib import Path
 from unittest.mock import patch
 
 from django.core.management import call_command
 from django.core.management.base import CommandError
 from django.test import TestCase
 
+from pepysdiary.diary.factories import EntryFactory
+from pepysdiary.encyclopedia.factories import TopicFactory
+from pepysdiary.letters.factories import LetterFactory
+
 
 class FetchWikipediaTest(TestCase):
     """
@@ -23,22 +30,33 @@ class FetchWikipediaTest(TestCase):
     @patch("pepysdiary.encyclopedia.models.TopicManager.fetch_wikipedia_texts")
     def test_with_single_topic_id(self, fetch_method):
         call_command("fetch_wikipedia", ids=[112], stdout=StringIO())
-        fetch_method.assert_called_with(topic_ids=[112])
+        fetch_method.assert_called_with(topic_ids=[112], only_changed=False)
 
     @patch("pepysdiary.encyclopedia.models.TopicManager.fetch_wikipedia_texts")
     def test_with_multiple_topic_ids(self, fetch_method):
         call_command("fetch_wikipedia", ids=[112, 344, 6079], stdout=StringIO())
-        fetch_method.assert_called_with(topic_ids=[112, 344, 6079])
+        fetch_method.assert_called_with(topic_ids=[112, 344, 6079], only_changed=False)
 
     @patch("pepysdiary.encyclopedia.models.TopicManager.fetch_wikipedia_texts")
     def test_with_all(self, fetch_method):
         call_command("fetch_wikipedia", all=True, stdout=StringIO())
-        fetch_method.assert_called_with(num="all")
+        fetch_method.assert_called_with(num="all", only_changed=False)
 
     @patch("pepysdiary.encyclopedia.models.TopicManager.fetch_wikipedia_texts")
     def test_with_num(self, fetch_method):
         call_command("fetch_wikipedia", num=30, stdout=StringIO())
-        fetch_method.assert_called_with(num=30)
+        fetch_method.assert_called_with(num=30, only_changed=False)
+
+    @patch("pepysdiary.encyclopedia.models.TopicManager.fetch_wikipedia_texts")
+    def test_with_changed(self, fetch_method):
+        fetch_method.side_effect = [
+            {"success": [112], "failure": [], "unchanged": [150, 344]}
+        ]
+        out = StringIO()
+        call_command("fetch_wikipedia", num=30, changed=True, stdout=out)
+        fetch_method.assert_called_with(num=30, only_changed=True)
+        self.assertIn("Successfully fetched 1 topic(s)", out.getvalue())
+        self.assertIn("2 topic(s) were unchanged", out.getvalue())
 
     @patch("pepysdiary.encyclopedia.models.TopicManager.fetch_wikipedia_texts")
     def test_with_default_verbosity(self, fetch_method):
@@ -75,3 +93,164 @@ class FetchWikipediaTest(TestCase):
             "Tried and failed to fetch texts for 1 topic(s)", out_err.getvalue()
         )
         self.assertIn("IDs: 344", out_err.getvalue())
+
+
+class BenchmarkWikipediaTidyTest(TestCase):
+    def setUp(self):
+        self.directory = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_benchmarks(self):
+        shutil.copy(
+            "tests/encyclopedia/fixtures/wikipedia_render.html",
+            self.directory / "1.html",
+        )
+        (self.directory / "2.html").write_text("<div><p>Hello</p></div>")
+        out = StringIO()
+        call_command(
+            "benchmark_wikipedia_tidy",
+            str(self.directory),
+            repeat=1,
+            verbosity=2,
+            stdout=out,
+        )
+        output = out.getvalue()
+        self.assertIn("2 page(s)", output)
+        self.assertIn("Two-pass (legacy): ", output)
+        self.assertIn("Single-pass: ", output)
+        self.assertIn(
+            "Output: 1 identical, 1 different only in whitespace, 0 different", output
+        )
+        self.assertIn("Different only in whitespace: 1.html", output)
+
+    @patch("pepysdiary.encyclopedia.wikipedia_fetcher.WikipediaFetcher.fetch")
+    def test_download(self, fetch_method):
+        fetch_method.return_value = {"success": True, "content": "<p>Hello</p>"}
+        topic = TopicFactory(wikipedia_fragment="Samuel_Pepys")
+        TopicFactory(wikipedia_fragment="")
+        call_command(
+            "benchmark_wikipedia_tidy",
+            str(self.directory / "pages"),
+            download=10,
+            stdout=StringIO(),
+        )
+        fetch_method.assert_called_once_with("Samuel_Pepys", tidy=False)
+        self.assertEqual(
+            (self.directory / "pages" / f"{topic.pk}.html").read_text(), "<p>Hello</p>"
+        )
+
+    def test_no_pages(self):
+        with self.assertRaises(CommandError):
+            call_command("benchmark_wikipedia_tidy", str(self.directory))
+
+    def test_invalid_repeat(self):
+        with self.assertRaises(CommandError):
+            call_command("benchmark_wikipedia_tidy", str(self.directory), repeat=0)
+
+
+class RebuildReferencesTest(TestCase):
+    def _link(self, topic):
+        return f'<a href="https://www.pepysdiary.com/encyclopedia/{topic.pk}/">x</a>'
+
+    def test_rebuilds_entry_references(self):
+        "It should add missing references and remove incorrect ones"
+        topic_1 = TopicFactory()
+        topic_2 = TopicFactory()
+        entry = EntryFactory(text=f"<p>{self._link(topic_1)}</p>")
+
+        # Make the references incorrect:
+        topic_1.diary_references.remove(entry)
+        topic_2.diary_references.add(entry)
+
+        call_command("rebuild_references", stdout=StringIO())
+
+        self.assertEqual(list(entry.topics.all()), [topic_1])
+
+    def test_expires_changed_topics_cache_tags(self):
+        "It should expire the cached views of Topics whose references changed"
+        topic_1 = TopicFactory()
+        topic_2 = TopicFactory()
+        topic_3 = TopicFactory()
+        entry = EntryFactory(text=f"<p>{self._link(topic_1)} {self._link(topic_3)}</p>")
+        topic_1.diary_references.remove(entry)
+        topic_2.diary_references.add(entry)
+
+        with patch(
+            "pepysdiary.encyclopedia.management.commands.rebuild_references"
+            ".invalidate_cache_tags"
+        ) as invalidate:
+            call_command("rebuild_references", models=["entry"], stdout=StringIO())
+
+        invalidate.assert_called_once_with(
+            {
+                f"encyclopedia.topic:{topic_1.pk}",
+                f"encyclopedia.topic:{topic_1.pk}:references",
+                f"encyclopedia.topic:{topic_2.pk}",
+                f"encyclopedia.topic:{topic_2.pk}:references",
+            }
+        )
+
+    def test_rebuilds_letter_references(self):
+        "It should add missing references and remove incorrect ones"
+        topic_1 = TopicFactory()
+        topic_2 = TopicFactory()
+        letter = LetterFactory(footnotes=f"<p>{self._link(topic_1)}</p>")
+
+        topic_1.letter_references.remove(letter)
+        topic_2.letter_references.add(letter)
+
+        call_command("rebuild_references", models=["letter"], stdout=StringIO())
+
+        self.assertEqual(list(letter.topics.all()), [topic_1])
+
+    def test_batches(self):
+        "It should process all objects when there are several batches"
+        topic = TopicFactory()
+        entries = [EntryFactory(text=self._link(topic)) for _ in range(3)]
+        topic.diary_references.clear()
+
+        out = StringIO()
+        call_command(
+            "rebuild_references",
+            models=["entry"],
+            batch_size=2,
+            verbosity=2,
+            stdout=out,
+        )
+
+        self.assertEqual(topic.diary_references.count(), len(entries))
+        self.assertIn("Entries: processed 2", out.getvalue())
+        self.assertIn("Entries: added 3 and removed 0 reference(s)", out.getvalue())
+
+    def test_invalid_model(self):
+        with self.assertRaises(CommandError):
+            call_command("rebuild_references", models=["topic"])
+
+
+class BuildRelatedTopicsTest(TestCase):
+    """
+    Tests for the management command that calls the
+    TopicManager.build_related_topics() method. That method isn't tested here.
+    """
+
+    @patch("pepysdiary.encyclopedia.models.TopicManager.build_related_topics")
+    def test_defaults(self, build_method):
+        build_method.return_value = 12
+        out = StringIO()
+        call_command("build_related_topics", stdout=out)
+        build_method.assert_called_once_with(num=10, min_entries=2)
+        self.assertIn("Saved 12 related topic(s)", out.getvalue())
+
+    @patch("pepysdiary.encyclopedia.models.TopicManager.build_related_topics")
+    def test_with_args(self, build_method):
+        build_method.return_value = 0
+        call_command("build_related_topics", num=5, min_entries=3, stdout=StringIO())
+        build_method.assert_called_once_with(num=5, min_entries=3)
+
+    def test_invalid_num(self):
+        with self.assertRaises(CommandError):
+            call_command("build_related_topics", num=0)
+
+    def test_invalid_min_entries(self):
+        with self.assertRaises(CommandError):
+            call_command("build_related_topics", min_entries=0)
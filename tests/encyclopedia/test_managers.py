@@ -1,8 +1,20 @@
+import math
 from unittest.mock import call, patch
 
-from django.test import TestCase
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from freezegun import freeze_time
 
-from pepysdiary.encyclopedia.models import Category, Topic
+from pepysdiary.common.utilities import make_date, make_datetime
+from pepysdiary.diary.factories import EntryFactory
+from pepysdiary.encyclopedia import category_lookups
+from pepysdiary.encyclopedia.factories import TopicFactory
+from pepysdiary.encyclopedia.models import Category, RelatedTopic, Topic
+from pepysdiary.encyclopedia.wikipedia_fetcher import WikipediaFetcher
+from tests.common.test_caching import LOCMEM_CACHES
+from tests.encyclopedia.test_wikipedia_fetcher import StubWikipediaServerMixin
 
 
 class CategoryManagerTestCase(TestCase):
@@ -29,6 +41,82 @@ class TopicManagerTestCase(TestCase):
         self.assertEqual(Topic.objects.pepys_homes_ids(), [102, 1023])
 
 
+class TopicManagerLargeFieldsTestCase(TestCase):
+    def test_defers_large_fields(self):
+        topic = TopicFactory()
+        topic = Topic.objects.get(pk=topic.pk)
+        self.assertEqual(
+            topic.get_deferred_fields(),
+            {
+                "summary_html",
+                "wheatley_html",
+                "wikipedia_html",
+                "shape",
+                "search_document",
+            },
+        )
+
+    def test_saves_deferred_topic(self):
+        "Saving a Topic loaded without its large fields shouldn't lose them"
+        topic = TopicFactory(wheatley="Hello", shape="1,2;3,4")
+        topic = Topic.objects.get(pk=topic.pk)
+        topic.title = "New title"
+        topic.save()
+        topic = Topic.objects.with_large_fields().get(pk=topic.pk)
+        self.assertEqual(topic.title, "New title")
+        self.assertEqual(topic.wheatley_html, "<p>Hello</p>")
+        self.assertEqual(topic.shape, "1,2;3,4")
+
+
+class TopicManagerWithKindsTestCase(TestCase):
+    def setUp(self):
+        # PEOPLE and PLACES need explicit ids, so all Categories here have
+        # them, in case ids assigned by the database would collide.
+        self.people = Category.add_root(
+            id=category_lookups.PEOPLE, title="People", slug="people"
+        )
+        self.places = Category.add_root(
+            id=category_lookups.PLACES, title="Places", slug="places"
+        )
+        self.animals = Category.add_root(id=10001, title="Animals", slug="animals")
+
+    def get_kind(self, topic):
+        return Topic.objects.with_kinds().get(pk=topic.pk).kind
+
+    def test_person(self):
+        topic = TopicFactory(categories=[self.people])
+        self.assertEqual(self.get_kind(topic), Topic.Kind.PERSON)
+
+    def test_place(self):
+        topic = TopicFactory(categories=[self.places])
+        self.assertEqual(self.get_kind(topic), Topic.Kind.PLACE)
+
+    def test_place_in_sub_category(self):
+        places = Category.objects.get(pk=category_lookups.PLACES)
+        london = places.add_child(id=10002, title="London", slug="london")
+        streets = london.add_child(id=10003, title="Streets", slug="streets")
+        topic = TopicFactory(categories=[streets])
+        self.assertEqual(self.get_kind(topic), Topic.Kind.PLACE)
+
+    def test_default(self):
+        topic = TopicFactory(categories=[self.animals])
+        self.assertEqual(self.get_kind(topic), Topic.Kind.DEFAULT)
+
+    def test_no_categories(self):
+        topic = TopicFactory()
+        self.assertEqual(self.get_kind(topic), Topic.Kind.DEFAULT)
+
+    def test_person_and_place(self):
+        "Being a Person wins, as with Topic.get_kind()"
+        topic = TopicFactory(categories=[self.places, self.people])
+        self.assertEqual(self.get_kind(topic), Topic.Kind.PERSON)
+
+    def test_same_as_get_kind(self):
+        for categories in ([self.people], [self.places], [self.animals]):
+            topic = TopicFactory(categories=categories)
+            self.assertEqual(self.get_kind(topic), topic.get_kind())
+
+
 class TopicManagerFetchWikipediaTextsTestCase(TestCase):
     "Testing TopicManager.fetch_wikipedia_texts()"
 
@@ -52,16 +140,28 @@ class TopicManagerFetchWikipediaTextsTestCase(TestCase):
         {"success": True, "content": "9711 html"},
     ]
 
+    def make_fetch(self, responses=None):
+        """
+        Returns a function for the mocked fetch() to use as its side_effect.
+        Pages are fetched in several threads, so the order in which they're
+        fetched varies, so we return the response for each page name, rather
+        than successive responses.
+        """
+        if responses is None:
+            responses = self.responses
+        page_responses = dict(zip(self.page_names, responses, strict=True))
+        return lambda page_name: page_responses[page_name]
+
     @patch("pepysdiary.encyclopedia.wikipedia_fetcher.WikipediaFetcher.fetch")
     def test_it_calls_fetcher_with_ids(self, fetch_method):
-        # What the mocked method will return on successive calls:
-        fetch_method.side_effect = self.responses
+        fetch_method.side_effect = self.make_fetch()
         # 2 names with Wikipedia pages, 1 without, 1 invalid ID:
         updated = Topic.objects.fetch_wikipedia_texts(
             topic_ids=[112, 344, 6079, 9999999]
         )
         calls = [call(self.page_names[0]), call(self.page_names[2])]
         fetch_method.assert_has_calls(calls, any_order=True)
+        self.assertEqual(fetch_method.call_count, 2)
         self.assertEqual(len(updated["success"]), 2)
         self.assertEqual(len(updated["failure"]), 0)
 
@@ -70,7 +170,7 @@ class TopicManagerFetchWikipediaTextsTestCase(TestCase):
         # Ensure we get notified if one of these fails:
         responses = list(self.responses)
         responses[0] = {"success": False}
-        fetch_method.side_effect = responses
+        fetch_method.side_effect = self.make_fetch(responses)
         updated = Topic.objects.fetch_wikipedia_texts(num="all")
         calls = [
             call(self.page_names[0]),
@@ -82,14 +182,11 @@ class TopicManagerFetchWikipediaTextsTestCase(TestCase):
         fetch_method.assert_has_calls(calls, any_order=True)
         self.assertEqual(len(updated["success"]), 4)
         self.assertEqual(len(updated["failure"]), 1)
+        self.assertEqual(updated["failure"], [112])
 
     @patch("pepysdiary.encyclopedia.wikipedia_fetcher.WikipediaFetcher.fetch")
     def test_it_calls_fetcher_with_num(self, fetch_method):
-        fetch_method.side_effect = [
-            self.responses[4],
-            self.responses[2],
-            self.responses[1],
-        ]
+        fetch_method.side_effect = self.make_fetch()
         updated = Topic.objects.fetch_wikipedia_texts(num=3)
         calls = [
             call(self.page_names[4]),  # Has null wikipedia_last_fetch
@@ -97,15 +194,13 @@ class TopicManagerFetchWikipediaTextsTestCase(TestCase):
             call(self.page_names[1]),  #
         ]
         fetch_method.assert_has_calls(calls, any_order=True)
+        self.assertEqual(fetch_method.call_count, 3)
         self.assertEqual(len(updated["success"]), 3)
         self.assertEqual(len(updated["failure"]), 0)
 
     @patch("pepysdiary.encyclopedia.wikipedia_fetcher.WikipediaFetcher.fetch")
     def test_it_saves_returned_texts(self, fetch_method):
-        fetch_method.side_effect = [
-            self.responses[0],
-            self.responses[2],
-        ]
+        fetch_method.side_effect = self.make_fetch()
         updated = Topic.objects.fetch_wikipedia_texts(
             topic_ids=[112, 344, 6079, 9999999]
         )
@@ -114,6 +209,35 @@ class TopicManagerFetchWikipediaTextsTestCase(TestCase):
         self.assertEqual(Topic.objects.get(pk=112).wikipedia_html, "112 html")
         self.assertEqual(Topic.objects.get(pk=344).wikipedia_html, "344 html")
 
+    @patch("pepysdiary.encyclopedia.wikipedia_fetcher.WikipediaFetcher.fetch")
+    def test_it_sets_last_fetch_and_modified_times(self, fetch_method):
+        fetch_method.side_effect = self.make_fetch()
+        with freeze_time("2026-01-02 03:04:05", tz_offset=0):
+            Topic.objects.fetch_wikipedia_texts(topic_ids=[112])
+        topic = Topic.objects.get(pk=112)
+        when = make_datetime("2026-01-02 03:04:05")
+        self.assertEqual(topic.wikipedia_last_fetch, when)
+        self.assertEqual(topic.date_modified, when)
+
+    @patch("pepysdiary.encyclopedia.wikipedia_fetcher.WikipediaFetcher.fetch")
+    def test_it_saves_in_batches(self, fetch_method):
+        fetch_method.side_effect = self.make_fetch()
+        save = Topic.objects._save_wikipedia_texts
+        with (
+            patch.object(Topic.objects, "wikipedia_batch_size", 2),
+            patch.object(Topic.objects, "_save_wikipedia_texts", wraps=save) as mock,
+        ):
+            Topic.objects.fetch_wikipedia_texts(num="all")
+        # 2, 2, then 1:
+        self.assertEqual([len(c.args[0]) for c in mock.call_args_list], [2, 2, 1])
+
+    @patch("pepysdiary.encyclopedia.wikipedia_fetcher.WikipediaFetcher.fetch")
+    def test_it_counts_exceptions_as_failures(self, fetch_method):
+        fetch_method.side_effect = ValueError("Oops")
+        with self.assertLogs("pepysdiary.encyclopedia.managers", "ERROR"):
+            updated = Topic.objects.fetch_wikipedia_texts(topic_ids=[112])
+        self.assertEqual(updated, {"success": [], "failure": [112], "unchanged": []})
+
     @patch("pepysdiary.encyclopedia.wikipedia_fetcher.WikipediaFetcher.fetch")
     def test_no_topics(self, fetch_method):
         "If there are no matching topics to fetch, it doesn't"
@@ -123,6 +247,292 @@ class TopicManagerFetchWikipediaTextsTestCase(TestCase):
         self.assertEqual(len(updated["failure"]), 0)
 
 
+class TopicManagerFetchChangedWikipediaTextsTestCase(
+    StubWikipediaServerMixin, TestCase
+):
+    """
+    Testing TopicManager.fetch_wikipedia_texts() with only_changed=True,
+    using a local stand-in for Wikipedia and its API.
+    """
+
+    fixtures = ["tests/encyclopedia/fixtures/wikipedia_test.json"]
+
+    def setUp(self):
+        self.start_stub_server()
+        self.server.revision_ids = {
+            "Edward Montagu, 1st Earl of Sandwich": 1001,
+            "Elisabeth Pepys": 1002,
+            "Charles II of England": 1003,
+            "Zeeland": 1004,
+            "Christopher Wren": 1005,
+        }
+        patcher = patch.object(WikipediaFetcher, "base_url", self.base_url)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_fetches_all_the_first_time(self):
+        updated = Topic.objects.fetch_wikipedia_texts(num="all", only_changed=True)
+        self.assertEqual(updated["success"], [112, 150, 344, 480, 9711])
+        self.assertEqual(updated["unchanged"], [])
+        topic = Topic.objects.get(pk=150)
+        self.assertEqual(topic.wikipedia_html, "<p>Elisabeth_Pepys</p>")
+        self.assertEqual(topic.wikipedia_revision_id, 1002)
+        # All the revision IDs in one request:
+        self.assertEqual(len(self.server.api_requests), 1)
+
+    def test_only_fetches_changed_pages(self):
+        Topic.objects.fetch_wikipedia_texts(num="all", only_changed=True)
+        self.server.requests.clear()
+        self.server.revision_ids["Zeeland"] = 2004
+
+        updated = Topic.objects.fetch_wikipedia_texts(num="all", only_changed=True)
+
+        self.assertEqual(self.server.requests, ["Zeeland"])
+        self.assertEqual(updated["success"], [480])
+        self.assertEqual(updated["unchanged"], [112, 150, 344, 9711])
+        self.assertEqual(Topic.objects.get(pk=480).wikipedia_revision_id, 2004)
+
+    def test_unchanged_topics(self):
+        "It updates their last fetch time but nothing else"
+        Topic.objects.filter(pk=150).update(
+            wikipedia_html="Old html", wikipedia_revision_id=1002
+        )
+        date_modified = Topic.objects.get(pk=150).date_modified
+
+        with freeze_time("2026-01-02 03:04:05", tz_offset=0):
+            updated = Topic.objects.fetch_wikipedia_texts(
+                topic_ids=[150], only_changed=True
+            )
+
+        self.assertEqual(updated, {"success": [], "failure": [], "unchanged": [150]})
+        self.assertEqual(self.server.requests, [])
+        topic = Topic.objects.get(pk=150)
+        when = make_datetime("2026-01-02 03:04:05")
+        self.assertEqual(topic.wikipedia_last_fetch, when)
+        self.assertEqual(topic.wikipedia_html, "Old html")
+        self.assertEqual(topic.date_modified, date_modified)
+
+    def test_fetches_unknown_pages(self):
+        "If the API doesn't know a page's revision, we still try to fetch it"
+        del self.server.revision_ids["Elisabeth Pepys"]
+        Topic.objects.filter(pk=150).update(wikipedia_revision_id=1002)
+        updated = Topic.objects.fetch_wikipedia_texts(
+            topic_ids=[150], only_changed=True
+        )
+        self.assertEqual(updated["success"], [150])
+        self.assertEqual(Topic.objects.get(pk=150).wikipedia_revision_id, 1002)
+
+    def test_fetches_all_if_api_fails(self):
+        self.server.api_statuses = [404]
+        Topic.objects.filter(pk=150).update(wikipedia_revision_id=1002)
+        with self.assertLogs("pepysdiary.encyclopedia.wikipedia_fetcher", "WARNING"):
+            updated = Topic.objects.fetch_wikipedia_texts(
+                topic_ids=[112, 150], only_changed=True
+            )
+        self.assertEqual(updated["success"], [112, 150])
+        self.assertEqual(Topic.objects.get(pk=150).wikipedia_revision_id, 1002)
+
+    def test_not_only_changed(self):
+        "It doesn't use the API and keeps any revision IDs"
+        Topic.objects.filter(pk=150).update(wikipedia_revision_id=1002)
+        updated = Topic.objects.fetch_wikipedia_texts(topic_ids=[150])
+        self.assertEqual(updated["success"], [150])
+        self.assertEqual(self.server.api_requests, [])
+        self.assertEqual(Topic.objects.get(pk=150).wikipedia_revision_id, 1002)
+
+    def test_changed_after_not_only_changed(self):
+        "A page fetched without only_changed is fetched if it's changed since"
+        Topic.objects.filter(pk=150).update(wikipedia_revision_id=1002)
+        self.server.revision_ids["Elisabeth Pepys"] = 2002
+        Topic.objects.fetch_wikipedia_texts(topic_ids=[150])
+        self.server.requests.clear()
+
+        updated = Topic.objects.fetch_wikipedia_texts(
+            topic_ids=[150], only_changed=True
+        )
+
+        self.assertEqual(self.server.requests, ["Elisabeth_Pepys"])
+        self.assertEqual(updated["success"], [150])
+        self.assertEqual(Topic.objects.get(pk=150).wikipedia_revision_id, 2002)
+
+
+@freeze_time("2026-10-18 12:00:00", tz_offset=0)
+class TopicManagerBuildRelatedTopicsTestCase(TestCase):
+    "Testing TopicManager.build_related_topics()"
+
+    def setUp(self):
+        entry_1 = EntryFactory(diary_date=make_date("1660-01-01"))
+        entry_2 = EntryFactory(diary_date=make_date("1660-01-02"))
+        entry_3 = EntryFactory(diary_date=make_date("1660-01-03"))
+        entry_4 = EntryFactory(diary_date=make_date("1660-01-04"))
+        # Topic A shares two Entries with each of B and C, and one with D.
+        # B and C share one Entry.
+        self.topic_a = TopicFactory(
+            diary_references=[entry_1, entry_2, entry_3, entry_4]
+        )
+        self.topic_b = TopicFactory(diary_references=[entry_1, entry_2])
+        self.topic_c = TopicFactory(diary_references=[entry_1, entry_3])
+        self.topic_d = TopicFactory(diary_references=[entry_4])
+
+    def test_related_topics(self):
+        count = Topic.objects.build_related_topics()
+        self.assertEqual(count, 4)
+        self.assertEqual(
+            self.topic_a.get_related_topics(), [self.topic_b, self.topic_c]
+        )
+        self.assertEqual(self.topic_b.get_related_topics(), [self.topic_a])
+        self.assertEqual(self.topic_c.get_related_topics(), [self.topic_a])
+        self.assertEqual(self.topic_d.get_related_topics(), [])
+
+    def test_scores(self):
+        Topic.objects.build_related_topics()
+        related_topic = self.topic_a.get_related_topics()[0]
+        self.assertEqual(related_topic.shared_entry_count, 2)
+        # Entry 1 refers to three Topics, entry 2 to two. A has four
+        # references, B has two.
+        self.assertAlmostEqual(
+            related_topic.related_score, (1 / 2 + 1 / math.log2(3)) / math.sqrt(8)
+        )
+
+    def test_num(self):
+        count = Topic.objects.build_related_topics(num=1)
+        self.assertEqual(count, 3)
+        self.assertEqual(self.topic_a.get_related_topics(), [self.topic_b])
+
+    def test_min_entries(self):
+        Topic.objects.build_related_topics(min_entries=1)
+        self.assertEqual(
+            self.topic_a.get_related_topics(),
+            [self.topic_b, self.topic_c, self.topic_d],
+        )
+        self.assertEqual(
+            self.topic_b.get_related_topics(), [self.topic_a, self.topic_c]
+        )
+
+    def test_ignores_unpublished_entries(self):
+        "Entries after 'today' (1663-10-17) shouldn't count"
+        entry = EntryFactory(diary_date=make_date("1663-10-18"))
+        self.topic_b.diary_references.add(entry)
+        self.topic_c.diary_references.add(entry)
+        Topic.objects.build_related_topics()
+        self.assertEqual(self.topic_b.get_related_topics(), [self.topic_a])
+
+    def test_replaces_existing(self):
+        Topic.objects.build_related_topics(min_entries=1)
+        Topic.objects.build_related_topics()
+        self.assertEqual(RelatedTopic.objects.count(), 4)
+
+    def test_uses_few_queries(self):
+        "The number of queries shouldn't depend on the number of Topics"
+        with CaptureQueriesContext(connection) as context:
+            Topic.objects.build_related_topics()
+        TopicFactory(diary_references=self.topic_a.diary_references.all())
+        with self.assertNumQueries(len(context.captured_queries)):
+            Topic.objects.build_related_topics()
+
+    def test_deletes_existing_in_one_query(self):
+        "The old RelatedTopics shouldn't be fetched before they're deleted"
+        Topic.objects.build_related_topics(min_entries=1)
+        with CaptureQueriesContext(connection) as context:
+            Topic.objects.build_related_topics()
+        table = RelatedTopic._meta.db_table
+        self.assertEqual(
+            [
+                query["sql"].split()[0]
+                for query in context.captured_queries
+                if table in query["sql"]
+            ],
+            ["SELECT", "DELETE", "INSERT"],
+        )
+
+    @patch("pepysdiary.encyclopedia.managers.invalidate_cache_tags")
+    def test_expires_changed_topics_cache_tags(self, invalidate):
+        Topic.objects.build_related_topics()
+        invalidate.assert_called_once_with(
+            {
+                f"encyclopedia.topic:{self.topic_a.pk}",
+                f"encyclopedia.topic:{self.topic_b.pk}",
+                f"encyclopedia.topic:{self.topic_c.pk}",
+            }
+        )
+
+        invalidate.reset_mock()
+        Topic.objects.build_related_topics()
+        invalidate.assert_called_once_with(set())
+
+        invalidate.reset_mock()
+        Topic.objects.build_related_topics(min_entries=1)
+        invalidate.assert_called_once_with(
+            {
+                f"encyclopedia.topic:{self.topic_a.pk}",
+                f"encyclopedia.topic:{self.topic_b.pk}",
+                f"encyclopedia.topic:{self.topic_c.pk}",
+                f"encyclopedia.topic:{self.topic_d.pk}",
+            }
+        )
+
+    @patch("pepysdiary.encyclopedia.managers.invalidate_cache_tags")
+    def test_doesnt_expire_unchanged_ties(self, invalidate):
+        "B and C are equally related to A; their alphabetical order shouldn't matter"
+        Topic.objects.filter(pk=self.topic_b.pk).update(order_title="zebras")
+        Topic.objects.filter(pk=self.topic_c.pk).update(order_title="aardvarks")
+        Topic.objects.build_related_topics()
+        invalidate.reset_mock()
+        Topic.objects.build_related_topics()
+        invalidate.assert_called_once_with(set())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TopicManagerGetTooltipDataTestCase(TestCase):
+    "Testing TopicManager.get_tooltip_data()"
+
+    def setUp(self):
+        cache.clear()
+        self.topic_1 = TopicFactory(title="Cats", tooltip_text="About cats")
+        self.topic_2 = TopicFactory(title="Dogs", tooltip_text="")
+
+    def test_data(self):
+        self.assertEqual(
+            Topic.objects.get_tooltip_data([self.topic_1.pk, self.topic_2.pk]),
+            {
+                str(self.topic_1.pk): {
+                    "title": "Cats",
+                    "text": "About cats",
+                    "thumbnail_url": "",
+                },
+                str(self.topic_2.pk): {
+                    "title": "Dogs",
+                    "text": "",
+                    "thumbnail_url": "",
+                },
+            },
+        )
+
+    def test_no_topics(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(Topic.objects.get_tooltip_data([]), {})
+
+    def test_missing_topic(self):
+        data = Topic.objects.get_tooltip_data([self.topic_1.pk, self.topic_2.pk + 1])
+        self.assertEqual(list(data.keys()), [str(self.topic_1.pk)])
+
+    def test_is_cached(self):
+        Topic.objects.get_tooltip_data([self.topic_1.pk])
+        with self.assertNumQueries(1):
+            # Only fetches the Topic that wasn't cached:
+            Topic.objects.get_tooltip_data([self.topic_1.pk, self.topic_2.pk])
+        with self.assertNumQueries(0):
+            Topic.objects.get_tooltip_data([self.topic_1.pk, self.topic_2.pk])
+
+    def test_changes_when_topic_saved(self):
+        Topic.objects.get_tooltip_data([self.topic_1.pk])
+        self.topic_1.tooltip_text = "All about cats"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.topic_1.save()
+        data = Topic.objects.get_tooltip_data([self.topic_1.pk])
+        self.assertEqual(data[str(self.topic_1.pk)]["text"], "All about cats")
+
+
 class TopicManagerMakeOrderTitleTestCase(TestCase):
     "Testing TopicManager.make_order_title()"
 
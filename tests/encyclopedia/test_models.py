@@ -1,6 +1,8 @@
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import TestCase, override_settings
 from django_comments.moderation import AlreadyModerated, moderator
 
+from pepysdiary.annotations.factories import TopicAnnotationFactory
 from pepysdiary.common.utilities import make_date
 from pepysdiary.diary.factories import EntryFactory
 from pepysdiary.encyclopedia import category_lookups
@@ -12,6 +14,7 @@ from pepysdiary.encyclopedia.factories import (
 )
 from pepysdiary.encyclopedia.models import Category, Topic, TopicModerator
 from pepysdiary.letters.factories import LetterFactory
+from tests.common.test_caching import LOCMEM_CACHES
 
 
 class CategoryTestCase(TestCase):
@@ -271,6 +274,113 @@ class TopicTestCase(TestCase):
         self.assertFalse(topic.is_place)
 
 
+@override_settings(CACHES=LOCMEM_CACHES)
+class TopicDiaryReferencesTimelineTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.entry_1 = EntryFactory(diary_date=make_date("1661-01-01"), title="One")
+        self.entry_2 = EntryFactory(diary_date=make_date("1661-01-05"), title="Two")
+        self.entry_3 = EntryFactory(diary_date=make_date("1662-03-04"), title="Three")
+        # Shouldn't be included:
+        EntryFactory(diary_date=make_date("1663-01-01"))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.topic = TopicFactory(
+                diary_references=[self.entry_1, self.entry_2, self.entry_3]
+            )
+
+    def test_timeline(self):
+        self.assertEqual(
+            self.topic.get_diary_references_timeline(),
+            [
+                {
+                    "year": "1661",
+                    "count": 2,
+                    "months": [
+                        {
+                            "month": "Jan",
+                            "count": 2,
+                            "references": [
+                                (self.entry_1.pk, make_date("1661-01-01"), "One"),
+                                (self.entry_2.pk, make_date("1661-01-05"), "Two"),
+                            ],
+                        }
+                    ],
+                },
+                {
+                    "year": "1662",
+                    "count": 1,
+                    "months": [
+                        {
+                            "month": "Mar",
+                            "count": 1,
+                            "references": [
+                                (self.entry_3.pk, make_date("1662-03-04"), "Three"),
+                            ],
+                        }
+                    ],
+                },
+            ],
+        )
+
+    def test_timeline_none(self):
+        self.assertEqual(TopicFactory().get_diary_references_timeline(), [])
+
+    def test_timeline_is_cached(self):
+        self.topic.get_diary_references_timeline()
+        with self.assertNumQueries(0):
+            self.topic.get_diary_references_timeline()
+            self.topic.get_annotated_diary_references()
+            self.topic.get_brief_diary_references()
+
+    def test_timeline_changes_when_references_added(self):
+        self.topic.get_diary_references_timeline()
+        entry = EntryFactory(diary_date=make_date("1662-03-05"))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.topic.diary_references.add(entry)
+        timeline = self.topic.get_diary_references_timeline()
+        self.assertEqual(timeline[1]["count"], 2)
+        self.assertEqual(timeline[1]["months"][0]["count"], 2)
+
+    def test_timeline_changes_when_entry_references_removed(self):
+        self.topic.get_diary_references_timeline()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.entry_3.topics.remove(self.topic)
+        self.assertEqual(len(self.topic.get_diary_references_timeline()), 1)
+
+    def test_timeline_changes_when_entry_saved(self):
+        self.topic.get_diary_references_timeline()
+        self.entry_1.title = "New title"
+        # Or saving would remove the reference to the Topic:
+        self.entry_1.text = (
+            f'<a href="https://www.pepysdiary.com/encyclopedia/{self.topic.pk}/">a</a>'
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.entry_1.save()
+        timeline = self.topic.get_diary_references_timeline()
+        self.assertEqual(timeline[0]["months"][0]["references"][0][2], "New title")
+
+    def test_timeline_changes_when_entry_deleted(self):
+        self.topic.get_diary_references_timeline()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.entry_3.delete()
+        self.assertEqual(len(self.topic.get_diary_references_timeline()), 1)
+
+    def test_timeline_unchanged_when_topic_commented_on(self):
+        "Comments on the Topic don't change its references"
+        self.topic.get_diary_references_timeline()
+        with self.captureOnCommitCallbacks(execute=True):
+            TopicAnnotationFactory(content_object=self.topic)
+        with self.assertNumQueries(0):
+            self.topic.get_diary_references_timeline()
+
+    def test_get_brief_diary_references(self):
+        entries = self.topic.get_brief_diary_references()
+        self.assertEqual(entries, [self.entry_1, self.entry_2, self.entry_3])
+        self.assertEqual(entries[1].title, "Two")
+        self.assertEqual(entries[1].diary_date, make_date("1661-01-05"))
+        self.assertEqual(entries[1].get_absolute_url(), "/diary/1661/01/05/")
+
+
 class TopicModeratorTestCase(TestCase):
     def test_it_is_registered(self):
         # Shouldn't be able to register it again:
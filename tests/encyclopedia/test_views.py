@@ -6,7 +6,7 @@ from pepysdiary.common.utilities import make_date
 from pepysdiary.diary.factories import EntryFactory
 from pepysdiary.encyclopedia import views
 from pepysdiary.encyclopedia.factories import TopicFactory
-from pepysdiary.encyclopedia.models import Category
+from pepysdiary.encyclopedia.models import Category, RelatedTopic
 from tests import ViewTestCase
 
 DEFAULT_MAP_CATEGORY_ID = 28
@@ -146,6 +146,14 @@ class TopicDetailViewTestCase(ViewTestCase):
         response = views.TopicDetailView.as_view()(self.request, pk=topic.pk)
         self.assertEqual(response.template_name[0], "encyclopedia/topic_detail.html")
 
+    def test_context_data_topic_fields(self):
+        "All the fields the template uses should be fetched with the Topic"
+        topic = TopicFactory()
+        response = views.TopicDetailView.as_view()(self.request, pk=topic.pk)
+        self.assertEqual(
+            response.context_data["topic"].get_deferred_fields(), {"search_document"}
+        )
+
     def test_context_data(self):
         entry_1 = EntryFactory(diary_date=make_date("1661-01-01"))
         entry_2 = EntryFactory(diary_date=make_date("1661-02-01"))
@@ -166,6 +174,25 @@ class TopicDetailViewTestCase(ViewTestCase):
                 ["1662", [["Mar", [entry_3, entry_4]]]],
             ],
         )
+        self.assertEqual(response.context_data["diary_references_count"], 4)
+
+    def test_cache_tags(self):
+        "The page should expire when the Topic, or any Category, changes"
+        view = views.TopicDetailView(kwargs={"pk": 123})
+        self.assertEqual(
+            view.get_cache_tags(), ("encyclopedia.topic:123", "encyclopedia.category")
+        )
+
+    def test_context_data_related_topics(self):
+        topic_1 = TopicFactory()
+        topic_2 = TopicFactory()
+        RelatedTopic.objects.create(
+            topic=topic_1, related_topic=topic_2, score=0.5, entry_count=3
+        )
+
+        response = views.TopicDetailView.as_view()(self.request, pk=topic_1.pk)
+
+        self.assertEqual(response.context_data["related_topics"], [topic_2])
 
 
 class CategoryMapViewTestCase(ViewTestCase):
@@ -1,10 +1,16 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from unittest.mock import patch
+from urllib.parse import parse_qs, urlparse
 
 import responses
 from django.test import TestCase
+from freezegun import freeze_time
 from requests.exceptions import ConnectionError, Timeout, TooManyRedirects
 
-from pepysdiary.encyclopedia.wikipedia_fetcher import WikipediaFetcher
+from pepysdiary.encyclopedia.wikipedia_fetcher import TokenBucket, WikipediaFetcher
 
 
 class FetchTestCase(TestCase):
@@ -74,14 +80,22 @@ class FetchTestCase(TestCase):
         self.assertEqual(result, {"success": True, "content": self.source_html})
 
     def test_it_removes_disallowed_tags(self):
-        """
-        Note: This test currently works if the BeautifulSoup parser is "lxml", which
-        will add the extra <p></p> tags. "html.parser" won't.
-        """
-        in_html = "<blink>Blinking</blink> <strong>Bold</strong>"
+        "It should remove the tags but keep their contents."
+        in_html = "<p><blink>Blinking</blink> <strong>Bold</strong></p>"
         out_html = "<p>Blinking <strong>Bold</strong></p>"
         self.assertEqual(WikipediaFetcher()._tidy_html(in_html), out_html)
 
+    def test_it_removes_disallowed_tags_before_stripping_classes(self):
+        "A disallowed tag's classes shouldn't cause its contents to be removed."
+        in_html = '<div><form class="noprint">Form <b>contents</b></form></div>'
+        out_html = "<div>Form <b>contents</b></div>"
+        self.assertEqual(WikipediaFetcher()._tidy_html(in_html), out_html)
+
+    def test_it_removes_comments(self):
+        in_html = "<div>Hello<!-- A comment --></div>"
+        out_html = "<div>Hello</div>"
+        self.assertEqual(WikipediaFetcher()._tidy_html(in_html), out_html)
+
     def test_it_removes_disallowed_attributes(self):
         in_html = '<a class="my-class" href="test.html" ' 'data-bad="My data">Link</a>'
         out_html = '<a class="my-class" href="test.html">Link</a>'
@@ -154,3 +168,318 @@ class FetchTestCase(TestCase):
         )
         out_html = "<div> </div><div>This should show up.</div>"
         self.assertEqual(WikipediaFetcher()._tidy_html(in_html), out_html)
+
+    def test_it_removes_disallowed_protocols(self):
+        in_html = (
+            "<div>"
+            '<a href="javascript:alert(1)">1</a>'
+            '<a href=" JaVaScRiPt:alert(2)">2</a>'
+            '<a href="ftp://example.com/">3</a>'
+            '<img src="data:image/png;base64,AAAA">'
+            "</div>"
+        )
+        out_html = "<div><a>1</a><a>2</a><a>3</a><img/></div>"
+        self.assertEqual(WikipediaFetcher()._tidy_html(in_html), out_html)
+
+    def test_it_keeps_allowed_protocols(self):
+        in_html = (
+            "<div>"
+            '<a href="https://example.com/">1</a>'
+            '<a href="//en.wikipedia.org/wiki/Samuel_Pepys">2</a>'
+            '<a href="#cite_note-1">3</a>'
+            '<a href="mailto:sam@example.com">4</a>'
+            "</div>"
+        )
+        self.assertEqual(WikipediaFetcher()._tidy_html(in_html), in_html)
+
+    def test_it_sanitizes_styles(self):
+        "Only the allowed CSS properties should be kept, on allowed elements."
+        in_html = (
+            "<table><tbody><tr>"
+            '<td style="padding: 2px; color: red; text-align: center">A</td>'
+            '<th style="padding: 2px">B</th>'
+            "</tr></tbody></table>"
+        )
+        out_html = (
+            "<table><tbody><tr>"
+            '<td style="padding: 2px; text-align: center;">A</td>'
+            "<th>B</th>"
+            "</tr></tbody></table>"
+        )
+        self.assertEqual(WikipediaFetcher()._tidy_html(in_html), out_html)
+
+    def test_it_tidies_a_whole_page(self):
+        with open("tests/encyclopedia/fixtures/wikipedia_render.html") as f:
+            in_html = f.read()
+        out_html = WikipediaFetcher()._tidy_html(in_html)
+        self.assertIn('<div class="mw-content-ltr mw-parser-output"', out_html)
+        self.assertIn("<b>Samuel Pepys</b>", out_html)
+        self.assertIn('<table class="infobox biography vcard table', out_html)
+        self.assertNotIn("hatnote", out_html)
+        self.assertNotIn("navbox", out_html)
+        self.assertNotIn("<script", out_html)
+        self.assertNotIn("javascript:", out_html)
+        self.assertNotIn("A comment", out_html)
+
+    def test_it_tidies_the_same_as_legacy(self):
+        """
+        The single-pass _tidy_html() should have the same output as the old
+        _tidy_html_legacy(), except for whitespace where removed comments and
+        elements were. (For HTML that isn't well-formed they can also differ
+        in how mis-nested tags, etc, are fixed.)
+        """
+        with open("tests/encyclopedia/fixtures/wikipedia_render.html") as f:
+            in_html = f.read()
+        fetcher = WikipediaFetcher()
+        self.assertEqual(
+            fetcher._tidy_html(in_html).split(),
+            fetcher._tidy_html_legacy(in_html).split(),
+        )
+
+    @responses.activate
+    def test_it_can_not_tidy(self):
+        self.add_response(body="<blink>Hello</blink>")
+        result = WikipediaFetcher().fetch(self.page_name, tidy=False)
+        self.assertEqual(result, {"success": True, "content": "<blink>Hello</blink>"})
+
+
+class TokenBucketTestCase(TestCase):
+    @freeze_time("2026-01-01 12:00:00")
+    def test_allows_burst_of_capacity(self):
+        bucket = TokenBucket(rate=2, capacity=3)
+        with patch("pepysdiary.encyclopedia.wikipedia_fetcher.time.sleep") as sleep:
+            for _ in range(3):
+                bucket.acquire()
+        sleep.assert_not_called()
+
+    def test_waits_when_empty(self):
+        with freeze_time("2026-01-01 12:00:00") as frozen_time:
+            bucket = TokenBucket(rate=2, capacity=1)
+            bucket.acquire()
+            with patch(
+                "pepysdiary.encyclopedia.wikipedia_fetcher.time.sleep",
+                side_effect=lambda seconds: frozen_time.tick(seconds),
+            ) as sleep:
+                bucket.acquire()
+            sleep.assert_called_once_with(0.5)
+
+    def test_invalid_rate(self):
+        with self.assertRaises(ValueError):
+            TokenBucket(rate=0)
+
+
+class StubWikipediaHandler(BaseHTTPRequestHandler):
+    """
+    A stand-in for Wikipedia, for StubWikipediaServerMixin.
+
+    Serves pages like Wikipedia's /wiki/<page_name>?action=render.
+    The server's `statuses` dict maps page names to lists of status codes to
+    respond with on successive requests (default: 200).
+
+    And answers MediaWiki API requests like /w/api.php?action=query
+    &prop=revisions&titles=A|B, using the server's `revision_ids` dict of
+    page title: revision ID, and `redirects` dict of title: title.
+    The server's `api_statuses` is a list of status codes to respond with
+    on successive API requests (default: 200).
+    """
+
+    def do_GET(self):  # noqa: N802
+        url = urlparse(self.path)
+        if url.path == "/w/api.php":
+            self.do_api(parse_qs(url.query))
+            return
+        page_name = url.path.removeprefix("/wiki/")
+        self.server.requests.append(page_name)
+        statuses = self.server.statuses.get(page_name, [])
+        status = statuses.pop(0) if statuses else 200
+        self.respond(status, "text/html", f"<p>{page_name}</p>")
+
+    def do_api(self, params):
+        titles = params["titles"][0].split("|")
+        self.server.api_requests.append(titles)
+        statuses = self.server.api_statuses
+        status = statuses.pop(0) if statuses else 200
+
+        query = {"normalized": [], "redirects": [], "pages": []}
+        for title in titles:
+            # Like MediaWiki, use spaces and capitalize the first letter:
+            normalized = title.replace("_", " ")
+            normalized = normalized[:1].upper() + normalized[1:]
+            if normalized != title:
+                query["normalized"].append({"from": title, "to": normalized})
+            if normalized in self.server.redirects:
+                target = self.server.redirects[normalized]
+                query["redirects"].append({"from": normalized, "to": target})
+                normalized = target
+            if normalized in self.server.revision_ids:
+                revision_id = self.server.revision_ids[normalized]
+                query["pages"].append(
+                    {"title": normalized, "revisions": [{"revid": revision_id}]}
+                )
+            else:
+                query["pages"].append({"title": normalized, "missing": True})
+
+        body = json.dumps({"batchcomplete": True, "query": query})
+        self.respond(status, "application/json", body)
+
+    def respond(self, status, content_type, body):
+        body = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubWikipediaServerMixin:
+    """
+    For TestCases that need a local stand-in for Wikipedia and its API.
+    Call start_stub_server() and then use self.base_url as a
+    WikipediaFetcher's base_url. See StubWikipediaHandler for what it does.
+    """
+
+    def start_stub_server(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubWikipediaHandler)
+        self.server.requests = []
+        self.server.statuses = {}
+        self.server.api_requests = []
+        self.server.api_statuses = []
+        self.server.revision_ids = {}
+        self.server.redirects = {}
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}"
+
+
+class StubServerFetchTestCase(StubWikipediaServerMixin, TestCase):
+    "Fetching from a local HTTP server, so that retries happen for real."
+
+    def setUp(self):
+        self.start_stub_server()
+
+    def make_fetcher(self, **kwargs):
+        return WikipediaFetcher(base_url=self.base_url, backoff_factor=0, **kwargs)
+
+    def test_fetches_page(self):
+        result = self.make_fetcher().fetch("Samuel_Pepys")
+        self.assertEqual(result, {"success": True, "content": "<p>Samuel_Pepys</p>"})
+
+    def test_sends_user_agent(self):
+        fetcher = self.make_fetcher()
+        self.assertEqual(fetcher.session.headers["User-Agent"], fetcher.user_agent)
+
+    def test_retries_server_errors(self):
+        self.server.statuses["Samuel_Pepys"] = [503, 500]
+        result = self.make_fetcher().fetch("Samuel_Pepys")
+        self.assertTrue(result["success"])
+        self.assertEqual(self.server.requests, ["Samuel_Pepys"] * 3)
+
+    def test_gives_up_after_max_retries(self):
+        self.server.statuses["Samuel_Pepys"] = [503, 503, 503]
+        result = self.make_fetcher(max_retries=2).fetch("Samuel_Pepys")
+        self.assertEqual(result, {"success": False, "content": "HTTP Error: 503"})
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_doesnt_retry_404s(self):
+        self.server.statuses["Samuel_Pepys"] = [404]
+        result = self.make_fetcher().fetch("Samuel_Pepys")
+        self.assertEqual(result, {"success": False, "content": "HTTP Error: 404"})
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_uses_rate_limiter(self):
+        bucket = TokenBucket(rate=100)
+        with patch.object(bucket, "acquire") as acquire:
+            self.make_fetcher(rate_limiter=bucket).fetch("Samuel_Pepys")
+        acquire.assert_called_once_with()
+
+    def test_shared_between_threads(self):
+        fetcher = self.make_fetcher(pool_size=4)
+        page_names = [f"Page_{i}" for i in range(20)]
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(fetcher.fetch, page_names))
+        self.assertTrue(all(result["success"] for result in results))
+        self.assertEqual(sorted(self.server.requests), sorted(page_names))
+
+
+class GetRevisionIdsTestCase(StubWikipediaServerMixin, TestCase):
+    "Getting revision IDs from a local stand-in for the MediaWiki API."
+
+    def setUp(self):
+        self.start_stub_server()
+        self.server.revision_ids = {
+            "Samuel Pepys": 101,
+            "Elisabeth Pepys": 102,
+            "Edward Montagu, 1st Earl of Sandwich": 103,
+        }
+        self.fetcher = WikipediaFetcher(base_url=self.base_url, backoff_factor=0)
+
+    def test_gets_revision_ids(self):
+        revision_ids = self.fetcher.get_revision_ids(
+            ["Samuel_Pepys", "Elisabeth_Pepys"]
+        )
+        self.assertEqual(revision_ids, {"Samuel_Pepys": 101, "Elisabeth_Pepys": 102})
+        self.assertEqual(
+            self.server.api_requests, [["Samuel Pepys", "Elisabeth Pepys"]]
+        )
+
+    def test_unquotes_page_names(self):
+        page_name = "Edward_Montagu%2C_1st_Earl_of_Sandwich"
+        self.assertEqual(self.fetcher.get_revision_ids([page_name]), {page_name: 103})
+
+    def test_normalized_titles(self):
+        self.assertEqual(
+            self.fetcher.get_revision_ids(["samuel_Pepys"]), {"samuel_Pepys": 101}
+        )
+
+    def test_follows_redirects(self):
+        self.server.redirects = {"Sam Pepys": "Samuel Pepys"}
+        revision_ids = self.fetcher.get_revision_ids(["Sam_Pepys"])
+        self.assertEqual(revision_ids, {"Sam_Pepys": 101})
+
+    def test_missing_pages(self):
+        revision_ids = self.fetcher.get_revision_ids(["Samuel_Pepys", "Nobody"])
+        self.assertEqual(revision_ids, {"Samuel_Pepys": 101})
+
+    def test_batches_requests(self):
+        self.server.revision_ids = {f"Page {i}": i for i in range(5)}
+        page_names = [f"Page_{i}" for i in range(5)]
+        with patch.object(WikipediaFetcher, "titles_per_request", 2):
+            revision_ids = self.fetcher.get_revision_ids(page_names)
+        self.assertEqual(revision_ids, dict(zip(page_names, range(5), strict=True)))
+        self.assertEqual(
+            [len(titles) for titles in self.server.api_requests], [2, 2, 1]
+        )
+
+    def test_no_duplicate_titles(self):
+        self.fetcher.get_revision_ids(["Samuel_Pepys", "Samuel_Pepys"])
+        self.assertEqual(self.server.api_requests, [["Samuel Pepys"]])
+
+    def test_retries_server_errors(self):
+        self.server.api_statuses = [503]
+        revision_ids = self.fetcher.get_revision_ids(["Samuel_Pepys"])
+        self.assertEqual(revision_ids, {"Samuel_Pepys": 101})
+        self.assertEqual(len(self.server.api_requests), 2)
+
+    def test_error(self):
+        "If a request fails, its pages are left out, and others still returned"
+        self.server.api_statuses = [404]
+        with (
+            patch.object(WikipediaFetcher, "titles_per_request", 1),
+            self.assertLogs("pepysdiary.encyclopedia.wikipedia_fetcher", "WARNING"),
+        ):
+            revision_ids = self.fetcher.get_revision_ids(
+                ["Samuel_Pepys", "Elisabeth_Pepys"]
+            )
+        self.assertEqual(revision_ids, {"Elisabeth_Pepys": 102})
+
+    def test_uses_rate_limiter(self):
+        bucket = TokenBucket(rate=100)
+        fetcher = WikipediaFetcher(base_url=self.base_url, rate_limiter=bucket)
+        with patch.object(bucket, "acquire") as acquire:
+            fetcher.get_revision_ids(["Samuel_Pepys"])
+        acquire.assert_called_once_with()
@@ -1,3 +1,5 @@
+import json
+
 from django.http.response import Http404
 from django.test import override_settings
 
@@ -5,6 +7,7 @@ from pepysdiary.common.utilities import make_date
 from pepysdiary.encyclopedia.factories import PersonTopicFactory, TopicFactory
 from pepysdiary.letters import views
 from pepysdiary.letters.factories import LetterFactory
+from pepysdiary.letters.models import Letter
 from tests import ViewTestCase, ViewTransactionTestCase
 
 
@@ -44,33 +47,19 @@ class LetterDetailViewTestCase(ViewTestCase):
         self.assertEqual(data["letter"], data["object"])
         self.assertEqual(data["letter"], letter)
 
-    def test_context_data_tooltip_references(self):
-        "The tooltip_references are sent to the template"
+    def test_context_data_tooltips_url(self):
+        "The versioned URL of the tooltips' data is sent to the template"
         letter = LetterFactory(letter_date=make_date("1661-01-02"), slug="my-letter")
-        topic_1 = TopicFactory(title="Cats", tooltip_text="About cats")
-        topic_2 = TopicFactory(title="Dogs", tooltip_text="About dogs")
-        topic_1.letter_references.add(letter)
-        topic_2.letter_references.add(letter)
+        TopicFactory().letter_references.add(letter)
 
         response = views.LetterDetailView.as_view()(
             self.request, year="1661", month="01", day="02", slug="my-letter"
         )
 
-        self.assertIn("tooltip_references", response.context_data)
+        version = Letter.objects.get_references_version([letter])
         self.assertEqual(
-            response.context_data["tooltip_references"],
-            {
-                str(topic_1.pk): {
-                    "title": "Cats",
-                    "text": "About cats",
-                    "thumbnail_url": "",
-                },
-                str(topic_2.pk): {
-                    "title": "Dogs",
-                    "text": "About dogs",
-                    "thumbnail_url": "",
-                },
-            },
+            response.context_data["tooltips_url"],
+            f"/letters/1661/01/02/my-letter/tooltips.json?v={version}",
         )
 
     def test_context_data_next_previous(self):
@@ -104,6 +93,38 @@ class LetterDetailViewTestCase(ViewTestCase):
         self.assertIsNone(data["next_letter"])
 
 
+class LetterTooltipsViewTestCase(ViewTestCase):
+    def test_response(self):
+        letter = LetterFactory(letter_date=make_date("1661-01-02"), slug="my-letter")
+        topic = TopicFactory(title="Cats", tooltip_text="About cats")
+        topic.letter_references.add(letter)
+
+        response = views.LetterTooltipsView.as_view()(
+            self.request, year="1661", month="01", day="02", slug="my-letter"
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            json.loads(response.content),
+            {
+                str(topic.pk): {
+                    "title": "Cats",
+                    "text": "About cats",
+                    "thumbnail_url": "",
+                }
+            },
+        )
+        version = Letter.objects.get_references_version([letter])
+        self.assertEqual(response["ETag"], f'"{version}"')
+
+    def test_response_404_no_letter(self):
+        LetterFactory(letter_date=make_date("1661-01-02"), slug="my-letter")
+        with self.assertRaises(Http404):
+            views.LetterTooltipsView.as_view()(
+                self.request, year="1661", month="01", day="02", slug="nope"
+            )
+
+
 class LetterPersonViewTestCase(ViewTransactionTestCase):
     def test_response_200(self):
         person = PersonTopicFactory()